@@ -24,34 +24,1427 @@ __copyright__ = "Copyright (C) 2022 Koviubi56"
 __description__ = "Black Cat DataBase is a simple database."
 __url__ = "https://github.com/koviubi56/bcdb"
 
+import array
+import asyncio
+import bisect
+import collections
+import concurrent.futures
 import contextlib
 import dataclasses
 import enum
 import functools
+import heapq
+import itertools
+import json
+import mmap
+import operator
+import os
 import pathlib
+import shutil
 import string as stringlib
+import struct
+import tempfile
 import threading
-from typing import Any, Callable, Collection, Iterable
+import time
+import zlib
+from typing import (
+    Any,
+    AsyncIterator,
+    BinaryIO,
+    Callable,
+    Collection,
+    Iterable,
+    Iterator,
+    Sequence,
+)
 
 from typing_extensions import Self, TypeAlias
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # Windows
+    fcntl = None  # type: ignore[assignment]
+
 if not __debug__:
     raise Exception("BCDB cannot be used with the -O flag")
 
-Where: TypeAlias = Callable[[tuple[Any, ...]], bool]
+Where: TypeAlias = "Callable[[tuple[Any, ...]], bool] | Condition"
+
+
+def unique(iterable: Collection[Any]) -> bool:
+    # v probably slower but should work
+    # // seen: list[Any] = []
+    # // for obj in iterable:
+    # //     if obj in iterable:
+    # //         return False
+    # //     seen.append(obj)
+    # // return True
+
+    # * probably faster
+    return len(iterable) == len(set(iterable))
+
+
+# Writes made by this process bump the generation of the file, so a cached
+# value is never reused after a write even if the file's mtime didn't change
+# (the mtime's resolution is coarser than a write).
+_generations: dict[pathlib.Path, int] = {}
+_generations_lock = threading.Lock()
+
+
+def _file_signature(file: pathlib.Path) -> tuple[int, int, int, int]:
+    """
+    Get the signature of `file`. If the signature changed, the file changed.
+
+    Args:
+        file (pathlib.Path): The file. Must be resolved.
+
+    Returns:
+        tuple[int, int, int, int]: The inode, size, mtime (in nanoseconds) and
+        the generation of the file.
+    """
+    stat = file.stat()
+    return (
+        stat.st_ino,
+        stat.st_size,
+        stat.st_mtime_ns,
+        _generations.get(file, 0),
+    )
+
+
+def _mark_written(file: pathlib.Path) -> None:
+    """
+    Record that this process wrote to `file`, which invalidates every cached
+    value that was computed from it.
+
+    Args:
+        file (pathlib.Path): The file. Must be resolved.
+    """
+    with _generations_lock:
+        _generations[file] = _generations.get(file, 0) + 1
+    row_cache.invalidate(file)
+
+
+def _table_signature(file: pathlib.Path) -> tuple[int, ...]:
+    # Internal function, returns the signature of the table file and the size
+    # of its tombstone log (the log is append-only, so it changed if its size
+    # changed). `file` must be resolved.
+    try:
+        dead = file.with_name(f"{file.name}.tombstones").stat().st_size
+    except FileNotFoundError:
+        dead = 0
+    return (*_file_signature(file), dead)
+
+
+@dataclasses.dataclass
+class RowCache:
+    """
+    A least recently used cache of the parsed rows of the tables. Entries are
+    only used while the table file's signature (inode, size, mtime) is
+    unchanged, and are dropped when this process writes to the table.
+
+    The size of an entry is approximated by the size of its table file.
+
+    Args:
+        max_tables (int, optional): The maximum number of tables to cache.
+        Defaults to 64.
+        max_bytes (int, optional): The maximum total size of the cached
+        tables. Tables bigger than this are never cached. Defaults to 64 MiB.
+    """
+
+    max_tables: int = 64
+    max_bytes: int = 64 * 1024 * 1024
+
+    _entries: collections.OrderedDict[
+        pathlib.Path, tuple[tuple[int, ...], int, tuple[tuple[Any, ...], ...]]
+    ] = dataclasses.field(
+        default_factory=collections.OrderedDict, init=False, repr=False
+    )
+    _size: int = dataclasses.field(default=0, init=False, repr=False)
+    _lock: Any = dataclasses.field(
+        default_factory=threading.Lock, init=False, repr=False, compare=False
+    )
+
+    @property
+    def size(self) -> int:
+        """
+        The total size of the cached tables.
+
+        Returns:
+            int: The total size of the cached tables in bytes.
+        """
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(
+        self, file: pathlib.Path, signature: tuple[int, ...]
+    ) -> tuple[tuple[Any, ...], ...] | None:
+        """
+        Get the cached rows of the table file `file`.
+
+        Args:
+            file (pathlib.Path): The table file. Must be resolved.
+            signature (tuple[int, ...]): The current signature of the file.
+
+        Returns:
+            tuple[tuple[Any, ...], ...] | None: The rows, or None if they
+            aren't cached or the cached rows are outdated.
+        """
+        with self._lock:
+            entry = self._entries.get(file)
+            if entry is None:
+                return None
+            if entry[0] != signature:
+                self._pop(file)
+                return None
+            self._entries.move_to_end(file)
+            return entry[2]
+
+    def put(
+        self,
+        file: pathlib.Path,
+        signature: tuple[int, ...],
+        rows: tuple[tuple[Any, ...], ...],
+        size: int,
+    ) -> None:
+        """
+        Cache the rows of the table file `file`, and evict the least recently
+        used tables if a limit is exceeded.
+
+        Args:
+            file (pathlib.Path): The table file. Must be resolved.
+            signature (tuple[int, ...]): The signature of the file that the
+            rows were read from.
+            rows (tuple[tuple[Any, ...], ...]): The rows.
+            size (int): The size of the entry in bytes.
+        """
+        with self._lock:
+            self._pop(file)
+            if (size > self.max_bytes) or (self.max_tables < 1):
+                return
+            self._entries[file] = (signature, size, rows)
+            self._size += size
+            while (len(self._entries) > self.max_tables) or (
+                self._size > self.max_bytes
+            ):
+                self._pop(next(iter(self._entries)))
+
+    def invalidate(self, file: pathlib.Path) -> None:
+        """
+        Drop the cached rows of the table file `file` (if any).
+
+        Args:
+            file (pathlib.Path): The table file. Must be resolved.
+        """
+        with self._lock:
+            self._pop(file)
+
+    def clear(self) -> None:
+        """Drop all cached rows."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _pop(self, file: pathlib.Path) -> None:
+        # Internal function, the lock must be held.
+        entry = self._entries.pop(file, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+
+row_cache = RowCache()
+
+# The values of the attributes referenced by `from_`, keyed by the table file
+# and the attribute's name. They are used while the table's signature is
+# unchanged, and the least recently used ones are dropped.
+_referenced: collections.OrderedDict[
+    tuple[pathlib.Path, str], tuple[tuple[int, ...], frozenset[Any]]
+] = collections.OrderedDict()
+_referenced_lock = threading.Lock()
+_MAX_REFERENCED = 64
+
+# The number of rows that are parsed at once (while the table file is mapped)
+# when a table file is read row by row.
+_SCAN_BATCH_SIZE = 1024
+
+
+@contextlib.contextmanager
+def _map_file(
+    file: BinaryIO, size: int
+) -> Iterator[tuple["mmap.mmap | bytes", memoryview]]:
+    # Internal function, memory-maps (read-only) the first `size` bytes of
+    # `file` (or less, if the file is smaller), and yields the map and a
+    # memoryview of it.
+    size = min(size, os.fstat(file.fileno()).st_size)
+    if not size:
+        # empty files cannot be mapped
+        yield b"", memoryview(b"")
+        return
+    mapped = mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    try:
+        yield mapped, view
+    finally:
+        view.release()
+        # if a slice is still referenced (by a traceback), the map is closed
+        # when it's garbage collected
+        with contextlib.suppress(BufferError):
+            mapped.close()
+
+
+def _header_end(buffer: "mmap.mmap | bytes") -> int:
+    # Internal function, returns the offset of the first row (after the
+    # BCDB... line).
+    position = buffer.find(b"\n")
+    return len(buffer) if position == -1 else position + 1
+
+
+_COMPARISONS: dict[str, Callable[[Any, Any], bool]] = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class Condition:
+    """
+    A condition on the rows of a table, built with `Q`, e.g.
+    `(Q("age") > 30) & Q("name").startswith("a")`. Conditions can be combined
+    with `&` (and), `|` (or) and `~` (not). The comparisons must be in
+    parentheses, because `&` and `|` bind tighter than them.
+
+    A condition can be used wherever a `Where` function can. Unlike a
+    function, the table can see what it checks, so it can look the rows up
+    in an index, or only convert the columns that the condition needs (see
+    `Table.filter`).
+
+    Args:
+        op (str): "==", "!=", "<", "<=", ">", ">=", "startswith", "in" or
+        "between" (then `operands` are the attribute's name and the value),
+        or "and", "or" or "not" (then `operands` are conditions).
+        operands (tuple[Any, ...]): The operands.
+    """
+
+    op: str
+    operands: tuple[Any, ...]
+
+    def __and__(self, other: "Condition") -> "Condition":
+        return Condition("and", (self, other))
+
+    def __or__(self, other: "Condition") -> "Condition":
+        return Condition("or", (self, other))
+
+    def __invert__(self) -> "Condition":
+        return Condition("not", (self,))
+
+    def __bool__(self) -> bool:
+        raise TypeError(
+            "a Condition doesn't have a truth value, use &, | and ~ instead"
+            " of and, or and not"
+        )
+
+    def _attributes(self) -> set[str]:
+        # Internal function, returns the names of the attributes that the
+        # condition checks.
+        if self.op in ("and", "or", "not"):
+            return set().union(
+                *(operand._attributes() for operand in self.operands)
+            )
+        return {self.operands[0]}
+
+    def _conjuncts(self) -> Iterator["Condition"]:
+        # Internal function, yields the conditions that must all be true.
+        if self.op == "and":
+            for operand in self.operands:
+                yield from operand._conjuncts()
+        else:
+            yield self
+
+    def _bind(self, positions: dict[str, int]) -> "_Predicate":
+        # Internal function, returns the condition with the attribute names
+        # replaced by the positions of their columns in the rows.
+        if self.op in ("and", "or", "not"):
+            return _Predicate(
+                self.op,
+                tuple(operand._bind(positions) for operand in self.operands),
+            )
+        name, value = self.operands
+        assert (
+            name in positions
+        ), f"invalid attribute with name {name}: doesn't exist"
+        return _Predicate(self.op, (positions[name], value))
+
+
+@dataclasses.dataclass(frozen=True)
+class _Predicate:
+    # Internal class, a condition whose attributes are replaced by the
+    # positions of their columns (see `Condition._bind`). It's called with a
+    # row, like a `Where` function, and it can be pickled.
+    op: str
+    operands: tuple[Any, ...]
+
+    def __call__(self, row: tuple[Any, ...]) -> bool:
+        if self.op == "and":
+            return all(operand(row) for operand in self.operands)
+        if self.op == "or":
+            return any(operand(row) for operand in self.operands)
+        if self.op == "not":
+            return not self.operands[0](row)
+        position, value = self.operands
+        column = row[position]
+        if self.op == "startswith":
+            return isinstance(column, str) and column.startswith(value)
+        if self.op == "in":
+            return column in value
+        if self.op == "between":
+            return value[0] <= column <= value[1]
+        return _COMPARISONS[self.op](column, value)
+
+
+class Q:
+    """
+    An attribute (column) in a condition: comparing it (`==`, `!=`, `<`,
+    `<=`, `>`, `>=`) or calling its methods returns a `Condition`.
+
+    Args:
+        attribute_name (str): The attribute's name.
+    """
+
+    def __init__(self, attribute_name: str) -> None:
+        self.attribute_name = attribute_name
+
+    def __repr__(self) -> str:
+        return f"Q({self.attribute_name!r})"
+
+    def _compare(self, op: str, value: Any) -> Condition:
+        # Internal function, returns the comparison with `value`.
+        return Condition(op, (self.attribute_name, value))
+
+    def __eq__(self, value: object) -> Condition:  # type: ignore[override]
+        return self._compare("==", value)
+
+    def __ne__(self, value: object) -> Condition:  # type: ignore[override]
+        return self._compare("!=", value)
+
+    def __lt__(self, value: Any) -> Condition:
+        return self._compare("<", value)
+
+    def __le__(self, value: Any) -> Condition:
+        return self._compare("<=", value)
+
+    def __gt__(self, value: Any) -> Condition:
+        return self._compare(">", value)
+
+    def __ge__(self, value: Any) -> Condition:
+        return self._compare(">=", value)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def startswith(self, prefix: str) -> Condition:
+        """
+        The attribute (a STRING) starts with `prefix`.
+
+        Args:
+            prefix (str): The prefix.
+
+        Returns:
+            Condition: The condition.
+        """
+        return self._compare("startswith", prefix)
+
+    def isin(self, values: Iterable[Any]) -> Condition:
+        """
+        The attribute is one of `values`.
+
+        Args:
+            values (Iterable[Any]): The values.
+
+        Returns:
+            Condition: The condition.
+        """
+        return self._compare("in", frozenset(values))
+
+    def between(self, low: Any, high: Any) -> Condition:
+        """
+        The attribute is between `low` and `high` (inclusive).
+
+        Args:
+            low (Any): The lower bound.
+            high (Any): The upper bound.
+
+        Returns:
+            Condition: The condition.
+        """
+        return self._compare("between", (low, high))
+
+
+@dataclasses.dataclass
+class _Plan:
+    # Internal class, how the rows where a condition is true are found (see
+    # `Table._plan`): the rows with `values` (or the values in the inclusive
+    # range `bounds`, where None is unbounded) are looked up in the index of
+    # `attribute`, or the table is scanned if `attribute` is None.
+    attribute: str | None = None
+    values: frozenset[Any] | None = None
+    bounds: tuple[Any, Any] | None = None
+
+
+class AccessPath(enum.StrEnum):
+    """StrEnum for how the rows of a query are found (see `Table.explain`)."""
+
+    INDEX = "index"
+    # looked up in the index of an attribute
+    CACHE = "cache"
+    # taken from the row cache
+    SCAN = "scan"
+    # parsed from the table file
+    PARALLEL_SCAN = "parallel scan"
+    # parsed from the table file by a pool of processes
+
+
+_PHASES = ("io", "split", "convert", "predicate")
+
+
+@dataclasses.dataclass
+class QueryPlan:
+    """
+    How a query was run, returned by `Table.explain`.
+
+    Args:
+        access_path (AccessPath): How the rows were found.
+        attribute (str | None, optional): The attribute whose index was used.
+        Defaults to None.
+        estimated_rows (int | None, optional): The number of rows that were
+        expected to be examined before they were read, or None if it wasn't
+        known. Defaults to None.
+        rows_examined (int, optional): The number of rows that were read (or
+        taken from the cache) and checked. Defaults to 0.
+        rows_returned (int, optional): The number of rows where the query was
+        true. Defaults to 0.
+        bytes_read (int, optional): The number of bytes of the table file that
+        were read. Defaults to 0.
+        timings (dict[str, float], optional): The seconds spent in each phase:
+        "io" (opening and mapping the table file, and reading the records
+        found with an index; the pages of a memory-mapped file are read when
+        they are first touched, which is mostly while splitting), "split"
+        (finding the records in the file), "convert" (converting the columns)
+        and "predicate" (checking the query). The processes of a parallel scan
+        do all of them at once, their time is "convert". Defaults to zeros.
+        elapsed (float, optional): The seconds the whole query took. Defaults
+        to 0.0.
+    """
+
+    access_path: AccessPath
+    attribute: str | None = None
+    estimated_rows: int | None = None
+    rows_examined: int = 0
+    rows_returned: int = 0
+    bytes_read: int = 0
+    timings: dict[str, float] = dataclasses.field(
+        default_factory=lambda: dict.fromkeys(_PHASES, 0.0)
+    )
+    elapsed: float = 0.0
+
+    def _timed(self, phase: str, func: Callable[..., Any]) -> Any:
+        # Internal function, returns `func` that adds the time spent in it to
+        # `phase`.
+        timings = self.timings
+
+        def _func(*args: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                timings[phase] += time.perf_counter() - start
+
+        return _func
+
+    def _timed_iter(
+        self, phase: str, iterable: Iterable[Any]
+    ) -> Iterator[Any]:
+        # Internal function, yields the items of `iterable`, and adds the time
+        # spent getting them to `phase`.
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.timings[phase] += time.perf_counter() - start
+            yield item
+
+    @contextlib.contextmanager
+    def _map_file(
+        self, file: BinaryIO, size: int
+    ) -> Iterator[tuple["mmap.mmap | bytes", memoryview]]:
+        # Internal function, `_map_file` that adds the time spent mapping the
+        # file to "io", and the mapped bytes to `bytes_read`.
+        start = time.perf_counter()
+        with _map_file(file, size) as (mapped, view):
+            self.timings["io"] += time.perf_counter() - start
+            self.bytes_read += len(mapped)
+            yield mapped, view
+
+
+class Aggregate(enum.StrEnum):
+    """StrEnum for the aggregates of `Table.aggregate` and `Table.group_by`."""
+
+    COUNT = "count"
+    # the number of rows (the attribute can be None)
+    SUM = "sum"
+    # the sum of an INTEGER or FLOAT attribute, 0 if there are no rows
+    MIN = "min"
+    # the smallest value (NaN is ignored), None if there are no rows
+    MAX = "max"
+    # the largest value (NaN is ignored), None if there are no rows
+    AVG = "avg"
+    # the mean of an INTEGER or FLOAT attribute, None if there are no rows
+
+
+class _Accumulator:
+    # Internal class, computes an aggregate (see `Aggregate`) of the values
+    # that are added one by one.
+    __slots__ = ("function", "count", "value")
+
+    def __init__(self, function: Aggregate) -> None:
+        self.function = function
+        self.count = 0
+        self.value: Any = (
+            0 if function in (Aggregate.SUM, Aggregate.AVG) else None
+        )
+
+    def add(self, value: Any) -> None:
+        self.count += 1
+        if self.function in (Aggregate.SUM, Aggregate.AVG):
+            self.value += value
+        elif (self.function == Aggregate.MIN) and (value == value):
+            if (self.value is None) or (value < self.value):
+                self.value = value
+        elif (self.function == Aggregate.MAX) and (value == value):
+            if (self.value is None) or (value > self.value):
+                self.value = value
+
+    def result(self) -> Any:
+        if self.function == Aggregate.COUNT:
+            return self.count
+        if self.function == Aggregate.AVG:
+            return (self.value / self.count) if self.count else None
+        return self.value
+
+
+@dataclasses.dataclass
+class HashIndex:
+    """
+    An index that maps the values of a column to the numbers of the rows that
+    have that value. Row numbers start from 0 (which is the row after the
+    `BCDB ...` line).
+
+    Args:
+        attribute (str): The name of the indexed attribute.
+        column (int): The index of the indexed column.
+    """
+
+    attribute: str
+    column: int
+    entries: dict[Any, list[int]] = dataclasses.field(
+        default_factory=dict, repr=False
+    )
+
+    def add(self, rownum: int, row: tuple[Any, ...]) -> None:
+        """
+        Add a row to the index.
+
+        Args:
+            rownum (int): The number of the row.
+            row (tuple[Any, ...]): The row.
+        """
+        self.entries.setdefault(row[self.column], []).append(rownum)
+
+    def build(self, rows: Iterable[tuple[Any, ...]]) -> None:
+        """
+        Replace the contents of the index with `rows`.
+
+        Args:
+            rows (Iterable[tuple[Any, ...]]): All rows of the table.
+        """
+        self.entries = {}
+        for rownum, row in enumerate(rows):
+            self.add(rownum, row)
+
+    def remove(self, rownums: list[int]) -> None:
+        """
+        Remove rows from the index. The numbers of the rows after them are
+        decreased.
+
+        Args:
+            rownums (list[int]): The numbers of the rows in ascending order.
+        """
+        removed = set(rownums)
+        for value, entries in list(self.entries.items()):
+            kept = [
+                rownum - bisect.bisect_left(rownums, rownum)
+                for rownum in entries
+                if rownum not in removed
+            ]
+            if kept:
+                self.entries[value] = kept
+            else:
+                del self.entries[value]
+
+    def get(self, value: Any) -> list[int]:
+        """
+        Get the numbers of the rows that have `value` in the indexed column.
+
+        Args:
+            value (Any): The value to look for.
+
+        Returns:
+            list[int]: The row numbers in ascending order. Empty if no rows
+            have `value`.
+        """
+        return self.entries.get(value, [])
+
+    def clear(self) -> None:
+        """Remove all rows from the index."""
+        self.entries.clear()
+
+    def dump(self) -> Any:
+        """
+        Convert the index to a JSON serializable object.
+
+        Returns:
+            Any: The JSON serializable object, see `load`.
+        """
+        return list(self.entries.items())
+
+    def load(self, data: Any) -> None:
+        """
+        Replace the contents of the index with the object got from `dump`.
+
+        Args:
+            data (Any): The object got from `dump`.
+        """
+        self.entries = {value: rownums for value, rownums in data}
+
+
+def _is_nan(value: Any) -> bool:
+    # Internal function, returns whether `value` is NaN. INTEGERs can't be
+    # NaN (and can be too big to be converted to a float).
+    return isinstance(value, float) and (value != value)
+
+
+@dataclasses.dataclass
+class SortedIndex:
+    """
+    An index that keeps the values of a column in order, so the rows can be
+    looked up by a range of values, and the smallest or largest values can be
+    found without reading the table. Only INTEGER and FLOAT attributes can
+    have a sorted index. NaN values aren't indexed, because they aren't equal
+    to (or less or greater than) anything.
+
+    Args:
+        attribute (str): The name of the indexed attribute.
+        column (int): The index of the indexed column.
+    """
+
+    attribute: str
+    column: int
+    keys: list[Any] = dataclasses.field(default_factory=list, repr=False)
+    rownums: list[int] = dataclasses.field(default_factory=list, repr=False)
+
+    def add(self, rownum: int, row: tuple[Any, ...]) -> None:
+        """
+        Add a row to the index.
+
+        Args:
+            rownum (int): The number of the row. Must be greater than the
+            numbers of the rows already in the index.
+            row (tuple[Any, ...]): The row.
+        """
+        value = row[self.column]
+        if _is_nan(value):
+            return
+        idx = bisect.bisect_right(self.keys, value)
+        self.keys.insert(idx, value)
+        self.rownums.insert(idx, rownum)
+
+    def build(self, rows: Iterable[tuple[Any, ...]]) -> None:
+        """
+        Replace the contents of the index with `rows`.
+
+        Args:
+            rows (Iterable[tuple[Any, ...]]): All rows of the table.
+        """
+        pairs = sorted(
+            (row[self.column], rownum)
+            for rownum, row in enumerate(rows)
+            if not _is_nan(row[self.column])
+        )
+        self.keys = [value for value, _ in pairs]
+        self.rownums = [rownum for _, rownum in pairs]
+
+    def remove(self, rownums: list[int]) -> None:
+        """
+        Remove rows from the index. The numbers of the rows after them are
+        decreased.
+
+        Args:
+            rownums (list[int]): The numbers of the rows in ascending order.
+        """
+        removed = set(rownums)
+        pairs = [
+            (value, rownum - bisect.bisect_left(rownums, rownum))
+            for value, rownum in zip(self.keys, self.rownums)
+            if rownum not in removed
+        ]
+        self.keys = [value for value, _ in pairs]
+        self.rownums = [rownum for _, rownum in pairs]
+
+    def get(self, value: Any) -> list[int]:
+        """
+        Get the numbers of the rows that have `value` in the indexed column.
+
+        Args:
+            value (Any): The value to look for.
+
+        Returns:
+            list[int]: The row numbers in ascending order. Empty if no rows
+            have `value`.
+        """
+        return self.between(value, value)
+
+    def between(self, low: Any, high: Any) -> list[int]:
+        """
+        Get the numbers of the rows whose value in the indexed column is
+        between `low` and `high` (inclusive).
+
+        Args:
+            low (Any): The lower bound, or None for no lower bound.
+            high (Any): The upper bound, or None for no upper bound.
+
+        Returns:
+            list[int]: The row numbers ordered by their values. Rows with equal
+            values are in ascending order.
+        """
+        try:
+            start = 0 if low is None else bisect.bisect_left(self.keys, low)
+            end = (
+                len(self.keys)
+                if high is None
+                else bisect.bisect_right(self.keys, high)
+            )
+        except TypeError:
+            # not comparable with the values, so it can't be equal to them
+            return []
+        return self.rownums[start:end]
+
+    def first(self, count: int) -> list[int]:
+        """
+        Get the numbers of the `count` rows with the smallest values.
+
+        Args:
+            count (int): The maximum number of rows to return.
+
+        Returns:
+            list[int]: The row numbers ordered by their values. Rows with equal
+            values are in ascending order.
+        """
+        return self.rownums[: max(count, 0)]
+
+    def last(self, count: int) -> list[int]:
+        """
+        Get the numbers of the `count` rows with the largest values.
+
+        Args:
+            count (int): The maximum number of rows to return.
+
+        Returns:
+            list[int]: The row numbers ordered by their values in descending
+            order. Rows with equal values are in ascending order.
+        """
+        rv: list[int] = []
+        end = len(self.keys)
+        while (end > 0) and (len(rv) < count):
+            start = bisect.bisect_left(self.keys, self.keys[end - 1], 0, end)
+            rv.extend(self.rownums[start:end])
+            end = start
+        return rv[: max(count, 0)]
+
+    def clear(self) -> None:
+        """Remove all rows from the index."""
+        self.keys.clear()
+        self.rownums.clear()
+
+    def dump(self) -> Any:
+        """
+        Convert the index to a JSON serializable object.
+
+        Returns:
+            Any: The JSON serializable object, see `load`.
+        """
+        return [self.keys, self.rownums]
+
+    def load(self, data: Any) -> None:
+        """
+        Replace the contents of the index with the object got from `dump`.
+
+        Args:
+            data (Any): The object got from `dump`.
+        """
+        self.keys, self.rownums = data
+
+
+@dataclasses.dataclass
+class _TableState:
+    # Internal class, the values derived from a table file that are kept up to
+    # date by the writes. They are valid while the table file's signature is
+    # `signature`.
+    signature: tuple[int, ...] | None = None
+    offsets: "array.array[int]" = dataclasses.field(
+        default_factory=lambda: array.array("q")
+    )
+    indexes: dict[str, HashIndex | SortedIndex] = dataclasses.field(
+        default_factory=dict
+    )
+    # the readers of a table share its lock, so they use this to read and
+    # update the state
+    mutex: Any = dataclasses.field(
+        default_factory=threading.RLock, repr=False, compare=False
+    )
+    # the group commits of the write-ahead log (see Table._group_commit)
+    commits: threading.Condition = dataclasses.field(
+        default_factory=threading.Condition, repr=False, compare=False
+    )
+    pending: list["_Commit"] = dataclasses.field(
+        default_factory=list, repr=False
+    )
+    committing: bool = False
+    # whether the write-ahead log may have entries, and when it was synced
+    logged: bool = False
+    synced: float = 0.0
+    # the timer that checkpoints the write-ahead log when the sync interval
+    # ends if the commits weren't synced (see FsyncPolicy.INTERVAL)
+    flush: threading.Timer | None = dataclasses.field(
+        default=None, repr=False, compare=False
+    )
+    # whether the write-ahead log was replayed (or there was nothing to replay)
+    recovered: bool = False
+    # the number of live rows, and of the removed rows that are still in the
+    # table file (see Table.tombstones), valid while the table file's
+    # signature is `counted` (which is kept up to date by the writes even if
+    # the offsets and the indexes aren't loaded)
+    counted: tuple[int, ...] | None = None
+    live: int = 0
+    dead: int = 0
+
+    def reset(self, signature: tuple[int, ...] | None) -> None:
+        self.signature = signature
+        self.offsets = array.array("q")
+        for index in self.indexes.values():
+            index.clear()
+
+    def load(
+        self,
+        signature: tuple[int, ...],
+        offsets: "array.array[int]",
+        rows: list[tuple[Any, ...]],
+    ) -> None:
+        self.signature = signature
+        self.offsets = offsets
+        for index in self.indexes.values():
+            index.build(rows)
+
+    def set_counts(
+        self, signature: tuple[int, ...], live: int, dead: int
+    ) -> None:
+        self.counted = signature
+        self.live = live
+        self.dead = dead
+
+    def remove(self, rownums: list[int]) -> None:
+        removed = set(rownums)
+        self.offsets = array.array(
+            "q",
+            (
+                offset
+                for rownum, offset in enumerate(self.offsets)
+                if rownum not in removed
+            ),
+        )
+        for index in self.indexes.values():
+            index.remove(rownums)
+
+    def add(self, offset: int, row: tuple[Any, ...]) -> None:
+        rownum = len(self.offsets)
+        self.offsets.append(offset)
+        for index in self.indexes.values():
+            index.add(rownum, row)
+
+
+class RWLock:
+    """
+    A reentrant reader-writer lock: any number of threads can hold it for
+    reading at once, but only one thread can hold it for writing. Writers are
+    preferred: while a writer is waiting, new readers wait too, so the writers
+    aren't starved.
+
+    Using it like a `threading.RLock` (`with lock:`, `acquire`, `release`)
+    acquires it for writing, `read()` acquires it for reading. The thread that
+    holds it for writing can acquire it for reading too, but a thread that
+    only holds it for reading can't acquire it for writing.
+
+    After `use_file` the lock also locks a file with `fcntl.flock` (shared
+    while it's held for reading, exclusive while it's held for writing), so
+    it excludes the other processes too.
+    """
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition(threading.Lock())
+        self._readers: dict[int, int] = {}
+        self._writer: int | None = None
+        self._writes = 0
+        self._waiting_writers = 0
+        # the file lock, see use_file
+        self._descriptor: int | None = None
+        self._file_mutex = threading.Lock()
+        self._file_readers: set[int] = set()
+        self._file_exclusive = False
+
+    def use_file(self, file: pathlib.Path) -> None:
+        """
+        Lock `file` (it's created if it doesn't exist) too, so the processes
+        that use the same file exclude each other. The locks are advisory, so
+        they only exclude the processes that use them.
+
+        Args:
+            file (pathlib.Path): The lock file.
+
+        Raises:
+            AssertionError: if `fcntl` isn't available (on Windows)
+        """
+        assert fcntl is not None, (
+            "invalid lock: file locks require fcntl, which isn't available on"
+            " this platform"
+        )
+        if self._descriptor is not None:
+            return
+        # no one holds the lock while the file is opened
+        with self:
+            if self._descriptor is None:
+                self._descriptor = os.open(file, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        """
+        Acquire the lock for writing. The timeout doesn't apply to the file
+        lock (see `use_file`).
+
+        Args:
+            blocking (bool, optional): Wait for the lock. Defaults to True.
+            timeout (float, optional): The maximum number of seconds to wait,
+            -1 means forever. Defaults to -1.
+
+        Raises:
+            RuntimeError: if the thread holds the lock for reading (but not
+            for writing)
+
+        Returns:
+            bool: True if the lock was acquired, False otherwise.
+        """
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer == me:
+                self._writes += 1
+                return True
+            if me in self._readers:
+                raise RuntimeError(
+                    "cannot acquire the lock for writing while holding it for"
+                    " reading"
+                )
+            self._waiting_writers += 1
+            try:
+                acquired = self._condition.wait_for(
+                    lambda: (self._writer is None) and (not self._readers),
+                    (None if timeout < 0 else timeout) if blocking else 0,
+                )
+            finally:
+                self._waiting_writers -= 1
+            if not acquired:
+                # the readers that waited for this writer
+                self._condition.notify_all()
+                return False
+            self._writer = me
+            self._writes = 1
+        if self._descriptor is not None:
+            # the other threads wait for this writer while it waits for the
+            # other processes
+            try:
+                assert fcntl is not None
+                fcntl.flock(
+                    self._descriptor,
+                    (
+                        fcntl.LOCK_EX
+                        if blocking
+                        else fcntl.LOCK_EX | fcntl.LOCK_NB
+                    ),
+                )
+            except BlockingIOError:
+                self.release()
+                return False
+            except BaseException:
+                self.release()
+                raise
+            self._file_exclusive = True
+        return True
+
+    def release(self) -> None:
+        """
+        Release the lock that was acquired for writing.
+
+        Raises:
+            RuntimeError: if the thread doesn't hold the lock for writing
+        """
+        with self._condition:
+            if self._writer != threading.get_ident():
+                raise RuntimeError("cannot release un-acquired lock")
+            self._writes -= 1
+            if self._writes:
+                return
+            if self._file_exclusive:
+                assert (fcntl is not None) and (self._descriptor is not None)
+                if self._writer in self._readers:
+                    # still reading: downgrade the file lock
+                    fcntl.flock(self._descriptor, fcntl.LOCK_SH)
+                    self._file_readers.add(self._writer)
+                else:
+                    fcntl.flock(self._descriptor, fcntl.LOCK_UN)
+                self._file_exclusive = False
+            self._writer = None
+            self._condition.notify_all()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *_: object) -> None:
+        self.release()
+
+    def acquire_read(self) -> None:
+        """Acquire the lock for reading."""
+        me = threading.get_ident()
+        with self._condition:
+            outermost = (self._writer != me) and (me not in self._readers)
+            if outermost:
+                self._condition.wait_for(
+                    lambda: (self._writer is None)
+                    and (not self._waiting_writers)
+                )
+            self._readers[me] = self._readers.get(me, 0) + 1
+        if outermost and (self._descriptor is not None):
+            try:
+                with self._file_mutex:
+                    if not self._file_readers:
+                        assert fcntl is not None
+                        fcntl.flock(self._descriptor, fcntl.LOCK_SH)
+                    self._file_readers.add(me)
+            except BaseException:
+                self.release_read()
+                raise
+
+    def release_read(self) -> None:
+        """
+        Release the lock that was acquired for reading.
+
+        Raises:
+            RuntimeError: if the thread doesn't hold the lock for reading
+        """
+        me = threading.get_ident()
+        with self._condition:
+            if me not in self._readers:
+                raise RuntimeError("cannot release un-acquired lock")
+            last = self._readers[me] == 1
+        if last and (me in self._file_readers):
+            # before the other threads can acquire the lock for writing
+            with self._file_mutex:
+                self._file_readers.discard(me)
+                if not self._file_readers:
+                    assert (fcntl is not None) and (
+                        self._descriptor is not None
+                    )
+                    fcntl.flock(self._descriptor, fcntl.LOCK_UN)
+        with self._condition:
+            self._readers[me] -= 1
+            if not self._readers[me]:
+                del self._readers[me]
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def read(self) -> Iterator[None]:
+        """
+        Acquire the lock for reading in a with statement.
+
+        Yields:
+            None: The lock is held for reading in the with statement.
+        """
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+
+class _cached_property(functools.cached_property):  # noqa: N801
+    # Internal class, functools.cached_property without its lock. The lock is
+    # shared by every instance (Python 3.12 removed it), so a thread that
+    # computes a value while it waits for a table's lock would block the
+    # threads that access the property on other tables (or that hold the
+    # table's lock).
+    def __get__(self, instance: Any, owner: type | None = None) -> Any:
+        if instance is None:
+            return self
+        assert self.attrname is not None
+        try:
+            return instance.__dict__[self.attrname]
+        except KeyError:
+            value = instance.__dict__[self.attrname] = self.func(instance)
+            return value
+
+
+# The locks and the states of the table files, keyed by their resolved paths,
+# so every Table of a table file (in this process) shares them.
+_shared: dict[pathlib.Path, tuple[Any, _TableState]] = {}
+_shared_lock = threading.Lock()
+
+
+def _get_shared(file: pathlib.Path) -> tuple[Any, _TableState]:
+    # Internal function, returns the shared lock and state of the table file.
+    # `file` must be resolved.
+    with _shared_lock:
+        if file not in _shared:
+            _shared[file] = (RWLock(), _TableState())
+        return _shared[file]
+
 
+# The tombstone log starts with the inode of the table file it belongs to,
+# which is followed by the offsets of the dead rows.
+_TOMBSTONE = struct.Struct("<q")
+# The write-ahead log starts with the inode of the table file (like the
+# tombstone log), and then the entries: the offset where the records were
+# appended to the table file, the size and the CRC-32 of the records, and the
+# records.
+_WAL_ENTRY = struct.Struct("<qII")
+_WAL_CHECKPOINT_SIZE = 4 * 1024 * 1024
 
-def unique(iterable: Collection[Any]) -> bool:
-    # v probably slower but should work
-    # // seen: list[Any] = []
-    # // for obj in iterable:
-    # //     if obj in iterable:
-    # //         return False
-    # //     seen.append(obj)
-    # // return True
 
-    # * probably faster
-    return len(iterable) == len(set(iterable))
+class FsyncPolicy(enum.StrEnum):
+    """StrEnum for the sync policies of the write-ahead log (`Table.wal`)."""
+
+    NONE = "none"
+    # never, the OS writes the log to the disk eventually
+    BATCH = "batch"
+    # after every group commit, before the rows are acknowledged
+    INTERVAL = "interval"
+    # at most once every `Table.fsync_interval` seconds, during a commit, or
+    # when the interval ends (by a timer) if the last commits weren't synced
+
+
+@dataclasses.dataclass
+class _Commit:
+    # Internal class, rows that wait for a group commit. `violation` is the
+    # index of the row that violates a UNIQUE attribute and the error message.
+    rows: list[tuple[Any, ...]]
+    done: bool = False
+    violation: tuple[int, str] | None = None
+    error: BaseException | None = None
+
+
+class _TextCodec:
+    # Internal class, reads and writes the rows of the text format: one row
+    # per line, the columns are separated by ";;".
+    magic = b"BCDB "
+
+    def __init__(self, attributes: list["Attribute"]) -> None:
+        self.attributes = attributes
+
+    @staticmethod
+    def bounds(
+        buffer: "mmap.mmap | bytes", start: int, end: int
+    ) -> Iterator[tuple[int, int]]:
+        # Yields the start and the end of the records in buffer[start:end].
+        while start < end:
+            stop = buffer.find(b"\n", start, end)
+            stop = end if stop == -1 else stop + 1
+            yield start, stop
+            start = stop
+
+    @staticmethod
+    def read(file: BinaryIO) -> bytes:
+        # Reads the next record. Returns an empty bytes at the end of the file.
+        return file.readline()
+
+    def decode(
+        self,
+        record: bytes | memoryview,
+        rownum: int,
+        columns: list[int] | None = None,
+    ) -> tuple[Any, ...]:
+        # Converts a record to a row (or to the columns `columns` of the row;
+        # then the line is only split as far as needed, and the other columns
+        # aren't verified).
+        line = str(record, "utf-8").removesuffix("\n").removesuffix("\r")
+        if columns is not None:
+            if not columns:
+                return ()
+            last = max(columns)
+            parts = line.split(";;", last + 1)
+            if len(parts) <= last:
+                raise AssertionError(
+                    f"invalid table file: invalid columns on row {rownum},"
+                    f" expected {len(self.attributes)}, got {len(parts)}"
+                )
+            return tuple(
+                self.attributes[idx].convert_and_verify(parts[idx])
+                for idx in columns
+            )
+        column_: list[Any] = []
+        for columnnum, column in enumerate(line.split(";;")):
+            if columnnum >= len(self.attributes):
+                raise AssertionError(
+                    f"invalid table file: too many columns on row {rownum}"
+                )
+            attr = self.attributes[columnnum]
+            column_.append(attr.convert_and_verify(column))
+        if len(column_) != len(self.attributes):
+            raise AssertionError(
+                f"invalid table file: invalid columns on row {rownum},"
+                f" expected {len(self.attributes)}, got {len(column_)}"
+            )
+        return tuple(column_)
+
+    @staticmethod
+    def encode(row: tuple[Any, ...]) -> bytes:
+        # Converts a row to a record.
+        txt = ";;".join(
+            str(column).replace("\n", r"\n").replace("\r", r"\r")
+            for column in row
+        )
+        return f"{txt}\n".encode("utf-8")
+
+
+class _BinaryCodec:
+    # Internal class, reads and writes the rows of the binary format. Every
+    # record starts with the length of the rest of the record (unsigned 32-bit
+    # integer), which is followed by the columns: BOOLEANs are 1 byte,
+    # INTEGERs are signed 64-bit integers, FLOATs are doubles, and STRINGs are
+    # their length (unsigned 32-bit integer) followed by their UTF-8 encoded
+    # value. Everything is little-endian.
+    magic = b"BCDB/2 "
+    length = struct.Struct("<I")
+    formats = {"BOOLEAN": "?", "INTEGER": "q", "FLOAT": "d"}
+
+    def __init__(self, attributes: list["Attribute"]) -> None:
+        self.attributes = attributes
+        # The columns are grouped into segments, so the consecutive fixed
+        # width columns can be packed and unpacked with one struct. A segment
+        # is a struct and the columns in it, or None and a STRING column.
+        self.segments: list[tuple[struct.Struct | None, list[int]]] = []
+        fmt = ""
+        idxs: list[int] = []
+        for idx, attr in enumerate(attributes):
+            if attr.type_ == AttributeType.STRING:
+                if idxs:
+                    self.segments.append((struct.Struct(f"<{fmt}"), idxs))
+                    fmt, idxs = "", []
+                self.segments.append((None, [idx]))
+            else:
+                fmt += self.formats[attr.type_]
+                idxs.append(idx)
+        if idxs:
+            self.segments.append((struct.Struct(f"<{fmt}"), idxs))
+
+    def bounds(
+        self, buffer: "mmap.mmap | bytes", start: int, end: int
+    ) -> Iterator[tuple[int, int]]:
+        # Yields the start and the end of the records in buffer[start:end].
+        # The last record may be truncated, `decode` checks that.
+        while start < end:
+            stop = start + self.length.size
+            if stop <= end:
+                stop += self.length.unpack_from(buffer, start)[0]
+            stop = min(stop, end)
+            yield start, stop
+            start = stop
+
+    def read(self, file: BinaryIO) -> bytes:
+        # Reads the next record. Returns an empty bytes at the end of the file.
+        prefix = file.read(self.length.size)
+        if len(prefix) < self.length.size:
+            return b""
+        return prefix + file.read(self.length.unpack(prefix)[0])
+
+    def decode(
+        self,
+        record: bytes | memoryview,
+        rownum: int,
+        columns: list[int] | None = None,
+    ) -> tuple[Any, ...]:
+        # Converts a record to a row (or to the columns `columns` of the row;
+        # then the STRINGs that aren't needed aren't decoded).
+        if (len(record) < self.length.size) or (
+            self.length.unpack_from(record)[0]
+            != len(record) - self.length.size
+        ):
+            raise AssertionError(f"invalid table file: truncated row {rownum}")
+        needed = None if columns is None else set(columns)
+        values: list[Any] = [None] * len(self.attributes)
+        position = self.length.size
+        try:
+            for struct_, idxs in self.segments:
+                if struct_ is None:
+                    size = self.length.unpack_from(record, position)[0]
+                    position += self.length.size
+                    end = position + size
+                    if (needed is None) or (idxs[0] in needed):
+                        values[idxs[0]] = str(record[position:end], "utf-8")
+                    position = end
+                else:
+                    for idx, value in zip(
+                        idxs, struct_.unpack_from(record, position)
+                    ):
+                        values[idx] = value
+                    position += struct_.size
+        except struct.error as exc:
+            raise AssertionError(
+                f"invalid table file: not enough columns on row {rownum}"
+            ) from exc
+        if position != len(record):
+            raise AssertionError(
+                f"invalid table file: invalid columns on row {rownum},"
+                f" {len(record) - position} extra bytes"
+            )
+        if columns is None:
+            return tuple(values)
+        return tuple(values[idx] for idx in columns)
+
+    def encode(self, row: tuple[Any, ...]) -> bytes:
+        # Converts a row to a record.
+        parts: list[bytes] = []
+        for struct_, idxs in self.segments:
+            if struct_ is None:
+                data = row[idxs[0]].encode("utf-8")
+                parts.append(self.length.pack(len(data)))
+                parts.append(data)
+            else:
+                parts.append(struct_.pack(*(row[idx] for idx in idxs)))
+        payload = b"".join(parts)
+        return self.length.pack(len(payload)) + payload
 
 
 @dataclasses.dataclass(order=True, frozen=True)
@@ -61,11 +1454,55 @@ class Table:
 
     Args:
         file (pathlib.Path): The table file.
+        lock (Any, optional): The lock of the table. Defaults to None, which
+        means the `RWLock` that is shared by every `Table` of the same table
+        file (in this process), so different handles of a table exclude each
+        other, and different tables don't. The handles share the indexes too.
+        With an `RWLock` the reads don't block each other, other locks are
+        acquired by the reads too.
+        persist_indexes (bool, optional): Save the indexes (the row offsets
+        and the indexes of the UNIQUE attributes) to a file next to the table
+        file (`index_file`), so they don't have to be rebuilt by the next
+        process (only the rows added since they were saved are indexed).
+        Defaults to False.
+        tombstones (bool, optional): `remove_row` and `remove_rows` don't
+        rewrite the table file, they append the removed rows to an append-only
+        log next to the table file (`tombstone_file`) instead, and the rows
+        in it are skipped. Call `compact` to reclaim the space. Defaults to
+        False.
+        file_lock (bool, optional): Lock `lock_file` with `fcntl.flock` too
+        (shared for reads, exclusive for writes), so the processes using the
+        table exclude each other. Requires `fcntl` (not available on Windows)
+        and the default lock. Defaults to False.
+        wal (bool, optional): Log the added rows to a write-ahead log
+        (`wal_file`) before they are appended to the table file. The rows
+        that are added concurrently are written (and synced) together, and
+        the table file is only synced when the log is checkpointed (see
+        `checkpoint`). The log is replayed when the table is opened after a
+        crash. Every handle of the table should use the same setting.
+        Defaults to False.
+        fsync (FsyncPolicy, optional): When the write-ahead log is synced to
+        the disk. The rows are only safe from a crash (of the OS, or a power
+        loss) after the log was synced. Defaults to FsyncPolicy.BATCH.
+        fsync_interval (float, optional): The number of seconds between the
+        syncs if `fsync` is FsyncPolicy.INTERVAL. If the rows added in an
+        interval weren't synced, the log is checkpointed when it ends (by a
+        timer), even if no more rows are added. Defaults to 1.0.
     """
 
     file: pathlib.Path
-    lock: Any = dataclasses.field(
-        default_factory=threading.Lock, compare=False
+    lock: Any = dataclasses.field(default=None, compare=False)
+    persist_indexes: bool = dataclasses.field(default=False, compare=False)
+    tombstones: bool = dataclasses.field(default=False, compare=False)
+    file_lock: bool = dataclasses.field(default=False, compare=False)
+    wal: bool = dataclasses.field(default=False, compare=False)
+    fsync: FsyncPolicy = dataclasses.field(
+        default=FsyncPolicy.BATCH, compare=False
+    )
+    fsync_interval: float = dataclasses.field(default=1.0, compare=False)
+
+    _state: _TableState = dataclasses.field(
+        init=False, repr=False, compare=False
     )
 
     def __post_init__(self) -> None:
@@ -73,9 +1510,44 @@ class Table:
             raise FileNotFoundError(self.file)
         if not self.file.is_file():
             raise OSError(f"{self.file} is not a file")
-        assert self.file.read_bytes().startswith(
-            b"BCDB "
+        # only the magic is read, not the whole file
+        with self.file.open("rb") as file:
+            start = file.read(len(_BinaryCodec.magic))
+        assert start.startswith(
+            (_TextCodec.magic, _BinaryCodec.magic)
         ), f"invalid table file {self.file}: doesn't start with BCDB"
+        lock, state = _get_shared(self.path)
+        # the dataclass is frozen
+        object.__setattr__(self, "_state", state)
+        if self.lock is None:
+            object.__setattr__(self, "lock", lock)
+        if self.file_lock:
+            assert isinstance(
+                self.lock, RWLock
+            ), "invalid lock: file_lock requires an RWLock"
+            self.lock.use_file(self.lock_file)
+        object.__setattr__(self, "fsync", FsyncPolicy(self.fsync))
+        with state.mutex:
+            recovered = state.recovered
+        if not recovered:
+            self._recover()
+
+    def _read_lock(self) -> Any:
+        # Internal function, returns a context manager that acquires the lock
+        # for reading.
+        if isinstance(self.lock, RWLock):
+            return self.lock.read()
+        return self.lock
+
+    def _header_lock(self) -> Any:
+        # Internal function, returns a context manager that acquires the lock
+        # for reading the first line of the table file (see `attributes`).
+        # Other locks aren't reentrant and the caller may hold them, so they
+        # aren't acquired (the first line is changed by replacing the table
+        # file, which the readers don't see half done).
+        if isinstance(self.lock, RWLock):
+            return self.lock.read()
+        return contextlib.nullcontext()
 
     @functools.cached_property
     def name(self) -> str:
@@ -88,6 +1560,17 @@ class Table:
         return self.file.stem
 
     @functools.cached_property
+    def path(self) -> pathlib.Path:
+        """
+        The resolved path of the table file. This is used as the key of the
+        cached values.
+
+        Returns:
+            pathlib.Path: The resolved path of the table file.
+        """
+        return self.file.resolve()
+
+    @_cached_property
     def attributes(self) -> list["Attribute"]:
         """
         Get the attributes for the table.
@@ -102,21 +1585,77 @@ class Table:
         Returns:
             list[Attribute]: The attributes
         """
-        first_line = None
-        with self.lock:
-            with self.file.open("r", encoding="utf-8") as file:
-                for line in file:
-                    first_line = line
-                    break
+        with self._header_lock():
+            with self.file.open("rb") as file:
+                first_line = file.readline()
         assert first_line, "invalid table file: empty"
-        assert first_line.startswith(
-            "BCDB "
-        ), "invalid table file: doesn't start with BCDB"
+        magic = self._magic(first_line)
         return [
             Attribute.from_str(string, self)
-            for string in first_line.removeprefix("BCDB ").split(";;")
+            for string in first_line.removeprefix(magic)
+            .decode("utf-8")
+            .split(";;")
         ]
 
+    @staticmethod
+    def _magic(first_line: bytes) -> bytes:
+        # Internal function, returns the magic at the start of the table file.
+        for magic in (_TextCodec.magic, _BinaryCodec.magic):
+            if first_line.startswith(magic):
+                return magic
+        raise AssertionError("invalid table file: doesn't start with BCDB")
+
+    @_cached_property
+    def format(self) -> "TableFormat":  # noqa: A003
+        """
+        The format of the table file, detected from its first line.
+
+        Raises:
+            AssertionError: if the table file doesn't start with `BCDB `
+
+        Returns:
+            TableFormat: The format of the table file.
+        """
+        with self._header_lock():
+            with self.file.open("rb") as file:
+                first_line = file.readline()
+        if self._magic(first_line) == _BinaryCodec.magic:
+            return TableFormat.BINARY
+        return TableFormat.TEXT
+
+    @_cached_property
+    def _codec(self) -> "_TextCodec | _BinaryCodec":
+        # Internal property, reads and writes the rows in the table's format.
+        if self.format == TableFormat.BINARY:
+            return _BinaryCodec(self.attributes)
+        return _TextCodec(self.attributes)
+
+    def _signature(self) -> tuple[int, ...]:
+        # Internal function, the signature of the table file and the size of
+        # the tombstone log.
+        return _table_signature(self.path)
+
+    def _dead_offsets(self) -> set[int]:
+        # Internal function, returns the offsets of the rows in the tombstone
+        # log. The log is ignored if it belongs to another table file (that
+        # replaced this one).
+        try:
+            with self.tombstone_file.open("rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return set()
+        if (len(data) < _TOMBSTONE.size) or (
+            _TOMBSTONE.unpack_from(data)[0] != self.path.stat().st_ino
+        ):
+            return set()
+        start, end = _TOMBSTONE.size, len(data) - len(data) % _TOMBSTONE.size
+        return {
+            offset
+            for (offset,) in _TOMBSTONE.iter_unpack(
+                memoryview(data)[start:end]
+            )
+        }
+
     def get_attribute(self, name: str) -> "Attribute":
         """
         Get an attribute with name `name`.
@@ -166,16 +1705,16 @@ class Table:
     ) -> bool:
         # Internal function, please use `.contains()` and `.not_contains()`
         # instead.
-        attr_idx = self.get_attribute_index(attribute_name)
-        for rownum, row in enumerate(self.get_rows(), 2):
-            try:
-                column = row[attr_idx]
-            except IndexError as exc:  # pragma: no cover
-                raise AssertionError(
-                    f"invalid row at line {rownum}: doesn't have a column"
-                    f" {attr_idx} (attribute {attribute_name})"
-                ) from exc
-            if column == attribute_value:
+        self.get_attribute_index(attribute_name)
+        with self._read_lock(), self._state.mutex:
+            rownums = self._lookup(attribute_name, attribute_value)
+        if rownums is not None:
+            return rv_if_found if rownums else not rv_if_found
+        # only the attribute's column is converted
+        with contextlib.closing(
+            self._scan([], Q(attribute_name) == attribute_value)
+        ) as rows:
+            for _ in rows:
                 return rv_if_found
         return not rv_if_found
 
@@ -275,7 +1814,83 @@ class Table:
         """
         return self._contains_row(row, False)
 
-    def get_rows(self, *, lock: bool = True) -> list[tuple[Any, ...]]:
+    def _counts(self) -> tuple[int, int]:
+        # Internal function, returns the number of live rows and of removed
+        # rows that are still in the table file. They are counted (without
+        # converting the rows) if they aren't known. The lock (for reading at
+        # least) and the state's mutex must be held.
+        state = self._state
+        signature = self._signature()
+        if state.counted != signature:
+            dead = self._dead_offsets()
+            cached = row_cache.get(self.path, signature)
+            if cached is not None:
+                live = len(cached)
+            elif state.signature == signature:
+                live = len(state.offsets)
+            else:
+                first, live = None, 0
+                counted = state.counted
+                if (
+                    (counted is not None)
+                    and (counted[0] == signature[0])
+                    and (counted[4] == signature[4])
+                    and (counted[1] < signature[1])
+                ):
+                    # rows were only appended (by another process) since they
+                    # were counted
+                    first, live = counted[1], state.live
+                codec = self._codec
+                with self.file.open("rb") as file, _map_file(
+                    file, signature[1]
+                ) as (mapped, view):
+                    self._magic(bytes(view[: len(_BinaryCodec.magic)]))
+                    live += sum(
+                        start not in dead
+                        for start, _ in codec.bounds(
+                            mapped,
+                            _header_end(mapped) if first is None else first,
+                            len(mapped),
+                        )
+                    )
+            state.set_counts(signature, live, len(dead))
+        return state.live, state.dead
+
+    def count(self, *, dead: bool = False) -> int:
+        """
+        Get the number of rows without reading them. The count is kept up to
+        date by the writes (`add_row`, `write_rows`, `remove_rows`, `map`,
+        ...) of every `Table` of the table file in this process, so the rows
+        are only counted (without converting them) if the table file was
+        changed by another process (only the appended rows if it appended
+        rows), or wasn't read yet. `len(table)` is the same as
+        `table.count()`.
+
+        Args:
+            dead (bool, optional): Count the removed rows that are still in
+            the table file (see `tombstones`) instead. Defaults to False.
+
+        Raises:
+            Exceptions may be raised by other functions (os.stat) called by
+            this function.
+
+        Returns:
+            int: The number of rows.
+        """
+        with self._read_lock(), self._state.mutex:
+            live, removed = self._counts()
+        return removed if dead else live
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def get_rows(
+        self,
+        *,
+        lock: bool = True,
+        columns: Iterable[str] | None = None,
+        processes: int | None = None,
+    ) -> list[tuple[Any, ...]]:
         """
         Get all rows in the table.
 
@@ -291,40 +1906,732 @@ class Table:
             lock (bool, optional): Acquire lock before reading the file. This
             is only changed internally, please don't use this argument.
             Defaults to True.
+            columns (Iterable[str] | None, optional): The names of the
+            attributes to return. If it's not None, the rows only contain these
+            columns (in this order). If the table is bigger than what the row
+            cache can hold, the other columns aren't converted or verified.
+            Defaults to None (all columns).
+            processes (int | None, optional): If it's not None, and the table
+            is bigger than what the row cache can hold, the table file is
+            split into ranges of rows that are parsed by this many processes.
+            Defaults to None (parsed by this thread).
 
         Returns:
             list[tuple[Any, ...]]: All rows in the table. This is a list of
             tuples. The tuples represent rows. All of the tuples should have
             the same length.
         """
-        with self.lock if lock else contextlib.nullcontext():
-            contents = self.file.read_text(encoding="utf-8")
-        assert contents.startswith(
-            "BCDB "
-        ), "invalid table file: doesn't start with BCDB"
-        rows = contents.splitlines()
-        rows.pop(0)  # the BCDB... line
+        if processes is not None:
+            return self._parallel_scan(
+                processes, self._column_indexes(columns)
+            )
+        if columns is not None:
+            return list(self._scan(self._column_indexes(columns)))
+        with self._read_lock() if lock else contextlib.nullcontext():
+            signature = self._signature()
+            cached = row_cache.get(self.path, signature)
+            if cached is not None:
+                return list(cached)
+            return self._load(signature)
+
+    def iter_rows(
+        self, *, columns: Iterable[str] | None = None
+    ) -> Iterator[tuple[Any, ...]]:
+        """
+        Iterate over the rows in the table. Unlike `get_rows`, this reads the
+        table file line by line if it's bigger than what the row cache can
+        hold, so only one row is in memory at a time.
+
+        The rows are read from a snapshot (see `snapshot`), so the lock is
+        only acquired when the iteration starts. The rows added, removed or
+        rewritten (e.g. by `write_rows`) after that don't affect the
+        iteration.
+
+        Args:
+            columns (Iterable[str] | None, optional): Same as in `get_rows`.
+            Defaults to None (all columns).
+
+        Raises:
+            AssertionError: if the table file doesn't start with `BCDB `
+            AssertionError: if there are too many columns on a row
+            AssertionError: if there are not enough columns on a row
+
+            Other exceptions may be raised by other functions
+            (Attribute.convert_and_verify) called by this function.
+
+        Returns:
+            Iterator[tuple[Any, ...]]: The rows.
+        """
+        return self._scan(self._column_indexes(columns))
+
+    def get_column(self, attribute_name: str) -> list[Any]:
+        """
+        Get the values of the column `attribute_name` of all rows. If the
+        table is bigger than what the row cache can hold, only this column is
+        converted, the others are skipped.
+
+        Args:
+            attribute_name (str): The attribute's (column's) name.
+
+        Raises:
+            Exceptions may be raised by other functions (get_attribute_index,
+            iter_rows) called by this function.
+
+        Returns:
+            list[Any]: The values in the same order as the rows.
+        """
+        return [
+            row[0]
+            for row in self._scan([self.get_attribute_index(attribute_name)])
+        ]
+
+    def _column_indexes(
+        self, columns: Iterable[str] | None
+    ) -> list[int] | None:
+        # Internal function, converts the attribute names to column indexes.
+        if columns is None:
+            return None
+        return [self.get_attribute_index(name) for name in columns]
+
+    def _scan(
+        self,
+        columns: list[int] | None,
+        where: Condition | None = None,
+        stats: QueryPlan | None = None,
+    ) -> Iterator[tuple[Any, ...]]:
+        # Internal function, yields the rows (only the columns `columns`, or
+        # all of them if it's None) where `where` is true (or all rows if
+        # it's None) from a snapshot of the table, so the lock isn't held
+        # while the rows are yielded. How they are read is recorded in
+        # `stats`.
+        with Snapshot(self, stats) as snapshot:
+            yield from snapshot._scan(columns, where, stats)
+
+    def snapshot(self) -> "Snapshot":
+        """
+        Pin the current version of the table, see `Snapshot`. The lock is only
+        held while the version is pinned.
+
+        Raises:
+            Exceptions may be raised by other functions (get_rows) called by
+            this function.
+
+        Returns:
+            Snapshot: The snapshot. Close it (or use it in a with statement)
+            when it's not needed anymore.
+        """
+        return Snapshot(self)
+
+    def _parallel_scan(
+        self,
+        processes: int,
+        columns: list[int] | None,
+        func: Callable[[tuple[Any, ...]], Any] | None = None,
+        mode: str | None = None,
+        stats: QueryPlan | None = None,
+    ) -> list[tuple[Any, ...]]:
+        # Internal function, returns the rows (only the columns `columns`, or
+        # all of them if it's None) after `func` was called on them (see
+        # `_call_rows`). The table file is split into ranges of whole records
+        # that are parsed (and passed to `func`) by a pool of `processes`
+        # processes, and the results are merged in order. Snapshots that
+        # don't need to be parsed (see `Snapshot`) are read by this thread.
+        # How the rows are read is recorded in `stats`.
+        assert (
+            processes > 0
+        ), f"invalid processes: must be positive, got {processes!r}"
+        width = len(self.attributes)
+        with Snapshot(self, stats) as snapshot:
+            if snapshot._file is not None:
+                rows = self._parse_ranges(
+                    snapshot, processes, columns, func, mode, stats
+                )
+                if rows is not None:
+                    return rows
+            if (stats is not None) and (func is not None):
+                func = stats._timed("predicate", func)
+            return _call_rows(
+                snapshot._scan(columns, stats=stats), func, mode, width
+            )
+
+    def _parse_ranges(
+        self,
+        snapshot: "Snapshot",
+        processes: int,
+        columns: list[int] | None,
+        func: Callable[[tuple[Any, ...]], Any] | None,
+        mode: str | None,
+        stats: QueryPlan | None = None,
+    ) -> list[tuple[Any, ...]] | None:
+        # Internal function, see `_parallel_scan`. Returns None if the table
+        # file of the snapshot was rewritten in place (so the processes can't
+        # read it).
+        assert snapshot._file is not None
+        codec = self._codec
+        size = snapshot.signature[1]
+        start_time = time.perf_counter()
+        with _map_file(snapshot._file, size) as (mapped, _):
+            if len(mapped) < size:
+                return None
+            start = _header_end(mapped)
+            step = max((size - start) // processes, 1)
+            bounds = [start]
+            if isinstance(codec, _TextCodec):
+                for idx in range(1, processes):
+                    position = mapped.find(b"\n", start + idx * step, size)
+                    if position == -1:
+                        break
+                    if position + 1 > bounds[-1]:
+                        bounds.append(position + 1)
+            else:
+                # the records can only be found by following their lengths
+                # (which is much faster than parsing them)
+                for position, _ in codec.bounds(mapped, start, size):
+                    if position >= bounds[-1] + step:
+                        bounds.append(position)
+        if bounds[-1] < size:
+            bounds.append(size)
+        if stats is not None:
+            stats.access_path = AccessPath.PARALLEL_SCAN
+            stats.timings["split"] += time.perf_counter() - start_time
+            start_time = time.perf_counter()
+        # the processes don't need the tables of the attributes
+        attributes = [
+            dataclasses.replace(attr, table=None) for attr in self.attributes
+        ]
+        with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+            futures = [
+                pool.submit(
+                    _parse_range,
+                    self.path,
+                    snapshot.signature[0],
+                    self.format,
+                    attributes,
+                    (low, high),
+                    frozenset(
+                        offset
+                        for offset in snapshot._dead
+                        if low <= offset < high
+                    ),
+                    None if mode else columns,
+                    func,
+                    mode,
+                )
+                for low, high in zip(bounds, bounds[1:])
+            ]
+            results = [future.result() for future in futures]
         rv: list[tuple[Any, ...]] = []
-        column_: list[Any] = []
-        #                      the 1st line is BCDB...
-        #                                v
-        for rownum, row in enumerate(rows, 2):
-            for columnnum, column in enumerate(row.split(";;")):
-                if columnnum >= len(self.attributes):
-                    raise AssertionError(
-                        f"invalid table file: too many columns on row {rownum}"
+        #      the 1st line is BCDB...
+        #                v
+        rownum = 1
+        for result in results:
+            if result is None:
+                return None
+            rows, count, failed = result
+            if failed is not None:
+                # parse it again for the error with the right row number
+                snapshot._file.seek(failed[0])
+                codec.decode(
+                    snapshot._file.read(failed[1] - failed[0]),
+                    rownum + count,
+                    None if mode else columns,
+                )
+                raise AssertionError(  # pragma: no cover
+                    f"invalid table file: invalid row {rownum + count}"
+                )
+            rv.extend(rows)
+            rownum += count
+        if stats is not None:
+            stats.timings["convert"] += time.perf_counter() - start_time
+            stats.rows_examined += rownum - 1 - len(snapshot._dead)
+            stats.bytes_read += size - bounds[0]
+        return rv
+
+    def _load(
+        self,
+        signature: tuple[int, ...],
+        stats: QueryPlan | None = None,
+    ) -> list[tuple[Any, ...]]:
+        # Internal function, parses the table file (which is memory-mapped),
+        # and updates the cached rows, and the indexes (if they are
+        # outdated). The dead rows are skipped. The lock must be held (for
+        # reading at least). How the file is read is recorded in `stats`.
+        codec = self._codec
+        dead = self._dead_offsets()
+        offsets = array.array("q")
+        rv: list[tuple[Any, ...]] = []
+        map_file, decode = _map_file, codec.decode
+        if stats is not None:
+            map_file = stats._map_file
+            decode = stats._timed("convert", decode)
+        with self.file.open("rb") as file, map_file(file, signature[1]) as (
+            mapped,
+            view,
+        ):
+            self._magic(bytes(view[: len(_BinaryCodec.magic)]))
+            records = codec.bounds(mapped, _header_end(mapped), len(mapped))
+            if stats is not None:
+                records = stats._timed_iter("split", records)
+            #                         the 1st line is BCDB...
+            #                                   v
+            for rownum, (start, stop) in enumerate(records, 2):
+                if start not in dead:
+                    offsets.append(start)
+                    rv.append(decode(view[start:stop], rownum))
+        row_cache.put(self.path, signature, tuple(rv), signature[1])
+        with self._state.mutex:
+            if self._state.signature != signature:
+                self._state.load(signature, offsets, rv)
+            self._state.set_counts(signature, len(rv), len(dead))
+        return rv
+
+    def _estimated_rows(
+        self,
+        signature: tuple[int, ...],
+        rows: Sequence[tuple[Any, ...]] | None,
+    ) -> int | None:
+        # Internal function, returns the number of rows of the version with
+        # `signature` (whose rows are `rows`, if they are cached) if it's
+        # known without reading the table file.
+        if rows is not None:
+            return len(rows)
+        if self._state.counted == signature:
+            return self._state.live
+        if self._state.signature == signature:
+            return len(self._state.offsets)
+        return None
+
+    @property
+    def index_file(self) -> pathlib.Path:
+        """
+        The file where the indexes are saved if `persist_indexes` is True.
+
+        Returns:
+            pathlib.Path: The index file, `<table file>.index`.
+        """
+        return self.file.with_name(f"{self.file.name}.index")
+
+    @property
+    def lock_file(self) -> pathlib.Path:
+        """
+        The file that is locked if `file_lock` is True. It isn't removed.
+
+        Returns:
+            pathlib.Path: The lock file, `<table file>.lock`.
+        """
+        return self.file.with_name(f"{self.file.name}.lock")
+
+    @property
+    def wal_file(self) -> pathlib.Path:
+        """
+        The write-ahead log of the table (see `wal`).
+
+        Returns:
+            pathlib.Path: The log, `<table file>.wal`.
+        """
+        return self.file.with_name(f"{self.file.name}.wal")
+
+    @property
+    def tombstone_file(self) -> pathlib.Path:
+        """
+        The append-only log of the rows removed by `remove_row` and
+        `remove_rows` if `tombstones` is True.
+
+        Returns:
+            pathlib.Path: The tombstone file, `<table file>.tombstones`.
+        """
+        return self.file.with_name(f"{self.file.name}.tombstones")
+
+    def _declare_indexes(self) -> None:
+        # Internal function, the attributes with the UNIQUE requirement are
+        # always indexed.
+        for idx, attr in enumerate(self.attributes):
+            if (
+                attr.requirements == AttributeRequirements.UNIQUE
+                and attr.name not in self._state.indexes
+            ):
+                self._state.indexes[attr.name] = HashIndex(attr.name, idx)
+                self._state.signature = None
+
+    def _ensure_indexes(self, *, lock: bool = True) -> _TableState:
+        # Internal function, returns the indexes after rebuilding them (or
+        # loading them from `index_file`) if they are outdated.
+        with (
+            self._read_lock() if lock else contextlib.nullcontext()
+        ), self._state.mutex:
+            self._declare_indexes()
+            signature = self._signature()
+            if self._state.signature == signature:
+                return self._state
+            if self.persist_indexes and self._load_indexes(signature):
+                return self._state
+            self._state.signature = None
+            self._load(signature)
+            if self.persist_indexes:
+                self.save_indexes(lock=False)
+            return self._state
+
+    def _load_indexes(self, signature: tuple[int, ...]) -> bool:
+        # Internal function, loads the indexes from `index_file`. If rows
+        # were only appended since they were saved (the inode and the
+        # tombstone log are the same, the size is bigger), only the appended
+        # rows are indexed. Returns False if it doesn't exist or is outdated.
+        try:
+            data = json.loads(self.index_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        saved = data.get("signature") if isinstance(data, dict) else None
+        if (
+            not isinstance(saved, list)
+            or len(saved) != 4
+            or (
+                saved != [*signature[:3], signature[4]]
+                and (
+                    saved[0] != signature[0]
+                    or saved[3] != signature[4]
+                    or not isinstance(saved[1], int)
+                    or saved[1] >= signature[1]
+                )
+            )
+            or not isinstance(data.get("indexes"), dict)
+            or not set(self._state.indexes) <= set(data["indexes"])
+            or not set(data["indexes"])
+            <= {attr.name for attr in self.attributes}
+        ):
+            return False
+        # the indexes created by create_index are saved too
+        for name, index_data in data["indexes"].items():
+            index_type = SortedIndex if index_data["ordered"] else HashIndex
+            if name not in self._state.indexes:
+                self._state.indexes[name] = index_type(
+                    name, self.get_attribute_index(name)
+                )
+            elif not isinstance(self._state.indexes[name], index_type):
+                return False
+        appended: list[tuple[int, tuple[Any, ...]]] = []
+        if saved[1] < signature[1]:
+            codec = self._codec
+            #    the 1st line is BCDB...
+            #              v
+            first = 2 + len(data["offsets"]) + len(self._dead_offsets())
+            with self.file.open("rb") as file, _map_file(
+                file, signature[1]
+            ) as (mapped, view):
+                for rownum, (start, stop) in enumerate(
+                    codec.bounds(mapped, saved[1], len(mapped)), first
+                ):
+                    appended.append(
+                        (start, codec.decode(view[start:stop], rownum))
                     )
-                attr = self.attributes[columnnum]
-                column_.append(attr.convert_and_verify(column))
-            if len(column_) != len(self.attributes):
-                raise AssertionError(
-                    f"invalid table file: invalid columns on row {rownum},"
-                    f" expected {len(self.attributes)}, got {len(column_)}"
+        self._state.reset(signature)
+        self._state.offsets = array.array("q", data["offsets"])
+        for name, index in self._state.indexes.items():
+            index.load(data["indexes"][name]["data"])
+        for offset, row in appended:
+            self._state.add(offset, row)
+        return True
+
+    def save_indexes(self, *, lock: bool = True) -> None:
+        """
+        Save the indexes to `index_file`. This is done automatically when the
+        indexes are rebuilt and by `write_rows` if `persist_indexes` is True,
+        but not by `add_row`; the next process only indexes the rows added
+        since the indexes were saved, call this after adding many rows.
+
+        Args:
+            lock (bool, optional): Acquire lock. Don't change this! Defaults to
+            True.
+        """
+        with self.lock if lock else contextlib.nullcontext():
+            state = self._ensure_indexes(lock=False)
+            assert state.signature
+            data = {
+                # the generation is only valid in this process
+                "signature": [*state.signature[:3], state.signature[4]],
+                "offsets": state.offsets.tolist(),
+                "indexes": {
+                    name: {
+                        "ordered": isinstance(index, SortedIndex),
+                        "data": index.dump(),
+                    }
+                    for name, index in state.indexes.items()
+                },
+            }
+            tmp_file = self.index_file.with_name(f"{self.index_file.name}.tmp")
+            tmp_file.write_text(json.dumps(data), encoding="utf-8")
+            tmp_file.replace(self.index_file)
+
+    def create_index(
+        self, attribute_name: str, *, ordered: bool = False
+    ) -> None:
+        """
+        Index the attribute `attribute_name`, so `get_row_where`,
+        `get_rows_where`, `contains` and `not_contains` don't have to read the
+        whole table to find the rows with a value. The index is kept up to
+        date by the writes. Attributes with the UNIQUE requirement are always
+        indexed.
+
+        Args:
+            attribute_name (str): The attribute's (column's) name.
+            ordered (bool, optional): Create a `SortedIndex` instead of a
+            `HashIndex`. It's also used by `get_rows_between`, `get_min_row`,
+            `get_max_row` and `get_top_rows`. Only INTEGER and FLOAT
+            attributes can have an ordered index. Defaults to False.
+
+        Raises:
+            AssertionError: if `ordered` is True, and the attribute isn't
+            INTEGER or FLOAT
+
+            Other exceptions may be raised by other functions
+            (get_attribute_index) called by this function.
+        """
+        attr_idx = self.get_attribute_index(attribute_name)
+        index_type = SortedIndex if ordered else HashIndex
+        assert (not ordered) or (
+            self.attributes[attr_idx].type_
+            in {AttributeType.INTEGER, AttributeType.FLOAT}
+        ), (
+            f"invalid index {attribute_name}: ordered indexes must be INTEGER"
+            " or FLOAT"
+        )
+        with self.lock:
+            if not isinstance(
+                self._state.indexes.get(attribute_name), index_type
+            ):
+                self._state.indexes[attribute_name] = index_type(
+                    attribute_name, attr_idx
                 )
-            rv.append(tuple(column_))
-            column_ = []
+                self._state.signature = None
+            self._ensure_indexes(lock=False)
+
+    def drop_index(self, attribute_name: str) -> None:
+        """
+        Remove the index created by `create_index`.
+
+        Args:
+            attribute_name (str): The attribute's (column's) name.
+
+        Raises:
+            AssertionError: if the attribute isn't indexed
+            AssertionError: if the attribute has the UNIQUE requirement
+
+            Other exceptions may be raised by other functions (get_attribute)
+            called by this function.
+        """
+        attr = self.get_attribute(attribute_name)
+        assert (
+            attr.requirements != AttributeRequirements.UNIQUE
+        ), f"invalid index {attribute_name}: UNIQUE attributes are indexed"
+        with self.lock:
+            assert (
+                attribute_name in self._state.indexes
+            ), f"invalid index {attribute_name}: doesn't exist"
+            del self._state.indexes[attribute_name]
+            if self.persist_indexes:
+                self.save_indexes(lock=False)
+
+    def _lookup(
+        self, attribute_name: str, attribute_value: Any
+    ) -> list[int] | None:
+        # Internal function, returns the numbers of the rows where the
+        # attribute is `attribute_value`, or None if the attribute isn't
+        # indexed. The lock (for reading at least) and the state's mutex must
+        # be held.
+        if (attribute_name not in self._state.indexes) and (
+            not self.persist_indexes
+        ):
+            # don't read the table twice (here and by the caller's scan)
+            return None
+        index = self._ensure_indexes(lock=False).indexes.get(attribute_name)
+        if index is None:
+            return None
+        return index.get(attribute_value)
+
+    def _locate(
+        self, rownums: list[int]
+    ) -> tuple[tuple[int, ...], list[tuple[int, int]]]:
+        # Internal function, returns the signature of the table file and the
+        # numbers and the offsets of the rows with the numbers `rownums`, so
+        # they can be read (see `_rows_at`) after releasing the state's
+        # mutex. The lock (for reading at least) and the state's mutex must
+        # be held, and the indexes must be up to date.
+        state = self._state
+        assert state.signature
+        return state.signature, [
+            (rownum, state.offsets[rownum]) for rownum in rownums
+        ]
+
+    def _rows_at(
+        self,
+        located: tuple[tuple[int, ...], list[tuple[int, int]]],
+        columns: list[int] | None = None,
+        stats: QueryPlan | None = None,
+    ) -> list[tuple[Any, ...]]:
+        # Internal function, returns the rows located by `_locate` (only the
+        # columns `columns`, or all of them if it's None). The lock (for
+        # reading at least) must be held since they were located, the
+        # state's mutex doesn't have to be held, so the readers don't wait
+        # for each other. How they are read is recorded in `stats`.
+        signature, rows = located
+        cached = row_cache.get(self.path, signature)
+        if stats is not None:
+            stats.rows_examined += len(rows)
+        if cached is not None:
+            if columns is None:
+                return [cached[rownum] for rownum, _ in rows]
+            return [
+                tuple(cached[rownum][idx] for idx in columns)
+                for rownum, _ in rows
+            ]
+        rv: list[tuple[Any, ...]] = []
+        codec = self._codec
+        read, decode = codec.read, codec.decode
+        if stats is not None:
+            read = stats._timed("io", read)
+            decode = stats._timed("convert", decode)
+        with self.file.open("rb") as file:
+            for rownum, offset in rows:
+                file.seek(offset)
+                rv.append(decode(read(file), rownum + 2, columns))
+                if stats is not None:
+                    stats.bytes_read += file.tell() - offset
         return rv
 
+    def _predicate(self, where: Where) -> Callable[[tuple[Any, ...]], bool]:
+        # Internal function, returns `where` as a function of the rows.
+        if isinstance(where, Condition):
+            return where._bind(
+                {attr.name: idx for idx, attr in enumerate(self.attributes)}
+            )
+        return where
+
+    def _plan(self, condition: Condition) -> _Plan:
+        # Internal function, returns how the rows where `condition` is true
+        # are found: with the index of an attribute that must be equal to (or
+        # in) some values, else with the ordered index of an attribute that
+        # must be in a range, else by scanning the table. The lock (for
+        # reading at least) and the state's mutex must be held.
+        self._declare_indexes()
+        if self.persist_indexes:
+            self._ensure_indexes(lock=False)
+        indexes = self._state.indexes
+        # only the comparisons of attributes can use an index, the "or" and
+        # "not" conditions are only checked
+        conjuncts = [
+            conjunct
+            for conjunct in condition._conjuncts()
+            if conjunct.op not in ("and", "or", "not")
+        ]
+        for conjunct in conjuncts:
+            name, value = conjunct.operands
+            if name in indexes and conjunct.op in ("==", "in"):
+                values = value if conjunct.op == "in" else frozenset([value])
+                return _Plan(name, values=values)
+        for name in sorted(condition._attributes()):
+            if not isinstance(indexes.get(name), SortedIndex):
+                continue
+            lows, highs = [], []
+            for conjunct in conjuncts:
+                if conjunct.op not in (">", ">=", "<", "<=", "between") or (
+                    conjunct.operands[0] != name
+                ):
+                    continue
+                value = conjunct.operands[1]
+                if conjunct.op == "between":
+                    lows.append(value[0])
+                    highs.append(value[1])
+                elif conjunct.op in (">", ">="):
+                    lows.append(value)
+                else:
+                    highs.append(value)
+            if lows or highs:
+                # the bounds are inclusive, the condition is checked anyway
+                return _Plan(
+                    name,
+                    bounds=(
+                        max(lows) if lows else None,
+                        min(highs) if highs else None,
+                    ),
+                )
+        return _Plan()
+
+    def _query(
+        self,
+        condition: Condition,
+        columns: list[int] | None = None,
+        stats: QueryPlan | None = None,
+        *,
+        lock: bool = True,
+    ) -> Iterator[tuple[Any, ...]]:
+        # Internal function, yields the rows (only the columns `columns`, or
+        # all of them if it's None) where `condition` is true, found as
+        # planned by `_plan`. Without an index, the table is scanned (see
+        # `_scan`) and only the checked columns of the other rows are
+        # converted. How they are found is recorded in `stats`. If `lock` is
+        # False, the lock must be held (then the rows aren't read from a
+        # snapshot, which would acquire it again).
+        with self._read_lock() if lock else contextlib.nullcontext():
+            with self._state.mutex:
+                plan = self._plan(condition)
+                if plan.attribute is not None:
+                    located = self._locate(self._planned_rownums(plan))
+                    if stats is not None:
+                        stats.access_path = AccessPath.INDEX
+                        stats.attribute = plan.attribute
+                        stats.estimated_rows = len(located[1])
+            if plan.attribute is not None:
+                rows = self._rows_at(located, stats=stats)
+        if (plan.attribute is None) and lock:
+            yield from self._scan(columns, condition, stats)
+            return
+        if plan.attribute is None:
+            rows = self.get_rows(lock=False)
+        test = self._predicate(condition)
+        if stats is not None:
+            test = stats._timed("predicate", test)
+        for row in rows:
+            if test(row):
+                yield (
+                    row
+                    if columns is None
+                    else tuple(row[idx] for idx in columns)
+                )
+
+    def _planned_rownums(self, plan: _Plan) -> list[int]:
+        # Internal function, returns the numbers of the rows (in ascending
+        # order) that are looked up in the index of the plan (see `_plan`).
+        # The lock (for reading at least) and the state's mutex must be held.
+        assert plan.attribute is not None
+        index = self._ensure_indexes(lock=False).indexes[plan.attribute]
+        if plan.values is not None:
+            rownums: Iterable[int] = set().union(
+                *(index.get(value) for value in plan.values)
+            )
+        else:
+            assert isinstance(index, SortedIndex)
+            assert plan.bounds is not None
+            rownums = index.between(*plan.bounds)
+        return sorted(rownums)
+
+    def _where_rows(
+        self, columns: list[int] | None, where: "Where | None"
+    ) -> Iterator[tuple[Any, ...]]:
+        # Internal function, yields the rows (only the columns `columns`, or
+        # all of them if it's None) where `where` is true (or all rows if it's
+        # None).
+        if where is None:
+            yield from self._scan(columns)
+        elif isinstance(where, Condition):
+            yield from self._query(where, columns)
+        else:
+            for row in self._scan(None):
+                if where(row):
+                    yield (
+                        row
+                        if columns is None
+                        else tuple(row[idx] for idx in columns)
+                    )
+
     def add_row(self, row: tuple[Any, ...], *, lock: bool = True) -> None:
         """
         Add a row to the table.
@@ -349,44 +2656,389 @@ class Table:
         for idx, column in enumerate(row):
             attr = self.attributes[idx]
             attr.verify_before_writing(column)
+        if self.wal and lock:
+            violation = self._group_commit([row])
+            if violation is not None:
+                raise AssertionError(violation[1])
+            return
         with self.lock if lock else contextlib.nullcontext():
-            with self.file.open("a", encoding="utf-8") as file:
-                txt = ";;".join(
-                    str(column).replace("\n", r"\n").replace("\r", r"\r")
-                    for column in row
-                )
-                file.write(f"{txt}\n")
+            self._append([row])
 
     def add_rows(
         self, rows: Iterable[tuple[Any, ...]], *, lock: bool = True
     ) -> None:
         """
-        Add multiple rows (like `list.extend()`).
+        Add multiple rows (like `list.extend()`). All rows are verified before
+        any of them is written (so either all or none of them are added): the
+        UNIQUE attributes are checked against the table and the other rows,
+        and the referenced tables (`from_`) are only read once. The rows are
+        written at once.
 
         Raises:
-            AssertionError: If `self.add_row` raises
+            AssertionError: If a row is invalid (see `self.add_row`)
 
         Args:
             rows (Iterable[tuple[Any, ...]]): The rows. Each item (tuple) is
             one row.
             lock (bool, optional): Same as in `self.add_row`. Defaults to True.
         """
-        for rownum, row in enumerate(rows):
-            try:
-                self.add_row(row, lock=lock)
-            except AssertionError as exc:
-                raise AssertionError(
-                    f"invalid row for add_rows at index {rownum} ({row}):"
-                    f" {exc}"
-                ) from exc
+        rows = list(rows)
+        if not rows:
+            return
+        violation = self._invalid_row(rows)
+        if violation is None:
+            if self.wal and lock:
+                violation = self._group_commit(rows)
+            else:
+                with self.lock if lock else contextlib.nullcontext():
+                    violation = self._unique_violation(rows, {})
+                    if violation is None:
+                        self._append(rows)
+        if violation is not None:
+            rownum, message = violation
+            raise AssertionError(
+                f"invalid row for add_rows at index {rownum} ({rows[rownum]}):"
+                f" {message}"
+            )
+
+    def _invalid_row(
+        self, rows: list[tuple[Any, ...]]
+    ) -> tuple[int, str] | None:
+        # Internal function, checks the number of columns, the types and the
+        # referenced values (`from_`) of the rows. The referenced tables are
+        # only read once. Returns the index of the first invalid row and the
+        # error message, or None if they are valid.
+        referenced = {
+            idx: self._referenced_values(attr)
+            for idx, attr in enumerate(self.attributes)
+            if attr.from_
+        }
+        for rownum, row in enumerate(rows):
+            try:
+                assert len(row) == len(self.attributes), (
+                    f"invalid value for table {self.name}: invalid number of"
+                    f" columns, expected {len(self.attributes)}, got"
+                    f" {len(row)}"
+                )
+                for attr, column in zip(self.attributes, row):
+                    attr.verify_type(column)
+                for idx, values in referenced.items():
+                    if row[idx] not in values:
+                        raise AssertionError(
+                            "invalid value for attribute"
+                            f" {self.attributes[idx].name}: {row[idx]!r} does"
+                            " not exist in from table"
+                            f" {self.attributes[idx].from_}"
+                        )
+            except AssertionError as exc:
+                return rownum, str(exc)
+        return None
+
+    def _unique_violation(
+        self,
+        rows: list[tuple[Any, ...]],
+        added: dict[int, dict[Any, int]],
+        start: int = 0,
+        *,
+        existing: bool = True,
+    ) -> tuple[int, str] | None:
+        # Internal function, checks the UNIQUE attributes of the rows against
+        # the table (unless `existing` is False, when the rows will replace
+        # it), `added` (the values of the `start` rows that will be added
+        # before them by attribute index, mapped to their row numbers), and
+        # each other. Returns the index of the first invalid row and the error
+        # message, or None (and adds the rows to `added`) if they are valid.
+        # The lock must be held.
+        unique = [
+            (idx, attr)
+            for idx, attr in enumerate(self.attributes)
+            if attr.requirements == AttributeRequirements.UNIQUE
+        ]
+        if not unique:
+            return None
+        state = self._ensure_indexes(lock=False) if existing else None
+        if state is not None:
+            start += len(state.offsets)
+        seen: dict[int, dict[Any, int]] = {idx: {} for idx, _ in unique}
+        for rownum, row in enumerate(rows):
+            for idx, attr in unique:
+                rownums = (
+                    []
+                    if state is None
+                    else state.indexes[attr.name].get(row[idx])
+                )
+                if (not rownums) and (row[idx] in added.get(idx, {})):
+                    rownums = [added[idx][row[idx]]]
+                if rownums:
+                    return rownum, (
+                        f"invalid value at attribute {attr.name}: attribute"
+                        " is unique, but it already appears on row"
+                        f" {rownums[0] + 2}"
+                    )
+                if row[idx] in seen[idx]:
+                    return rownum, (
+                        f"invalid value at attribute {attr.name}: attribute"
+                        " is unique, but it already appears at index"
+                        f" {seen[idx][row[idx]]} of the rows"
+                    )
+                seen[idx][row[idx]] = rownum
+        for idx, values in seen.items():
+            added.setdefault(idx, {}).update(
+                (value, start + rownum) for value, rownum in values.items()
+            )
+        return None
+
+    def _group_commit(
+        self, rows: list[tuple[Any, ...]]
+    ) -> tuple[int, str] | None:
+        # Internal function, adds the (verified) rows with the rows that the
+        # other threads add at the same time: the first thread that waits
+        # writes the rows of every thread that waits, so they are logged (and
+        # synced) at once. Returns the UNIQUE violation (see
+        # `_unique_violation`), if any. The lock mustn't be held.
+        state = self._state
+        commit = _Commit(rows)
+        with state.commits:
+            state.pending.append(commit)
+            while (not commit.done) and state.committing:
+                state.commits.wait()
+            if not commit.done:
+                # this thread commits the rows that are waiting
+                state.committing = True
+                batch, state.pending = state.pending, []
+        if not commit.done:
+            try:
+                with self.lock:
+                    added: dict[int, dict[Any, int]] = {}
+                    valid: list[tuple[Any, ...]] = []
+                    for other in batch:
+                        other.violation = self._unique_violation(
+                            other.rows, added, len(valid)
+                        )
+                        if other.violation is None:
+                            valid.extend(other.rows)
+                    if valid:
+                        self._append(valid)
+            except BaseException as exc:
+                for other in batch:
+                    other.error = exc
+            finally:
+                with state.commits:
+                    for other in batch:
+                        other.done = True
+                    state.committing = False
+                    state.commits.notify_all()
+        if commit.error is not None:
+            raise commit.error
+        return commit.violation
+
+    def _append(self, rows: list[tuple[Any, ...]]) -> None:
+        # Internal function, appends the (verified) rows to the table file
+        # (and logs them to the write-ahead log first if `wal`). The lock
+        # must be held.
+        state = self._state
+        if state.logged and (not self.wal):
+            # the offsets in the log must follow the table file
+            self._checkpoint()
+        before = self._signature()
+        records = [self._codec.encode(row) for row in rows]
+        data = b"".join(records)
+        with self.file.open("ab") as file:
+            offset = file.tell()
+            checkpoint = self.wal and self._log(offset, data)
+            file.write(data)
+        _mark_written(self.path)
+        after = self._signature()
+        if state.signature == before:
+            # keep the indexes up to date instead of rebuilding them
+            for record, row in zip(records, rows):
+                state.add(offset, row)
+                offset += len(record)
+            state.signature = after
+        if state.counted == before:
+            state.set_counts(after, state.live + len(rows), state.dead)
+        if checkpoint:
+            self._checkpoint()
+
+    def _log(self, offset: int, data: bytes) -> bool:
+        # Internal function, appends the records that will be written to the
+        # table file at `offset` to the write-ahead log, and syncs it
+        # according to `fsync`. Returns whether the log should be
+        # checkpointed. The lock must be held.
+        state = self._state
+        inode = self.path.stat().st_ino
+        with self.wal_file.open("a+b") as file:
+            file.seek(0)
+            header = file.read(_TOMBSTONE.size)
+            if (len(header) < _TOMBSTONE.size) or (
+                _TOMBSTONE.unpack(header)[0] != inode
+            ):
+                # the log is empty, or it belongs to a replaced table file
+                file.truncate(0)
+                file.write(_TOMBSTONE.pack(inode))
+            file.write(
+                _WAL_ENTRY.pack(offset, len(data), zlib.crc32(data)) + data
+            )
+            file.flush()
+            state.logged = True
+            now = time.monotonic()
+            if (self.fsync == FsyncPolicy.BATCH) or (
+                (self.fsync == FsyncPolicy.INTERVAL)
+                and (now - state.synced >= self.fsync_interval)
+            ):
+                os.fsync(file.fileno())
+                state.synced = now
+            elif (self.fsync == FsyncPolicy.INTERVAL) and (
+                state.flush is None
+            ):
+                # the last rows of a burst are synced when the interval ends,
+                # not only if more rows are added
+                state.flush = threading.Timer(
+                    max(state.synced + self.fsync_interval - now, 0.0),
+                    self._flush,
+                )
+                state.flush.daemon = True
+                state.flush.start()
+            return file.tell() >= _WAL_CHECKPOINT_SIZE
+
+    def _flush(self) -> None:
+        # Internal function, checkpoints the write-ahead log when the sync
+        # interval ends (see FsyncPolicy.INTERVAL). It runs in the thread of
+        # the timer.
+        with self.lock:
+            self._state.flush = None
+            # a removed table isn't created again
+            if self._state.logged and self.file.exists():
+                self._checkpoint()
+
+    def checkpoint(self) -> None:
+        """
+        Sync the table file to the disk and empty the write-ahead log (see
+        `wal`). This is done automatically when the log gets large, and
+        before the table file is rewritten.
+
+        Raises:
+            Exceptions may be raised by other functions (os.fsync) called by
+            this function.
+        """
+        with self.lock:
+            self._checkpoint()
+
+    def _checkpoint(self) -> None:
+        # Internal function, checkpoints the write-ahead log. The lock must be
+        # held.
+        try:
+            if not self.wal_file.stat().st_size:
+                self._state.logged = False
+                return
+        except FileNotFoundError:
+            self._state.logged = False
+            return
+        with self.file.open("ab") as file:
+            os.fsync(file.fileno())
+        with self.wal_file.open("wb") as file:
+            # an entry that was already checkpointed mustn't be replayed
+            # after the table file is rewritten
+            os.fsync(file.fileno())
+        self._state.logged = False
+        self._state.synced = time.monotonic()
+
+    def _truncate(self, size: int) -> None:
+        # Internal function, removes the rows that were appended after the
+        # table file had `size` bytes (to roll back a transaction). The lock
+        # must be held.
+        with self.file.open("r+b") as file:
+            file.truncate(size)
+        _mark_written(self.path)
+        with self._state.mutex:
+            # the file shrank without a new inode, so the removed rows
+            # mustn't be counted or indexed by continuing from the old counts
+            # and indexes (or the saved ones)
+            self._state.reset(None)
+            self._state.counted = None
+            self._state.live = self._state.dead = 0
+        self.index_file.unlink(missing_ok=True)
+        if self._state.logged:
+            # the log mustn't replay the removed rows
+            self._checkpoint()
+
+    def _recover(self) -> None:
+        # Internal function, replays the write-ahead log: the records that
+        # are missing from the table file (because they weren't synced before
+        # a crash) are written again. The entries after the first incomplete
+        # (or corrupt) one are ignored, they were never acknowledged.
+        try:
+            size = self.wal_file.stat().st_size
+        except FileNotFoundError:
+            size = 0
+        if size <= _TOMBSTONE.size:
+            with self._state.mutex:
+                self._state.recovered = True
+            return
+        with self.lock:
+            if self._state.recovered:
+                return
+            data = self.wal_file.read_bytes()
+            if _TOMBSTONE.unpack_from(data)[0] == self.path.stat().st_ino:
+                position = _TOMBSTONE.size
+                with self.file.open("r+b") as file:
+                    while position + _WAL_ENTRY.size <= len(data):
+                        offset, length, crc = _WAL_ENTRY.unpack_from(
+                            data, position
+                        )
+                        position += _WAL_ENTRY.size
+                        end = position + length
+                        records = data[position:end]
+                        position = end
+                        if (len(records) < length) or (
+                            zlib.crc32(records) != crc
+                        ):
+                            break
+                        end = file.seek(0, os.SEEK_END)
+                        assert offset <= end, (
+                            f"invalid write-ahead log {self.wal_file}: the"
+                            f" table file ends at {end}, before the rows"
+                            f" logged at {offset}"
+                        )
+                        file.seek(offset)
+                        if file.read(length) != records:
+                            file.seek(offset)
+                            file.truncate()
+                            file.write(records)
+                _mark_written(self.path)
+            self._checkpoint()
+            with self._state.mutex:
+                self._state.recovered = True
+
+    def _referenced_values(self, attribute: "Attribute") -> frozenset[Any]:
+        # Internal function, returns the values of the attribute in the table
+        # that it references (`attribute.from_`). They are cached until that
+        # table changes.
+        file = attribute.check_from().resolve()
+        key = (file, attribute.name)
+        signature = _table_signature(file)
+        with _referenced_lock:
+            entry = _referenced.get(key)
+            if (entry is not None) and (entry[0] == signature):
+                _referenced.move_to_end(key)
+                return entry[1]
+        from_table = self.__class__(file)
+        values = frozenset(from_table.get_column(attribute.name))
+        with _referenced_lock:
+            _referenced[key] = (signature, values)
+            _referenced.move_to_end(key)
+            while len(_referenced) > _MAX_REFERENCED:
+                _referenced.popitem(last=False)
+        return values
 
     def remove_row(self, where: Where, must_remove: bool = True) -> bool:
         """
         Remove the first row where `where(row)` is truthy.
 
         Args:
-            where (Callable[[tuple[Any, ...]], bool]): A function that accepts
-            a tuple as a positional argument, and returns a boolean.
+            where (Callable[[tuple[Any, ...]], bool] | Condition): A function
+            that accepts a tuple as a positional argument, and returns a
+            boolean, or a condition (see `Q`).
             must_remove (bool, optional): If this is True, and no rows were
             removed, an AssertionError will be raised. Defaults to True.
 
@@ -400,6 +3052,14 @@ class Table:
         Returns:
             bool: True if a row was removed, False otherwise
         """
+        if self.tombstones:
+            changes = bool(self._kill_rows(where, first=True))
+            if must_remove and (not changes):
+                raise AssertionError(
+                    "invalid row removal: must_remove but nothing was removed"
+                )
+            return changes
+        where = self._predicate(where)
         rows = self.get_rows()
         changes = False
         new_rows: list[tuple[Any, ...]] = []
@@ -424,8 +3084,9 @@ class Table:
         Remove all rows where `where(row)` is truthy.
 
         Args:
-            where (Callable[[tuple[Any, ...]], bool]): A function that accepts
-            a tuple as a positional argument, and returns a boolean.
+            where (Callable[[tuple[Any, ...]], bool] | Condition): A function
+            that accepts a tuple as a positional argument, and returns a
+            boolean, or a condition (see `Q`).
             limit (int, optional): The limit. If the number of removed rows
             exceeds this limit, the operation will be aborted (it won't even
             start). Defaults to 1000.
@@ -440,6 +3101,9 @@ class Table:
         Returns:
             int: The number of rows removed.
         """
+        if self.tombstones:
+            return self._kill_rows(where, limit=limit)
+        where = self._predicate(where)
         rows = self.get_rows()
         num_of_changes = 0
         new_rows: list[tuple[Any, ...]] = []
@@ -461,6 +3125,249 @@ class Table:
             self.write_rows(new_rows, i_know_what_im_doing=True)
         return num_of_changes
 
+    def _kill_rows(
+        self, where: Where, *, first: bool = False, limit: int | None = None
+    ) -> int:
+        # Internal function, appends the rows where `where(row)` is truthy
+        # (only the first one if `first`) to the tombstone log. Returns the
+        # number of rows removed. The offsets, the indexes, the cached rows
+        # and the counts are updated instead of reading the table again.
+        test = self._predicate(where)
+        codec = self._codec
+        with self.lock:
+            state = self._state
+            signature = self._signature()
+            with state.mutex:
+                dead = self._victims(where, test, codec, signature, first)
+            if (limit is not None) and (len(dead) > limit):
+                raise AssertionError(
+                    f"invalid removal of rows: exceeded the limit ({limit})"
+                    f" with {len(dead)} number of rows removed. Modify the"
+                    " limit argument to allow big removal of rows."
+                )
+            if not dead:
+                return 0
+            inode = self.path.stat().st_ino
+            valid = bool(self._dead_offsets())
+            with self.tombstone_file.open("ab" if valid else "wb") as file:
+                if not valid:
+                    file.write(_TOMBSTONE.pack(inode))
+                file.write(
+                    b"".join(_TOMBSTONE.pack(offset) for offset in dead)
+                )
+            cached = row_cache.get(self.path, signature)
+            _mark_written(self.path)
+            after = self._signature()
+            with state.mutex:
+                if state.signature == signature:
+                    rownums = [
+                        bisect.bisect_left(state.offsets, offset)
+                        for offset in dead
+                    ]
+                    if cached is not None:
+                        removed = set(rownums)
+                        row_cache.put(
+                            self.path,
+                            after,
+                            tuple(
+                                row
+                                for rownum, row in enumerate(cached)
+                                if rownum not in removed
+                            ),
+                            after[1],
+                        )
+                    state.remove(rownums)
+                    state.signature = after
+                if state.counted == signature:
+                    state.set_counts(
+                        after, state.live - len(dead), state.dead + len(dead)
+                    )
+            if self.persist_indexes and (state.signature == after):
+                self.save_indexes(lock=False)
+            return len(dead)
+
+    def _victims(
+        self,
+        where: Where,
+        test: Callable[[tuple[Any, ...]], bool],
+        codec: "_TextCodec | _BinaryCodec",
+        signature: tuple[int, ...],
+        first: bool,
+    ) -> list[int]:
+        # Internal function, returns the offsets (in ascending order) of the
+        # rows where `where` (`test` is its function) is true (only the first
+        # one if `first`). The rows are looked up in an index (see `_plan`),
+        # or taken from the cache, or the table file is parsed (only the
+        # checked columns of a condition are converted) without loading it.
+        # The lock and the state's mutex must be held.
+        state = self._state
+        offsets: list[int] = []
+        if isinstance(where, Condition):
+            plan = self._plan(where)
+            if plan.attribute is not None:
+                rownums = self._planned_rownums(plan)
+                rows = self._rows_at(self._locate(rownums))
+                for rownum, row in zip(rownums, rows):
+                    if test(row):
+                        offsets.append(state.offsets[rownum])
+                        if first:
+                            break
+                return offsets
+        cached = row_cache.get(self.path, signature)
+        if (cached is not None) and (state.signature == signature):
+            for offset, row in zip(state.offsets, cached):
+                if test(row):
+                    offsets.append(offset)
+                    if first:
+                        break
+            return offsets
+        needed = None
+        if isinstance(where, Condition):
+            needed = sorted(map(self.get_attribute_index, where._attributes()))
+            test = where._bind(
+                {
+                    self.attributes[idx].name: position
+                    for position, idx in enumerate(needed)
+                }
+            )
+        skip = self._dead_offsets()
+        with self.file.open("rb") as file, _map_file(file, signature[1]) as (
+            mapped,
+            view,
+        ):
+            self._magic(bytes(view[: len(_BinaryCodec.magic)]))
+            #                         the 1st line is BCDB...
+            #                                   v
+            for rownum, (start, stop) in enumerate(
+                codec.bounds(mapped, _header_end(mapped), len(mapped)), 2
+            ):
+                if (start not in skip) and test(
+                    codec.decode(view[start:stop], rownum, needed)
+                ):
+                    offsets.append(start)
+                    if first:
+                        break
+        return offsets
+
+    def compact(self) -> int:
+        """
+        Rewrite the table file without the rows removed with tombstones (see
+        `tombstones`), and remove the tombstone log. The rows are written to a
+        temporary file that replaces the table file, so the table can be read
+        while it's compacted, and the writers are only blocked while the rows
+        added in the meantime are copied and the file is replaced. See
+        `Compactor` for compacting in the background.
+
+        Raises:
+            Exceptions may be raised by other functions (get_rows) called by
+            this function.
+
+        Returns:
+            int: The number of bytes reclaimed.
+        """
+        for _ in range(3):
+            reclaimed = self._compact()
+            if reclaimed is not None:
+                return reclaimed
+        # the table keeps changing, so it's compacted with the lock held
+        with self.lock:
+            reclaimed = self._compact(lock=False)
+            assert reclaimed is not None
+            return reclaimed
+
+    def _compact(self, *, lock: bool = True) -> int | None:
+        # Internal function, compacts the table. Returns None if rows were
+        # removed (or the table was rewritten) while the live rows were
+        # written to the temporary file. The live records are copied (without
+        # converting them) from the pinned table file without the lock, it's
+        # only held (exclusively) to copy the records added in the meantime
+        # and to replace the file. If `lock` is False, the lock must be held.
+        with self._read_lock() if lock else contextlib.nullcontext():
+            signature = self._signature()
+            dead = self._dead_offsets()
+            # pylint: disable-next=consider-using-with
+            pinned = self.file.open("rb") if dead else None
+        if pinned is None:
+            with self.lock if lock else contextlib.nullcontext():
+                if not self._dead_offsets():
+                    self.tombstone_file.unlink(missing_ok=True)
+                    return 0
+            return None
+        descriptor, tmp_file = self._temp_file()
+        try:
+            with pinned, open(descriptor, "wb") as file, _map_file(
+                pinned, signature[1]
+            ) as (mapped, view):
+                if len(mapped) < signature[1]:
+                    # the table was rewritten in place
+                    return None
+                start = _header_end(mapped)
+                file.write(view[:start])
+                # the runs of live records are copied at once
+                run = start
+                for begin, end in self._codec.bounds(
+                    mapped, start, len(mapped)
+                ):
+                    if begin in dead:
+                        file.write(view[run:begin])
+                        run = end
+                file.write(view[run:])
+            with self.lock if lock else contextlib.nullcontext():
+                current = self._signature()
+                if (
+                    (current[0] != signature[0])
+                    or (current[1] < signature[1])
+                    or (current[4] != signature[4])
+                ):
+                    return None
+                before = current[1] + current[4]
+                with self.file.open("rb") as old, tmp_file.open("ab") as new:
+                    # the rows added since the live rows were read
+                    old.seek(signature[1])
+                    shutil.copyfileobj(old, new)
+                self._checkpoint()
+                self._replace(tmp_file)
+                # the log of the replaced file is ignored even if it can't
+                # be removed
+                self.tombstone_file.unlink(missing_ok=True)
+                _mark_written(self.path)
+                state = self._state
+                if state.counted == current:
+                    state.set_counts(self._signature(), state.live, 0)
+                return before - self.path.stat().st_size
+        finally:
+            tmp_file.unlink(missing_ok=True)
+
+    def _temp_file(self) -> tuple[int, pathlib.Path]:
+        # Internal function, creates a temporary file next to the table file,
+        # returns its descriptor and path.
+        descriptor, tmp_name = tempfile.mkstemp(
+            prefix=f"{self.path.name}.", suffix=".tmp", dir=self.path.parent
+        )
+        return descriptor, pathlib.Path(tmp_name)
+
+    def _replace(self, tmp_file: pathlib.Path) -> None:
+        # Internal function, replaces the table file with `tmp_file`. The
+        # lock must be held.
+        shutil.copymode(self.path, tmp_file)
+        try:
+            tmp_file.replace(self.path)
+        except PermissionError:
+            # on Windows open files can't be replaced
+            with tmp_file.open("rb") as new, self.file.open("wb") as old:
+                shutil.copyfileobj(new, old)
+
+    def _new_generation(self, data: bytes) -> None:
+        # Internal function, replaces the table file with a new file that
+        # contains `data`. The lock must be held.
+        descriptor, tmp_file = self._temp_file()
+        try:
+            with open(descriptor, "wb") as file:
+                file.write(data)
+            self._replace(tmp_file)
+        finally:
+            tmp_file.unlink(missing_ok=True)
+
     def write_rows(
         self,
         rows: list[tuple[Any, ...]],
@@ -472,9 +3379,15 @@ class Table:
         Remove ALL rows and replace them with `rows`. Usage is discouraged!
         ! [WARNING] ONLY USE THIS IF YOU KNOW WHAT YOU ARE DOING!
 
+        All rows are verified (see `add_rows`) before the table file is
+        replaced with a new file that contains them, so the table is unchanged
+        if one of them is invalid.
+
         Raises:
-            Exceptions may be raised by other functions (add_row) called by
-            this function.
+            AssertionError: If a row is invalid (see `self.add_row`)
+
+            Other exceptions may be raised by other functions (add_row) called
+            by this function.
 
         Args:
             rows (list[tuple[Any, ...]]): The rows that will be in the file.
@@ -486,28 +3399,57 @@ class Table:
         assert (
             i_know_what_im_doing is True
         ), "You don't know what you are doing."
+        rows = list(rows)
         with self.lock if lock else contextlib.nullcontext():
-            # remove ALL rows
-            with self.file.open("r", encoding="utf-8") as file:
+            # all rows are verified before the table file is replaced, so
+            # it's untouched if one of them is invalid
+            violation = self._invalid_row(rows) or self._unique_violation(
+                rows, {}, existing=False
+            )
+            if violation is not None:
+                rownum, message = violation
+                raise AssertionError(
+                    f"invalid row for write_rows at index {rownum}"
+                    f" ({rows[rownum]}): {message}"
+                )
+            # the offsets in the logs are invalid after the rewrite
+            self._checkpoint()
+            with self.file.open("rb") as file:
                 # get the first line ("BCDB ...")
-                first_line = file.readlines()[0]
-            with self.file.open("w", encoding="utf-8") as file:
-                # and then write that to the file
-                file.write(first_line)
-
-            # we are still in the lock, and we do lock=False, because other
-            # operations might be waiting, but this must finish first
-            for row in rows:
-                self.add_row(row, lock=False)
+                first_line = file.readline()
+            records = [self._codec.encode(row) for row in rows]
+            # the rows are written to a new file that replaces the table
+            # file, so the snapshots keep reading the old one
+            self._new_generation(first_line + b"".join(records))
+            # the log of the replaced file is ignored even if it can't be
+            # removed
+            self.tombstone_file.unlink(missing_ok=True)
+            _mark_written(self.path)
+            self._declare_indexes()
+            signature = self._signature()
+            state = self._state
+            offsets = array.array("q")
+            offset = len(first_line)
+            for record in records:
+                offsets.append(offset)
+                offset += len(record)
+            with state.mutex:
+                state.load(signature, offsets, rows)
+                state.set_counts(signature, len(rows), 0)
+            if self.persist_indexes:
+                self.save_indexes(lock=False)
 
     def map(  # noqa: A003
         self,
         func: Callable[[tuple[Any, ...]], tuple[Any, ...] | None],
         *,
         write: bool = False,
+        processes: int | None = None,
     ) -> list[tuple[Any, ...]]:
         """
-        Use `func` on all rows (like the built-in `map()`).
+        Use `func` on all rows (like the built-in `map()`). Unless `write` is
+        True, the rows are read from a snapshot (see `snapshot`), so the lock
+        isn't held while `func` is called.
 
         Args:
             func (Callable[[tuple[Any, ...]], tuple[Any, ...]  |  None]): The
@@ -516,6 +3458,9 @@ class Table:
             actually removed if `write=True`).
             write (bool, optional): Write the new values to the database. Only
             use this if you know what you are doing! Defaults to False.
+            processes (int | None, optional): Parse the rows and call `func`
+            in this many processes, see `get_rows`. `func` must be picklable
+            (e.g. a module-level function). Defaults to None.
 
         Raises:
             AssertionError: if the return value of `func` is a tuple, but its
@@ -530,26 +3475,19 @@ class Table:
         Returns:
             list[tuple[Any, ...]]: The new rows
         """
-        with self.lock:
+        # without write, the rows are read from a snapshot (without the lock)
+        with self.lock if write else contextlib.nullcontext():
             # * the actual map part
             new_rows: list[tuple[Any, ...]] = []
-            for row in self.get_rows(lock=False):
-                new_row = func(row)
-                if new_row is None:
-                    pass
-                elif isinstance(new_row, tuple):
-                    assert len(new_row) == len(self.attributes), (
-                        "invalid return value returned by map function:"
-                        f" tuple's ({new_row}) length ({len(new_row)}) must be"
-                        " the same as the number of arguments"
-                        f" ({len(self.attributes)})"
-                    )
-                    new_rows.append(new_row)
-                else:
-                    raise AssertionError(
-                        "unknown return value returned by map function:"
-                        f" {new_row!r}, must be tuple or None"
-                    )
+            if processes is not None:
+                new_rows = self._parallel_scan(processes, None, func, "map")
+            else:
+                for row in (
+                    self.get_rows(lock=False) if write else self.iter_rows()
+                ):
+                    new_row = self._map_row(func, row)
+                    if new_row is not None:
+                        new_rows.append(new_row)
             # * the writing part
             if write:
                 self.write_rows(
@@ -558,19 +3496,94 @@ class Table:
             # * and return
             return new_rows
 
+    def _map_row(
+        self,
+        func: Callable[[tuple[Any, ...]], tuple[Any, ...] | None],
+        row: tuple[Any, ...],
+    ) -> tuple[Any, ...] | None:
+        # Internal function, calls the map function and checks its return
+        # value.
+        return _map_row(func, row, len(self.attributes))
+
+    def iter_map(
+        self, func: Callable[[tuple[Any, ...]], tuple[Any, ...] | None]
+    ) -> Iterator[tuple[Any, ...]]:
+        """
+        Like `map`, but the new rows are yielded one by one while the table is
+        read with `iter_rows`, so the table isn't loaded into memory. The new
+        rows can't be written to the database.
+
+        Args:
+            func (Callable[[tuple[Any, ...]], tuple[Any, ...]  |  None]): The
+            function to call. It must return a tuple or None. If it returns
+            None, then that row is skipped.
+
+        Raises:
+            AssertionError: if the return value of `func` is a tuple, but its
+            length is not the same as the number of attributes
+            AssertionError: if the return value of `func` is not a tuple, and
+            isn't None
+
+            Other exceptions may be raised by other
+            functions (iter_rows) called by this function.
+
+        Yields:
+            tuple[Any, ...]: The new rows
+        """
+        for row in self.iter_rows():
+            new_row = self._map_row(func, row)
+            if new_row is not None:
+                yield new_row
+
+    def iter_filter(self, func: Where) -> Iterator[tuple[Any, ...]]:
+        """
+        Like `filter`, but the retained rows are yielded one by one while the
+        table is read with `iter_rows`, so the table isn't loaded into memory.
+        The rows can't be written to the database.
+
+        Args:
+            func (Callable[[tuple[Any, ...]], bool] | Condition): The function
+            to call, or a condition (see `filter`). If it returns False, then
+            that row is skipped.
+
+        Raises:
+            Exceptions may be raised by other functions (iter_rows) called by
+            this function.
+
+        Yields:
+            tuple[Any, ...]: The retained rows
+        """
+        if isinstance(func, Condition):
+            yield from self._query(func)
+            return
+        for row in self.iter_rows():
+            if func(row):
+                yield row
+
     def filter(  # noqa: A003
-        self, func: Callable[[tuple[Any, ...]], bool], *, write: bool = False
+        self,
+        func: Where,
+        *,
+        write: bool = False,
+        processes: int | None = None,
     ) -> list[tuple[Any, ...]]:
         """
         Retain rows where `func(row)` is truthy (like the built-in `filter()`).
 
         Args:
-            func (Callable[[tuple[Any, ...]], bool]): The function to call. It
-            must return a bool. If it returns False, then that row is
-            considered to be removed (it will only be actually removed if
-            `write=True`).
+            func (Callable[[tuple[Any, ...]], bool] | Condition): The function
+            to call. It must return a bool. If it returns False, then that row
+            is considered to be removed (it will only be actually removed if
+            `write=True`). It can also be a condition (see `Q`): then the rows
+            are looked up in an index of an attribute that the condition
+            compares (`==`, `isin`, or a range if the index is ordered), or
+            only the compared columns of the rows that don't match are
+            converted.
             write (bool, optional): Write the retained values to the database.
             Only use this if you know what you are doing! Defaults to False.
+            processes (int | None, optional): Parse the rows and call `func`
+            in this many processes, see `get_rows`. `func` must be picklable
+            (e.g. a module-level function). Defaults to None.
 
         Raises:
             Exceptions may be raised by other functions (map) called by this
@@ -580,13 +3593,82 @@ class Table:
             list[tuple[Any, ...]]: The new rows
         """
 
+        if isinstance(func, Condition) and (processes is None):
+            with self.lock if write else contextlib.nullcontext():
+                rows = list(self._query(func, lock=not write))
+                if write:
+                    self.write_rows(
+                        rows, i_know_what_im_doing=True, lock=False
+                    )
+                return rows
+        test = self._predicate(func)
+
         def _func(row: tuple[Any, ...]) -> tuple[Any, ...] | None:
-            return (row) if (func(row)) else (None)
+            return (row) if (test(row)) else (None)
+
+        if processes is None:
+            return self.map(_func, write=write)
+        # the closure can't be pickled
+        with self.lock if write else contextlib.nullcontext():
+            new_rows = self._parallel_scan(processes, None, test, "filter")
+            if write:
+                self.write_rows(
+                    new_rows, i_know_what_im_doing=True, lock=False
+                )
+            return new_rows
+
+    def explain(
+        self, query: "Where | None" = None, *, processes: int | None = None
+    ) -> QueryPlan:
+        """
+        Run a query like `filter` (without `write`), and return how it was
+        run: the access path (an index, the row cache, a scan or a parallel
+        scan), the estimated and the actual number of rows examined, the
+        number of bytes read, and the time spent in each phase. Use it to
+        catch the queries that scan the whole table by accident.
+
+        Args:
+            query (Callable[[tuple[Any, ...]], bool] | Condition | None,
+            optional): The query, see `filter`. Only conditions (see `Q`) can
+            use an index. Defaults to None (all rows).
+            processes (int | None, optional): Same as in `filter`. Defaults to
+            None.
+
+        Raises:
+            Exceptions may be raised by other functions (filter) called by
+            this function.
 
-        return self.map(_func, write=write)
+        Returns:
+            QueryPlan: How the query was run.
+        """
+        stats = QueryPlan(AccessPath.SCAN)
+        start = time.perf_counter()
+        if processes is not None:
+            test = None if query is None else self._predicate(query)
+            rows = self._parallel_scan(
+                processes,
+                None,
+                test,
+                None if test is None else "filter",
+                stats,
+            )
+        elif isinstance(query, Condition):
+            rows = list(self._query(query, stats=stats))
+        else:
+            rows = list(self._scan(None, None, stats))
+            if query is not None:
+                test = stats._timed("predicate", query)
+                rows = [row for row in rows if test(row)]
+        stats.rows_returned = len(rows)
+        stats.elapsed = time.perf_counter() - start
+        return stats
 
     def get_row_where(
-        self, attribute_name: str, attribute_value: Any
+        self,
+        attribute_name: str,
+        attribute_value: Any,
+        *,
+        columns: Iterable[str] | None = None,
     ) -> tuple[Any, ...]:
         """
         Get the row where the column at `attribute_name` is `attribute_value`.
@@ -594,27 +3676,35 @@ class Table:
         Args:
             attribute_name (str): The attribute's (column's) name.
             attribute_value (Any): Its value.
+            columns (Iterable[str] | None, optional): Same as in `get_rows`.
+            Defaults to None (all columns).
 
         Raises:
             AssertionError: If there are no rows that match
             AssertionError: If there are multiple rows that match
 
             Other exceptions may be raised by other
-            functions (get_attribute_index, filter) called by this function.
+            functions (get_attribute_index, iter_rows) called by this function.
 
         Returns:
             tuple[Any, ...]: The row
         """
         attr_idx = self.get_attribute_index(attribute_name)
-
-        def _func(row: tuple[Any, ...]) -> bool:
-            # ? for some reason mypy yells at us?
-            # error: Returning Any from function declared to return "bool"
-            return (  # type: ignore[no-any-return]
-                row[attr_idx] == attribute_value
-            )
-
-        rv = self.filter(_func)
+        column_idxs = self._column_indexes(columns)
+
+        with self._read_lock():
+            with self._state.mutex:
+                rownums = self._lookup(attribute_name, attribute_value)
+                if rownums is not None:
+                    located = self._locate(rownums[:2])
+            if rownums is not None:
+                rv = self._rows_at(located, column_idxs)
+        if rownums is None:
+            with contextlib.closing(
+                self._scan(column_idxs, Q(attribute_name) == attribute_value)
+            ) as rows:
+                # there's no need to read the rest after the 2nd match
+                rv = list(itertools.islice(rows, 2))
 
         if len(rv) < 1:
             raise AssertionError(
@@ -633,6 +3723,8 @@ class Table:
         attribute_name: str,
         attribute_value: Any,
         allow_empty: bool = False,
+        *,
+        columns: Iterable[str] | None = None,
     ) -> list[tuple[Any, ...]]:
         """
         Get all rows where the column at `attribute_name` is `attribute_value`.
@@ -642,27 +3734,33 @@ class Table:
             attribute_value (Any): Its value.
             allow_empty (bool, optional): Allow empty results? Defaults to
             False.
+            columns (Iterable[str] | None, optional): Same as in `get_rows`.
+            Defaults to None (all columns).
 
         Raises:
             AssertionError: If there are no rows that match and `allow_empty`
 
             Other exceptions may be raised by other
-            functions (get_attribute_index, filter) called by this function.
+            functions (get_attribute_index, iter_rows) called by this function.
 
         Returns:
             list[tuple[Any, ...]]: The rows
         """
         attr_idx = self.get_attribute_index(attribute_name)
-
-        def _func(row: tuple[Any, ...]) -> bool:
-            # ? for some reason mypy yells at us?
-            # error: Returning Any from function declared to return "bool"
-            return (  # type: ignore[no-any-return]
-                row[attr_idx] == attribute_value
+        column_idxs = self._column_indexes(columns)
+
+        with self._read_lock():
+            with self._state.mutex:
+                rownums = self._lookup(attribute_name, attribute_value)
+                if rownums is not None:
+                    located = self._locate(rownums)
+            if rownums is not None:
+                rv = self._rows_at(located, column_idxs)
+        if rownums is None:
+            rv = list(
+                self._scan(column_idxs, Q(attribute_name) == attribute_value)
             )
 
-        rv = self.filter(_func)
-
         if (len(rv) < 1) and (not allow_empty):
             raise AssertionError(
                 f"no rows have {attribute_value} at column {attr_idx}"
@@ -670,9 +3768,342 @@ class Table:
             )
         return rv
 
+    def _sorted_index(self, attribute_name: str) -> SortedIndex | None:
+        # Internal function, returns the ordered index of the attribute, or
+        # None if it doesn't have one. The lock (for reading at least) and the
+        # state's mutex must be held.
+        if (
+            not isinstance(
+                self._state.indexes.get(attribute_name), SortedIndex
+            )
+        ) and (not self.persist_indexes):
+            return None
+        index = self._ensure_indexes(lock=False).indexes.get(attribute_name)
+        return index if isinstance(index, SortedIndex) else None
+
+    def _comparable_rows(self, attr_idx: int) -> list[tuple[Any, ...]]:
+        # Internal function, returns the rows whose column at `attr_idx` isn't
+        # NaN (which is what SortedIndex ignores).
+        return [
+            row for row in self.get_rows() if row[attr_idx] == row[attr_idx]
+        ]
+
+    def get_rows_between(
+        self, attribute_name: str, low: Any, high: Any
+    ) -> list[tuple[Any, ...]]:
+        """
+        Get all rows where the column at `attribute_name` is between `low` and
+        `high` (inclusive). If the attribute has an ordered index (see
+        `create_index`) it's used, otherwise the whole table is read.
+
+        Args:
+            attribute_name (str): The attribute's (column's) name.
+            low (Any): The lower bound, or None for no lower bound.
+            high (Any): The upper bound, or None for no upper bound.
+
+        Raises:
+            Exceptions may be raised by other functions (get_attribute_index,
+            get_rows) called by this function.
+
+        Returns:
+            list[tuple[Any, ...]]: The rows ordered by the attribute. Rows with
+            equal values are in the same order as they are in the table.
+        """
+        attr_idx = self.get_attribute_index(attribute_name)
+        with self._read_lock():
+            with self._state.mutex:
+                index = self._sorted_index(attribute_name)
+                if index is not None:
+                    located = self._locate(index.between(low, high))
+            if index is not None:
+                return self._rows_at(located)
+        return sorted(
+            (
+                row
+                for row in self._comparable_rows(attr_idx)
+                if ((low is None) or (low <= row[attr_idx]))
+                and ((high is None) or (row[attr_idx] <= high))
+            ),
+            key=operator.itemgetter(attr_idx),
+        )
+
+    def get_top_rows(
+        self, attribute_name: str, count: int, *, descending: bool = True
+    ) -> list[tuple[Any, ...]]:
+        """
+        Get the `count` rows with the largest (or smallest) values at the
+        column `attribute_name`. If the attribute has an ordered index (see
+        `create_index`) it's used, otherwise the whole table is read.
+
+        Args:
+            attribute_name (str): The attribute's (column's) name.
+            count (int): The maximum number of rows to return.
+            descending (bool, optional): Return the rows with the largest
+            values if True, the rows with the smallest values if False.
+            Defaults to True.
+
+        Raises:
+            Exceptions may be raised by other functions (get_attribute_index,
+            get_rows) called by this function.
+
+        Returns:
+            list[tuple[Any, ...]]: The rows ordered by the attribute
+            (descending if `descending` is True). Rows with equal values are in
+            the same order as they are in the table.
+        """
+        attr_idx = self.get_attribute_index(attribute_name)
+        with self._read_lock():
+            with self._state.mutex:
+                index = self._sorted_index(attribute_name)
+                if index is not None:
+                    located = self._locate(
+                        index.last(count) if descending else index.first(count)
+                    )
+            if index is not None:
+                return self._rows_at(located)
+        return (heapq.nlargest if descending else heapq.nsmallest)(
+            count,
+            self._comparable_rows(attr_idx),
+            key=operator.itemgetter(attr_idx),
+        )
+
+    def _get_extreme_row(
+        self, attribute_name: str, descending: bool
+    ) -> tuple[Any, ...]:
+        # Internal function, please use `.get_min_row()` and `.get_max_row()`
+        # instead.
+        rv = self.get_top_rows(attribute_name, 1, descending=descending)
+        if len(rv) < 1:
+            raise AssertionError(
+                f"no rows have a value at attribute {attribute_name}"
+            )
+        return rv[0]
+
+    def get_min_row(self, attribute_name: str) -> tuple[Any, ...]:
+        """
+        Get the row with the smallest value at the column `attribute_name`.
+        If the attribute has an ordered index (see `create_index`) it's used,
+        otherwise the whole table is read.
+
+        If you would like to get the row with the largest value see
+        `get_max_row` instead.
+
+        Args:
+            attribute_name (str): The attribute's (column's) name.
+
+        Raises:
+            AssertionError: If there are no rows (that aren't NaN)
+
+            Other exceptions may be raised by other
+            functions (get_top_rows) called by this function.
+
+        Returns:
+            tuple[Any, ...]: The row. If multiple rows have the smallest value,
+            the first one.
+        """
+        return self._get_extreme_row(attribute_name, False)
+
+    def get_max_row(self, attribute_name: str) -> tuple[Any, ...]:
+        """
+        Get the row with the largest value at the column `attribute_name`.
+        If the attribute has an ordered index (see `create_index`) it's used,
+        otherwise the whole table is read.
+
+        If you would like to get the row with the smallest value see
+        `get_min_row` instead.
+
+        Args:
+            attribute_name (str): The attribute's (column's) name.
+
+        Raises:
+            AssertionError: If there are no rows (that aren't NaN)
+
+            Other exceptions may be raised by other
+            functions (get_top_rows) called by this function.
+
+        Returns:
+            tuple[Any, ...]: The row. If multiple rows have the largest value,
+            the first one.
+        """
+        return self._get_extreme_row(attribute_name, True)
+
+    def _aggregates(
+        self, aggregates: tuple[tuple[str, str | None], ...]
+    ) -> list[tuple[Aggregate, int | None]]:
+        # Internal function, checks the aggregates, and returns their
+        # functions and the indexes of their columns.
+        assert aggregates, "invalid aggregates: at least one is needed"
+        rv: list[tuple[Aggregate, int | None]] = []
+        for function, attribute_name in aggregates:
+            assert function in list(
+                Aggregate
+            ), f"invalid aggregate: {function!r} doesn't exist"
+            function = Aggregate(function)
+            if attribute_name is None:
+                assert (
+                    function == Aggregate.COUNT
+                ), f"invalid aggregate: {function} needs an attribute"
+                rv.append((function, None))
+                continue
+            idx = self.get_attribute_index(attribute_name)
+            if function in (Aggregate.SUM, Aggregate.AVG):
+                assert self.attributes[idx].type_ in (
+                    AttributeType.INTEGER,
+                    AttributeType.FLOAT,
+                ), (
+                    f"invalid aggregate: {function} needs an INTEGER or FLOAT"
+                    f" attribute, {attribute_name} is"
+                    f" {self.attributes[idx].type_}"
+                )
+            rv.append((function, idx))
+        return rv
+
+    def _stored_aggregate(
+        self, function: Aggregate, idx: int | None
+    ) -> tuple[bool, Any]:
+        # Internal function, returns True and the aggregate of all rows if it
+        # can be computed without reading the rows (from the row count, or
+        # the ordered index), else False and None. The lock (for reading at
+        # least) and the state's mutex must be held.
+        if function == Aggregate.COUNT:
+            return True, self._counts()[0]
+        if (idx is not None) and (function in (Aggregate.MIN, Aggregate.MAX)):
+            index = self._sorted_index(self.attributes[idx].name)
+            if index is not None:
+                if not index.keys:
+                    return True, None
+                return True, index.keys[0 if function == Aggregate.MIN else -1]
+        return False, None
+
+    def aggregate(
+        self, *aggregates: tuple[str, str | None], where: "Where | None" = None
+    ) -> tuple[Any, ...]:
+        """
+        Compute aggregates (see `Aggregate`) of the rows in one pass, without
+        loading the rows into memory, e.g.
+        `table.aggregate(("count", None), ("avg", "age"))`. Only the
+        aggregated columns are converted. Without `where`, the row count and
+        the smallest and largest values of the attributes with an ordered
+        index (see `create_index`) are known without converting the rows (see
+        `count`), so if all aggregates are known, the rows aren't read.
+
+        Args:
+            *aggregates (tuple[str, str | None]): The aggregates: the
+            aggregate function (see `Aggregate`) and the attribute's name
+            (None for COUNT).
+            where (Callable[[tuple[Any, ...]], bool] | Condition | None,
+            optional): Only aggregate the rows where it's true, see `filter`.
+            Defaults to None (all rows).
+
+        Raises:
+            AssertionError: If an aggregate function doesn't exist, or an
+            attribute doesn't exist or has the wrong type
+
+            Other exceptions may be raised by other
+            functions (iter_rows) called by this function.
+
+        Returns:
+            tuple[Any, ...]: The values of the aggregates, in order.
+        """
+        functions = self._aggregates(aggregates)
+        if where is None:
+            with self._read_lock(), self._state.mutex:
+                stored = [
+                    self._stored_aggregate(function, idx)
+                    for function, idx in functions
+                ]
+            if all(known for known, _ in stored):
+                return tuple(value for _, value in stored)
+        columns = sorted({idx for _, idx in functions if idx is not None})
+        positions = [
+            None if idx is None else columns.index(idx) for _, idx in functions
+        ]
+        accumulators = [_Accumulator(function) for function, _ in functions]
+        pairs = list(zip(accumulators, positions))
+        for row in self._where_rows(columns, where):
+            for accumulator, position in pairs:
+                accumulator.add(None if position is None else row[position])
+        return tuple(accumulator.result() for accumulator in accumulators)
+
+    def group_by(
+        self,
+        attribute_name: str,
+        *aggregates: tuple[str, str | None],
+        where: "Where | None" = None,
+    ) -> dict[Any, tuple[Any, ...]]:
+        """
+        Compute aggregates (see `aggregate`) for each value of the attribute
+        `attribute_name` in one pass, without loading the rows into memory,
+        e.g. `table.group_by("city", ("count", None), ("max", "age"))`. Only
+        the grouped and the aggregated columns are converted. Without
+        `where`, the counts of an attribute with an index (see
+        `create_index`) are known without reading the table.
+
+        Args:
+            attribute_name (str): The attribute's (column's) name whose values
+            the rows are grouped by.
+            *aggregates (tuple[str, str | None]): Same as in `aggregate`.
+            where (Callable[[tuple[Any, ...]], bool] | Condition | None,
+            optional): Same as in `aggregate`. Defaults to None (all rows).
+
+        Raises:
+            AssertionError: If an aggregate function doesn't exist, or an
+            attribute doesn't exist or has the wrong type
+
+            Other exceptions may be raised by other
+            functions (iter_rows) called by this function.
+
+        Returns:
+            dict[Any, tuple[Any, ...]]: The values of the aggregates (in
+            order) for each value of the attribute, in the order they first
+            appear in the table.
+        """
+        attr_idx = self.get_attribute_index(attribute_name)
+        functions = self._aggregates(aggregates)
+        if (where is None) and all(
+            function == Aggregate.COUNT for function, _ in functions
+        ):
+            with self._read_lock(), self._state.mutex:
+                if attribute_name in self._state.indexes:
+                    index = self._ensure_indexes(lock=False).indexes[
+                        attribute_name
+                    ]
+                    if isinstance(index, HashIndex):
+                        counts = sorted(
+                            (rownums[0], value, len(rownums))
+                            for value, rownums in index.entries.items()
+                            if rownums
+                        )
+                        return {
+                            value: (count,) * len(functions)
+                            for _, value, count in counts
+                        }
+        columns = sorted(
+            {attr_idx} | {idx for _, idx in functions if idx is not None}
+        )
+        key_position = columns.index(attr_idx)
+        positions = [
+            None if idx is None else columns.index(idx) for _, idx in functions
+        ]
+        groups: dict[Any, list[_Accumulator]] = {}
+        for row in self._where_rows(columns, where):
+            accumulators = groups.get(row[key_position])
+            if accumulators is None:
+                accumulators = groups[row[key_position]] = [
+                    _Accumulator(function) for function, _ in functions
+                ]
+            for accumulator, position in zip(accumulators, positions):
+                accumulator.add(None if position is None else row[position])
+        return {
+            key: tuple(accumulator.result() for accumulator in accumulators)
+            for key, accumulators in groups.items()
+        }
+
     def verify_from(self, obj: Any, attribute: "str | Attribute") -> None:
         """
-        Verify attribute.from_ (".from_", "from_", "from").
+        Verify attribute.from_ (".from_", "from_", "from"). The values of the
+        other table's attribute are cached until that table changes, so this
+        only reads the other table once.
 
         Args:
             obj (Any): The object to check.
@@ -682,35 +4113,20 @@ class Table:
             AssertionError: if the other table (with the name
             `attribute.from_`) doesn't have an attribute called
             `attribute.name`
-            AssertionError: if a row doesn't have a column with that
-            attribute (corrupted table file?)
             AssertionError: if `obj` doesn't exist in the other table
 
             Other exceptions may be raised by other
             functions (get_attribute, Attribute.check_from, __post_init__,
-            get_rows) called by this function.
+            get_column) called by this function.
         """
         if isinstance(attribute, str):
             attribute = self.get_attribute(attribute)
         if not attribute.from_:
             return
-        table_file = attribute.check_from()
-        attr_idx = self.attributes.index(attribute)
-        from_table = self.__class__(table_file)
-        from_table.get_attribute(attribute.name)
-        for idx, row in enumerate(from_table.get_rows(), 2):
-            try:
-                if row[attr_idx] == obj:
-                    break
-            except IndexError as exc:  # pragma: no cover
-                raise AssertionError(
-                    f"invalid table file: no column {attr_idx + 1} at row"
-                    f" {idx}"
-                ) from exc
-        else:  # no break
+        if obj not in self._referenced_values(attribute):
             raise AssertionError(
                 f"invalid value for attribute {attribute.name}: {obj!r} does"
-                f" not exist in from table {from_table.name}"
+                f" not exist in from table {attribute.from_}"
             )
 
     def verify_requirements(self, attribute: "Attribute", obj: Any) -> None:
@@ -726,41 +4142,287 @@ class Table:
             AssertionError: if the attribute cannot be found in the table file
             AssertionError: if the attribute is supposed to be unique, but
             it's already used
-            AssertionError: if the row doesn't have that column
             AssertionError: if the requirements are invalid
         """
         # sourcery skip: swap-if-else-branches
-        if (isinstance(obj, str)) and (";;" in obj):
+        if (
+            (isinstance(obj, str))
+            and (";;" in obj)
+            and (self.format == TableFormat.TEXT)
+        ):
             raise AssertionError(
                 f"invalid value at attribute {attribute.name}: string contains"
                 " separator"
             )
-        try:
-            which_column = self.attributes.index(attribute)
-        except ValueError as exc:
-            raise AssertionError(
-                f"invalid table file: cannot find attribute {attribute.name}"
-                f" within table {self.name}"
-            ) from exc
-        if attribute.requirements == AttributeRequirements.UNIQUE:
-            for idx, row in enumerate(self.get_rows()):
-                try:
-                    if row[which_column] == obj:
-                        raise AssertionError(
-                            f"invalid value at attribute {attribute.name}:"
-                            " attribute is unique, but it already appears on"
-                            f" row {idx + 2}"
-                        )
-                except IndexError as exc:  # pragma: no cover
-                    raise AssertionError(
-                        f"invalid table file: row {idx + 2} doesn't have"
-                        f" column {which_column + 1}"
-                    ) from exc
-        else:  # pragma: no cover
-            raise AssertionError(
-                f"invalid table file: unknown requirement"
-                f" {attribute.requirements!r}"
+        try:
+            self.attributes.index(attribute)
+        except ValueError as exc:
+            raise AssertionError(
+                f"invalid table file: cannot find attribute {attribute.name}"
+                f" within table {self.name}"
+            ) from exc
+        if attribute.requirements == AttributeRequirements.UNIQUE:
+            rownums = self._ensure_indexes().indexes[attribute.name].get(obj)
+            if rownums:
+                raise AssertionError(
+                    f"invalid value at attribute {attribute.name}:"
+                    " attribute is unique, but it already appears on"
+                    f" row {rownums[0] + 2}"
+                )
+        else:  # pragma: no cover
+            raise AssertionError(
+                f"invalid table file: unknown requirement"
+                f" {attribute.requirements!r}"
+            )
+
+
+class Snapshot:
+    """
+    A version of a table that can be read without the lock, so long reads
+    don't block the writers (and the writers don't change what is read).
+
+    The version is pinned by its rows if the table fits in the row cache
+    (they are never changed), or by an open handle of the table file, its
+    size, and the rows removed with tombstones at the time. The rows are only
+    appended after the pinned size, and rewrites (`write_rows`, `compact`)
+    replace the table file with a new file (generation), so the open handle
+    still reads the pinned version. On Windows, where an open file can't be
+    replaced, a rewrite may end the snapshot's rows early.
+
+    Args:
+        table (Table): The table.
+        stats (QueryPlan | None, optional): Record how the version is read
+        in it (see `Table.explain`). Defaults to None.
+    """
+
+    def __init__(self, table: Table, stats: QueryPlan | None = None) -> None:
+        self.table = table
+        self._rows: Sequence[tuple[Any, ...]] | None = None
+        self._file: BinaryIO | None = None
+        self._dead: set[int] = set()
+        with table._read_lock():
+            self.signature = table._signature()
+            self._rows = row_cache.get(table.path, self.signature)
+            if stats is not None:
+                stats.access_path = (
+                    AccessPath.SCAN if self._rows is None else AccessPath.CACHE
+                )
+                stats.estimated_rows = table._estimated_rows(
+                    self.signature, self._rows
+                )
+            if (self._rows is None) and (
+                self.signature[1] <= row_cache.max_bytes
+            ):
+                self._rows = table._load(self.signature, stats)
+            if self._rows is None:
+                self._dead = table._dead_offsets()
+                # pylint: disable-next=consider-using-with
+                self._file = table.file.open("rb")
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Release the pinned version (close the table file)."""
+        if self._file is not None:
+            self._file.close()
+
+    def iter_rows(
+        self, *, columns: Iterable[str] | None = None
+    ) -> Iterator[tuple[Any, ...]]:
+        """
+        Iterate over the rows of the pinned version, see `Table.iter_rows`.
+
+        Args:
+            columns (Iterable[str] | None, optional): Same as in
+            `Table.get_rows`. Defaults to None (all columns).
+
+        Returns:
+            Iterator[tuple[Any, ...]]: The rows.
+        """
+        return self._scan(self.table._column_indexes(columns))
+
+    def get_rows(
+        self, *, columns: Iterable[str] | None = None
+    ) -> list[tuple[Any, ...]]:
+        """
+        Get the rows of the pinned version, see `Table.get_rows`.
+
+        Args:
+            columns (Iterable[str] | None, optional): Same as in
+            `Table.get_rows`. Defaults to None (all columns).
+
+        Returns:
+            list[tuple[Any, ...]]: The rows.
+        """
+        return list(self.iter_rows(columns=columns))
+
+    def _scan(
+        self,
+        columns: list[int] | None,
+        where: Condition | None = None,
+        stats: QueryPlan | None = None,
+    ) -> Iterator[tuple[Any, ...]]:
+        # Internal function, see `Table._scan`. Big tables are memory-mapped,
+        # and parsed in batches straight from the map, and only the needed
+        # columns are converted (the columns that `where` checks first, and
+        # the others only if it's true).
+        if self._rows is not None:
+            test = None if where is None else self.table._predicate(where)
+            if stats is not None:
+                stats.rows_examined += len(self._rows)
+                if test is not None:
+                    test = stats._timed("predicate", test)
+            for row in self._rows:
+                if (test is None) or test(row):
+                    yield (
+                        row
+                        if columns is None
+                        else tuple(row[idx] for idx in columns)
+                    )
+            return
+        assert self._file is not None, "invalid snapshot: closed"
+        codec = self.table._codec
+        map_file, decode = _map_file, codec.decode
+        if stats is not None:
+            map_file = stats._map_file
+            decode = stats._timed("convert", decode)
+        needed: list[int] = []
+        if where is not None:
+            needed = sorted(
+                map(self.table.get_attribute_index, where._attributes())
+            )
+            test = where._bind(
+                {
+                    self.table.attributes[idx].name: position
+                    for position, idx in enumerate(needed)
+                }
             )
+            if stats is not None:
+                test = stats._timed("predicate", test)
+        size = self.signature[1]
+        position: int | None = None
+        #      the 1st line is BCDB...
+        #                v
+        rownum = 1
+        while True:
+            batch: list[tuple[Any, ...]] = []
+            # the file is only mapped while a batch is parsed, so it can be
+            # rewritten (in place, on Windows) between the batches
+            with map_file(self._file, size) as (mapped, view):
+                if len(mapped) < size:
+                    # the table was rewritten in place, the rest of the rows
+                    # are gone
+                    return
+                if position is None:
+                    self.table._magic(bytes(view[: len(_BinaryCodec.magic)]))
+                    position = _header_end(mapped)
+                records = itertools.islice(
+                    codec.bounds(mapped, position, size), _SCAN_BATCH_SIZE
+                )
+                if stats is not None:
+                    records = stats._timed_iter("split", records)
+                for start, stop in records:
+                    position = stop
+                    rownum += 1
+                    if start in self._dead:
+                        continue
+                    if stats is not None:
+                        stats.rows_examined += 1
+                    if (where is not None) and (
+                        not test(decode(view[start:stop], rownum, needed))
+                    ):
+                        continue
+                    batch.append(decode(view[start:stop], rownum, columns))
+                done = position >= size
+            yield from batch
+            if done:
+                return
+
+
+def _map_row(
+    func: Callable[[tuple[Any, ...]], tuple[Any, ...] | None],
+    row: tuple[Any, ...],
+    width: int,
+) -> tuple[Any, ...] | None:
+    # Internal function, calls the map function and checks its return value
+    # (a row of a table that has `width` attributes, or None).
+    new_row = func(row)
+    if new_row is None:
+        return None
+    if isinstance(new_row, tuple):
+        assert len(new_row) == width, (
+            "invalid return value returned by map function:"
+            f" tuple's ({new_row}) length ({len(new_row)}) must be"
+            f" the same as the number of arguments ({width})"
+        )
+        return new_row
+    raise AssertionError(
+        "unknown return value returned by map function:"
+        f" {new_row!r}, must be tuple or None"
+    )
+
+
+def _call_rows(
+    rows: Iterable[tuple[Any, ...]],
+    func: Callable[[tuple[Any, ...]], Any] | None,
+    mode: str | None,
+    width: int,
+) -> list[tuple[Any, ...]]:
+    # Internal function, returns the new rows if `mode` is "map" (see
+    # `Table.map`), the retained rows if it's "filter" (see `Table.filter`),
+    # or the rows if it's None.
+    if mode == "map":
+        assert func is not None
+        new_rows = (_map_row(func, row, width) for row in rows)
+        return [row for row in new_rows if row is not None]
+    if mode == "filter":
+        assert func is not None
+        return [row for row in rows if func(row)]
+    return list(rows)
+
+
+def _parse_range(
+    file: pathlib.Path,
+    inode: int,
+    table_format: "TableFormat",
+    attributes: list["Attribute"],
+    bounds: tuple[int, int],
+    dead: frozenset[int],
+    columns: list[int] | None,
+    func: Callable[[tuple[Any, ...]], Any] | None,
+    mode: str | None,
+) -> tuple[list[tuple[Any, ...]], int, tuple[int, int] | None] | None:
+    # Internal function, runs in the processes of `Table._parallel_scan`.
+    # Parses the records in file[bounds[0]:bounds[1]], and calls `func` on
+    # them (see `_call_rows`). Returns the rows, the number of records, and
+    # the bounds of the first invalid record (then the rows and the records
+    # after it are left out), or None if the table file was replaced.
+    codec = (
+        _BinaryCodec(attributes)
+        if table_format == TableFormat.BINARY
+        else _TextCodec(attributes)
+    )
+    rows: list[tuple[Any, ...]] = []
+    count = 0
+    with file.open("rb") as handle:
+        if os.fstat(handle.fileno()).st_ino != inode:
+            return None
+        with _map_file(handle, bounds[1]) as (mapped, view):
+            if len(mapped) < bounds[1]:
+                return None
+            for start, stop in codec.bounds(mapped, *bounds):
+                count += 1
+                if start in dead:
+                    continue
+                try:
+                    rows.append(codec.decode(view[start:stop], 0, columns))
+                except AssertionError:
+                    return [], count, (start, stop)
+    return _call_rows(rows, func, mode, len(attributes)), count, None
 
 
 class AttributeType(enum.StrEnum):
@@ -774,6 +4436,16 @@ class AttributeType(enum.StrEnum):
     # and Attribute.verify_before_writing
 
 
+class TableFormat(enum.StrEnum):
+    """StrEnum for table file formats."""
+
+    TEXT = "TEXT"
+    # one row per line, the columns are separated by ";;"
+    BINARY = "BINARY"
+    # length-prefixed rows, fixed width BOOLEANs, INTEGERs and FLOATs, and
+    # length-prefixed STRINGs (which can contain ";;")
+
+
 class AttributeRequirements(enum.StrEnum):
     """StrEnum for attribute requirements."""
 
@@ -820,7 +4492,7 @@ class Attribute:
             "invalid attribute requirements: must be None or instance of"
             " AttributeRequirements"
         )
-        if self.table and self.from_:
+        if (self.table is not None) and self.from_:
             self.check_from()
 
     def check_from(self) -> pathlib.Path:
@@ -841,7 +4513,7 @@ class Attribute:
             "invalid attribute: doesn't have .from_ (check_from requires"
             " .from_)"
         )
-        assert self.table, (
+        assert self.table is not None, (
             "invalid attribute: doesn't have .table (check_from requires"
             " .table)"
         )
@@ -944,10 +4616,17 @@ class Attribute:
             f"invalid attribute: unknown attribute type {self.type_!r}"
         )
 
-    def verify_before_writing(self, obj: Any) -> None:
+    @property
+    def _format(self) -> TableFormat:
+        # Internal property, the format of the attribute's table (TEXT if the
+        # attribute doesn't have a table).
+        return TableFormat.TEXT if self.table is None else self.table.format
+
+    def verify_type(self, obj: Any) -> None:
         """
-        Verify that `obj` can be written to the table file. This checks the
-        types, and requirements (UNIQUE), and from.
+        Verify that `obj` has the attribute's type (and that it can be written
+        to the table file). Unlike `verify_before_writing`, this doesn't check
+        the requirements (UNIQUE) and from.
 
         Args:
             obj (Any): The object to check.
@@ -961,9 +4640,6 @@ class Attribute:
             isn't
             AssertionError: if the object is supposed to be string, but it
             isn't
-
-            Other exceptions may be raised by other
-            functions (Table.verify_requirements) called by this function.
         """
         if self.type_ == AttributeType.BOOLEAN:
             assert isinstance(
@@ -977,11 +4653,17 @@ class Attribute:
             assert isinstance(
                 obj, int
             ), f"invalid value at attribute {self.name}: invalid integer"
+            assert (self._format == TableFormat.TEXT) or (
+                -(2**63) <= obj < 2**63
+            ), (
+                f"invalid value at attribute {self.name}: integer doesn't fit"
+                " in 64 bits"
+            )
         elif self.type_ == AttributeType.STRING:
             assert isinstance(
                 obj, str
             ), f"invalid value at attribute {self.name}: invalid string"
-            assert ";;" not in obj, (
+            assert (self._format == TableFormat.BINARY) or (";;" not in obj), (
                 f"invalid value at attribute {self.name}: string contains"
                 " separator"
             )
@@ -989,24 +4671,90 @@ class Attribute:
             raise AssertionError(
                 f"invalid attribute: unknown attribute type {self.type_!r}"
             )
+
+    def verify_before_writing(self, obj: Any) -> None:
+        """
+        Verify that `obj` can be written to the table file. This checks the
+        types, and requirements (UNIQUE), and from.
+
+        Args:
+            obj (Any): The object to check.
+
+        Raises:
+            AssertionError: if the object is supposed to be boolean, but it
+            isn't
+            AssertionError: if the object is supposed to be float, but it
+            isn't
+            AssertionError: if the object is supposed to be integer, but it
+            isn't
+            AssertionError: if the object is supposed to be string, but it
+            isn't
+
+            Other exceptions may be raised by other
+            functions (Table.verify_requirements) called by this function.
+        """
+        self.verify_type(obj)
         if self.requirements:
-            assert self.table, "invalid attribute: doesn't have .table"
+            assert (
+                self.table is not None
+            ), "invalid attribute: doesn't have .table"
             self.table.verify_requirements(self, obj)
-        if self.from_ and self.table:
+        if self.from_ and (self.table is not None):
             self.table.verify_from(obj, self)
 
 
+def _is_table_name(name: str) -> bool:
+    # Internal function, table names must only consist of letters and digits.
+    return all(
+        val in stringlib.ascii_letters + stringlib.digits for val in name
+    )
+
+
 @dataclasses.dataclass(order=True, slots=True)
 class Database:
     """
-    The database class.
+    The database class. The tables are kept in a registry (by name), so
+    getting a table doesn't list the directory or read the table files. The
+    registry is refreshed when the directory changes.
 
     Args:
         directory (pathlib.Path | str): The database directory. The table
         files will be put in this directory.
+        persist_indexes (bool, optional): Passed to the tables, see `Table`.
+        Defaults to False.
+        tombstones (bool, optional): Passed to the tables, see `Table`.
+        Defaults to False.
+        file_lock (bool, optional): Passed to the tables, see `Table`.
+        Defaults to False.
+        wal (bool, optional): Passed to the tables, see `Table`. Defaults to
+        False.
+        fsync (FsyncPolicy, optional): Passed to the tables, see `Table`.
+        Defaults to FsyncPolicy.BATCH.
+        fsync_interval (float, optional): Passed to the tables, see `Table`.
+        Defaults to 1.0.
     """
 
     directory: pathlib.Path | str
+    persist_indexes: bool = False
+    tombstones: bool = False
+    file_lock: bool = False
+    wal: bool = False
+    fsync: FsyncPolicy = FsyncPolicy.BATCH
+    fsync_interval: float = 1.0
+
+    # the handles of the tables, with the (inode, ctime) and the first line
+    # of their table files when they were checked
+    _tables: dict[str, tuple[Table, tuple[int, int], bytes]] = (
+        dataclasses.field(
+            default_factory=dict, init=False, repr=False, compare=False
+        )
+    )
+    _listed: tuple[int, int] | None = dataclasses.field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _registry_lock: threading.Lock = dataclasses.field(
+        default_factory=threading.Lock, init=False, repr=False, compare=False
+    )
 
     def __post_init__(self) -> None:
         if isinstance(self.directory, str):
@@ -1022,16 +4770,83 @@ class Database:
     @property
     def tables(self) -> list[Table]:
         """
-        Returns all of the tables in the database.
+        Returns all of the tables in the database. Files that can't be tables
+        (their names aren't valid table names, like the index files) are
+        skipped.
 
         Returns:
             list[Table]: A list of tables in the database.
         """
         assert isinstance(self.directory, pathlib.Path)
-        return [Table(file) for file in self.directory.iterdir()]
+        stat = self.directory.stat()
+        listed = (stat.st_ino, stat.st_mtime_ns)
+        with self._registry_lock:
+            if listed != self._listed:
+                # the directory changed, the tables that still exist are kept
+                names = {
+                    file.name
+                    for file in self.directory.iterdir()
+                    if _is_table_name(file.name)
+                }
+                for name in set(self._tables) - names:
+                    del self._tables[name]
+                for name in sorted(names):
+                    self._registered(name)
+                self._tables = dict(sorted(self._tables.items()))
+                self._listed = listed
+            return [table for table, _, _ in self._tables.values()]
+
+    def _registered(
+        self, table_name: str, table: Table | None = None
+    ) -> Table:
+        # Internal function, returns the handle of the table in the registry
+        # (or registers `table`). If the table file changed since it was
+        # checked, the handle is only kept if its attributes (the first line)
+        # didn't change, otherwise the table was removed and added again (by
+        # another database or process), so a new handle is opened. The
+        # registry lock must be held.
+        assert isinstance(self.directory, pathlib.Path)
+        file = self.directory / table_name
+        stat = file.stat()
+        stamp = (stat.st_ino, stat.st_ctime_ns)
+        entry = self._tables.get(table_name)
+        if (table is None) and (entry is not None) and (entry[1] == stamp):
+            return entry[0]
+        with file.open("rb") as handle:
+            first_line = handle.readline()
+        if table is None:
+            if (entry is not None) and (entry[2] == first_line):
+                table = entry[0]
+            else:
+                if entry is not None:
+                    # the indexes of the old table don't fit the new one
+                    lock, state = _get_shared(file.resolve())
+                    with lock, state.mutex:
+                        state.indexes.clear()
+                        state.reset(None)
+                table = self._open(table_name)
+        self._tables[table_name] = (table, stamp, first_line)
+        return table
+
+    def _open(self, table_name: str) -> Table:
+        # Internal function, returns a new Table of the table file.
+        assert isinstance(self.directory, pathlib.Path)
+        return Table(
+            self.directory / table_name,
+            persist_indexes=self.persist_indexes,
+            tombstones=self.tombstones,
+            file_lock=self.file_lock,
+            wal=self.wal,
+            fsync=self.fsync,
+            fsync_interval=self.fsync_interval,
+        )
 
     def add_table(
-        self, table_name: str, table_attributes: list[Attribute]
+        self,
+        table_name: str,
+        table_attributes: list[Attribute],
+        *,
+        table_format: TableFormat = TableFormat.TEXT,
     ) -> Table:
         """
         Add a table to the database.
@@ -1048,39 +4863,47 @@ class Database:
             table_name (str): The table's name. Must only consist of
             letters and digits `[a-zA-Z0-9]`
             table_attributes (list[Attribute]): The table's attributes.
+            table_format (TableFormat, optional): The table file's format.
+            BINARY tables store the rows length-prefixed, so they are parsed
+            faster, and their strings can contain the separator (`;;`).
+            Defaults to TableFormat.TEXT.
 
         Returns:
             Table: The new table.
         """
         assert isinstance(self.directory, pathlib.Path)
-        assert all(
-            val in stringlib.ascii_letters + stringlib.digits
-            for val in table_name
+        assert _is_table_name(
+            table_name
         ), f"invalid table name: {table_name!r}"
         assert all(isinstance(val, Attribute) for val in table_attributes), (
             "invalid table attribute: must be a list of Attribute, got"
             f" {table_attributes!r}"
         )
         assert table_attributes, "invalid table attributes: empty"
-        assert unique(
-            self.tables + [table_name]
-        ), "invalid table name: already exists"
         assert unique(
             [attr.name for attr in table_attributes]
         ), "invalid table attributes: an attribute name was reused"
         table_path = self.directory / table_name
         assert not table_path.exists(), "table with that name already exists"
-        table_path.write_text(
-            f"BCDB {';;'.join(attr.to_str() for attr in table_attributes)}\n"
+        magic = (
+            _BinaryCodec.magic
+            if TableFormat(table_format) == TableFormat.BINARY
+            else _TextCodec.magic
         )
-        table = Table(table_path)
+        header = ";;".join(attr.to_str() for attr in table_attributes)
+        table_path.write_bytes(magic + f"{header}\n".encode("utf-8"))
+        _mark_written(table_path.resolve())
+        table = self._open(table_name)
         for attr in table_attributes:
             attr.table = table
+        with self._registry_lock:
+            self._registered(table_name, table)
         return table
 
     def get_table(self, table_name: str) -> Table:
         """
-        Get the table with the name `table_name`.
+        Get the table with the name `table_name`. Only that table file is
+        checked, the other tables aren't listed or opened.
 
         Args:
             table_name (str): The table's name to return.
@@ -1091,12 +4914,12 @@ class Database:
         Returns:
             Table: The table.
         """
-        for table in self.tables:
-            if table_name == table.name:
-                return table
-        raise AssertionError(
-            f"invalid table: no table found with name {table_name!r}"
-        )
+        assert isinstance(self.directory, pathlib.Path)
+        assert _is_table_name(table_name) and (
+            (self.directory / table_name).is_file()
+        ), f"invalid table: no table found with name {table_name!r}"
+        with self._registry_lock:
+            return self._registered(table_name)
 
     def remove_table(self, table_name: str) -> None:
         """
@@ -1110,10 +4933,522 @@ class Database:
             table_name (str): The table's name to remove.
         """
         assert isinstance(self.directory, pathlib.Path)
-        assert all(
-            val in stringlib.ascii_letters + stringlib.digits
-            for val in table_name
+        assert _is_table_name(
+            table_name
         ), f"invalid table name: {table_name!r}"
         table_path = self.directory / table_name
         assert table_path.exists(), "table with that name doesn't exist"
-        table_path.unlink(missing_ok=False)
+        lock, state = _get_shared(table_path.resolve())
+        with self._registry_lock:
+            self._tables.pop(table_name, None)
+        with lock:
+            table_path.unlink(missing_ok=False)
+            # a new table with the same name may have other attributes
+            state.indexes.clear()
+            state.reset(None)
+        table_path.with_name(f"{table_name}.index").unlink(missing_ok=True)
+        table_path.with_name(f"{table_name}.tombstones").unlink(
+            missing_ok=True
+        )
+        table_path.with_name(f"{table_name}.wal").unlink(missing_ok=True)
+        _mark_written(table_path.resolve())
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator["Transaction"]:
+        """
+        Add rows to multiple tables at once. The rows added to the transaction
+        are only written when the with statement ends (without an exception):
+        they are verified together, and either all or none of them are added.
+        For example a row of a table and the rows that reference it (`from_`)
+        can be added in one transaction.
+
+        Raises:
+            Exceptions may be raised by other functions (Transaction.commit)
+            called by this function.
+
+        Yields:
+            Transaction: The transaction.
+        """
+        transaction = Transaction(self)
+        yield transaction
+        transaction.commit()
+
+
+@dataclasses.dataclass
+class Transaction:
+    """
+    Rows that are added to the tables of a database at once, see
+    `Database.transaction`.
+
+    When the transaction is committed, the locks of the tables (and the tables
+    that they reference with `from_`) are acquired in the order of their
+    paths, so the transactions can't deadlock each other. Then the rows are
+    verified (`from_` also accepts the rows added to the referenced table in
+    the transaction), and each table file is appended to once. If a write
+    fails, the table files that were already appended to are truncated.
+
+    Args:
+        database (Database): The database.
+    """
+
+    database: Database
+
+    _rows: dict[str, list[tuple[Any, ...]]] = dataclasses.field(
+        default_factory=dict, init=False, repr=False
+    )
+
+    def add_row(self, table_name: str, row: tuple[Any, ...]) -> None:
+        """
+        Add a row to the table in the transaction.
+
+        Args:
+            table_name (str): The table's name.
+            row (tuple[Any, ...]): The row.
+
+        Raises:
+            AssertionError: if the row is invalid (its types, see
+            `Attribute.verify_type`, the other requirements are checked when
+            the transaction is committed)
+
+            Other exceptions may be raised by other functions
+            (Database.get_table) called by this function.
+        """
+        self.add_rows(table_name, [row])
+
+    def add_rows(
+        self, table_name: str, rows: Iterable[tuple[Any, ...]]
+    ) -> None:
+        """
+        Add rows to the table in the transaction.
+
+        Args:
+            table_name (str): The table's name.
+            rows (Iterable[tuple[Any, ...]]): The rows.
+
+        Raises:
+            AssertionError: if a row is invalid (see `add_row`)
+
+            Other exceptions may be raised by other functions
+            (Database.get_table) called by this function.
+        """
+        table = self.database.get_table(table_name)
+        rows = list(rows)
+        for row in rows:
+            assert len(row) == len(table.attributes), (
+                f"invalid value for table {table.name}: invalid number of"
+                f" columns, expected {len(table.attributes)}, got {len(row)}"
+            )
+            for attr, column in zip(table.attributes, row):
+                attr.verify_type(column)
+        self._rows.setdefault(table_name, []).extend(rows)
+
+    def commit(self) -> None:
+        """
+        Verify and write the rows, and empty the transaction. This is called
+        by `Database.transaction`.
+
+        Raises:
+            AssertionError: if a row is invalid (`from_`, UNIQUE); nothing is
+            written
+
+            Other exceptions may be raised by other functions (Table._append)
+            called by this function. Nothing is written then either.
+        """
+        tables = {
+            name: self.database.get_table(name)
+            for name, rows in self._rows.items()
+            if rows
+        }
+        referenced = {
+            attr.check_from().resolve()
+            for table in tables.values()
+            for attr in table.attributes
+            if attr.from_
+        }
+        written = {table.path: table for table in tables.values()}
+        with contextlib.ExitStack() as stack:
+            # in the same order in every transaction
+            for path in sorted(written.keys() | referenced):
+                if path in written:
+                    stack.enter_context(written[path].lock)
+                else:
+                    stack.enter_context(
+                        self.database.get_table(path.name)._read_lock()
+                    )
+            for name, table in tables.items():
+                self._verify(table, self._rows[name])
+            sizes: dict[Table, int] = {}
+            try:
+                for path in sorted(written):
+                    table = written[path]
+                    sizes[table] = table.file.stat().st_size
+                    table._append(self._rows[table.name])
+            except BaseException:
+                for table, size in sizes.items():
+                    table._truncate(size)
+                raise
+        self._rows.clear()
+
+    def _verify(self, table: Table, rows: list[tuple[Any, ...]]) -> None:
+        # Internal function, verifies the `from_` and UNIQUE attributes of the
+        # rows of the table. The locks must be held.
+        referenced = {}
+        for idx, attr in enumerate(table.attributes):
+            if attr.from_:
+                values = table._referenced_values(attr)
+                if attr.from_ in self._rows:
+                    from_idx = self.database.get_table(
+                        attr.from_
+                    ).get_attribute_index(attr.name)
+                    values = values.union(
+                        row[from_idx] for row in self._rows[attr.from_]
+                    )
+                referenced[idx] = values
+        for rownum, row in enumerate(rows):
+            for idx, values in referenced.items():
+                assert row[idx] in values, (
+                    f"invalid row for transaction on table {table.name} at"
+                    f" index {rownum} ({row}): invalid value for attribute"
+                    f" {table.attributes[idx].name}: {row[idx]!r} does not"
+                    f" exist in from table {table.attributes[idx].from_}"
+                )
+        violation = table._unique_violation(rows, {})
+        if violation is not None:
+            raise AssertionError(
+                f"invalid row for transaction on table {table.name} at index"
+                f" {violation[0]} ({rows[violation[0]]}): {violation[1]}"
+            )
+
+
+@dataclasses.dataclass
+class Compactor:
+    """
+    Compacts tables (see `Table.compact`) in a background thread. The tables
+    are checked every `interval` seconds, and the ones that have at least
+    `threshold` dead rows are compacted.
+
+    Args:
+        tables (Database | Collection[Table]): The tables to compact. The
+        tables of a database are listed again before every check.
+        interval (float, optional): The number of seconds between the checks.
+        Defaults to 60.0.
+        threshold (int, optional): The minimum number of dead rows that a
+        table must have to be compacted. Defaults to 1.
+        callback (Callable[[Table, int], None] | None, optional): Called with
+        the table and the number of bytes reclaimed after a table was
+        compacted. Defaults to None.
+    """
+
+    tables: Database | Collection[Table]
+    interval: float = 60.0
+    threshold: int = 1
+    callback: Callable[[Table, int], None] | None = None
+
+    reclaimed: int = dataclasses.field(default=0, init=False)
+    error: Exception | None = dataclasses.field(default=None, init=False)
+    _stopped: threading.Event = dataclasses.field(
+        default_factory=threading.Event, init=False, repr=False
+    )
+    _thread: threading.Thread | None = dataclasses.field(
+        default=None, init=False, repr=False
+    )
+
+    def run_once(self) -> int:
+        """
+        Compact the tables that have at least `threshold` dead rows.
+
+        Raises:
+            Exceptions may be raised by other functions (Table.compact) called
+            by this function.
+
+        Returns:
+            int: The number of bytes reclaimed.
+        """
+        tables = (
+            self.tables.tables
+            if isinstance(self.tables, Database)
+            else self.tables
+        )
+        reclaimed = 0
+        for table in tables:
+            if len(table._dead_offsets()) < max(self.threshold, 1):
+                continue
+            table_reclaimed = table.compact()
+            reclaimed += table_reclaimed
+            self.reclaimed += table_reclaimed
+            if self.callback is not None:
+                self.callback(table, table_reclaimed)
+        return reclaimed
+
+    def start(self) -> None:
+        """
+        Start the background thread.
+
+        Raises:
+            AssertionError: if it's already running
+        """
+        assert (
+            self._thread is None or not self._thread.is_alive()
+        ), "invalid compactor: already running"
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="bcdb-compactor", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """
+        Stop the background thread, and wait for it to finish.
+
+        Args:
+            timeout (float | None, optional): The maximum number of seconds to
+            wait. Defaults to None (wait forever).
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        # Internal function, the background thread. The errors are saved to
+        # `error`, and the compactor keeps running.
+        while not self._stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as exc:  # pylint: disable=broad-except
+                self.error = exc
+
+
+class AsyncDatabase:
+    """
+    An asyncio facade of a database: the calls run on a bounded thread pool,
+    so they don't block the event loop. The writes to a table wait for each
+    other in the event loop (on an `asyncio.Lock`), so they don't take up
+    the threads of the pool while they wait for the table's lock (unless the
+    table uses a write-ahead log, whose group commits need concurrent
+    writes).
+
+    Args:
+        database (Database | pathlib.Path | str): The database (or its
+        directory).
+        max_workers (int, optional): The maximum number of threads. Defaults
+        to 4.
+    """
+
+    def __init__(
+        self, database: Database | pathlib.Path | str, max_workers: int = 4
+    ) -> None:
+        assert (
+            max_workers > 0
+        ), f"invalid max_workers: must be positive, got {max_workers!r}"
+        self.database = (
+            database if isinstance(database, Database) else Database(database)
+        )
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers, thread_name_prefix="bcdb"
+        )
+        self._write_locks: dict[pathlib.Path, asyncio.Lock] = {}
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *_: object) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Wait for the running calls, and stop the threads."""
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._executor.shutdown
+        )
+
+    async def _run(
+        self, func: Callable[..., Any], *args: Any, **kwargs: Any
+    ) -> Any:
+        # Internal function, calls the function in the thread pool.
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    def _write_lock(self, table: Table) -> Any:
+        # Internal function, returns the asyncio lock of the writes to the
+        # table.
+        if table.wal:
+            return contextlib.nullcontext()
+        return self._write_locks.setdefault(table.path, asyncio.Lock())
+
+    async def add_table(
+        self,
+        table_name: str,
+        table_attributes: list[Attribute],
+        *,
+        table_format: TableFormat = TableFormat.TEXT,
+    ) -> "AsyncTable":
+        """
+        See `Database.add_table`.
+
+        Returns:
+            AsyncTable: The new table.
+        """
+        table = await self._run(
+            self.database.add_table,
+            table_name,
+            table_attributes,
+            table_format=table_format,
+        )
+        return AsyncTable(table, self)
+
+    async def get_table(self, table_name: str) -> "AsyncTable":
+        """
+        See `Database.get_table`.
+
+        Returns:
+            AsyncTable: The table.
+        """
+        return AsyncTable(
+            await self._run(self.database.get_table, table_name), self
+        )
+
+    async def remove_table(self, table_name: str) -> None:
+        """See `Database.remove_table`."""
+        await self._run(self.database.remove_table, table_name)
+
+
+class AsyncTable:
+    """
+    An asyncio facade of a table, see `AsyncDatabase`. It's returned by
+    `AsyncDatabase.add_table` and `AsyncDatabase.get_table`.
+
+    Args:
+        table (Table): The table.
+        database (AsyncDatabase): The database whose thread pool is used.
+    """
+
+    def __init__(self, table: Table, database: AsyncDatabase) -> None:
+        self.table = table
+        self.database = database
+
+    async def _write(
+        self, func: Callable[..., Any], *args: Any, **kwargs: Any
+    ) -> Any:
+        # Internal function, calls the function that writes to the table in
+        # the thread pool.
+        async with self.database._write_lock(self.table):
+            return await self.database._run(func, *args, **kwargs)
+
+    async def _iterate(
+        self, func: Callable[..., Iterator[Any]], *args: Any, **kwargs: Any
+    ) -> AsyncIterator[Any]:
+        # Internal function, iterates over the iterator returned by the
+        # function in the thread pool, in batches.
+        iterator = await self.database._run(func, *args, **kwargs)
+        try:
+            while True:
+                batch = await self.database._run(
+                    list, itertools.islice(iterator, _SCAN_BATCH_SIZE)
+                )
+                for item in batch:
+                    yield item
+                if len(batch) < _SCAN_BATCH_SIZE:
+                    return
+        finally:
+            await self.database._run(iterator.close)
+
+    async def get_rows(
+        self, *, columns: Iterable[str] | None = None
+    ) -> list[tuple[Any, ...]]:
+        """
+        See `Table.get_rows`.
+
+        Returns:
+            list[tuple[Any, ...]]: The rows.
+        """
+        return await self.database._run(self.table.get_rows, columns=columns)
+
+    def iter_rows(
+        self, *, columns: Iterable[str] | None = None
+    ) -> AsyncIterator[tuple[Any, ...]]:
+        """
+        See `Table.iter_rows`. The rows are read in batches in the thread pool.
+
+        Returns:
+            AsyncIterator[tuple[Any, ...]]: The rows.
+        """
+        return self._iterate(self.table.iter_rows, columns=columns)
+
+    def iter_map(
+        self, func: Callable[[tuple[Any, ...]], tuple[Any, ...] | None]
+    ) -> AsyncIterator[tuple[Any, ...]]:
+        """
+        See `Table.iter_map`. `func` is called in the thread pool.
+
+        Returns:
+            AsyncIterator[tuple[Any, ...]]: The new rows.
+        """
+        return self._iterate(self.table.iter_map, func)
+
+    def iter_filter(self, func: Where) -> AsyncIterator[tuple[Any, ...]]:
+        """
+        See `Table.iter_filter`. `func` is called in the thread pool.
+
+        Returns:
+            AsyncIterator[tuple[Any, ...]]: The retained rows.
+        """
+        return self._iterate(self.table.iter_filter, func)
+
+    async def get_rows_where(
+        self, attribute_name: str, attribute_value: Any
+    ) -> list[tuple[Any, ...]]:
+        """
+        See `Table.get_rows_where`.
+
+        Returns:
+            list[tuple[Any, ...]]: The rows.
+        """
+        return await self.database._run(
+            self.table.get_rows_where, attribute_name, attribute_value
+        )
+
+    async def add_row(self, row: tuple[Any, ...]) -> None:
+        """See `Table.add_row`."""
+        await self._write(self.table.add_row, row)
+
+    async def add_rows(self, rows: Iterable[tuple[Any, ...]]) -> None:
+        """See `Table.add_rows`."""
+        await self._write(self.table.add_rows, list(rows))
+
+    async def remove_rows(self, where: Where, *, limit: int = 1000) -> int:
+        """
+        See `Table.remove_rows`.
+
+        Returns:
+            int: The number of rows removed.
+        """
+        return await self._write(self.table.remove_rows, where, limit=limit)
+
+    async def map(  # noqa: A003
+        self,
+        func: Callable[[tuple[Any, ...]], tuple[Any, ...] | None],
+        *,
+        write: bool = False,
+    ) -> list[tuple[Any, ...]]:
+        """
+        See `Table.map`. `func` is called in the thread pool.
+
+        Returns:
+            list[tuple[Any, ...]]: The new rows.
+        """
+        if write:
+            return await self._write(self.table.map, func, write=True)
+        return await self.database._run(self.table.map, func)
+
+    async def filter(  # noqa: A003
+        self, func: Where, *, write: bool = False
+    ) -> list[tuple[Any, ...]]:
+        """
+        See `Table.filter`. `func` is called in the thread pool.
+
+        Returns:
+            list[tuple[Any, ...]]: The retained rows.
+        """
+        if write:
+            return await self._write(self.table.filter, func, write=True)
+        return await self.database._run(self.table.filter, func)
@@ -19,8 +19,13 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 # pylint: disable=missing-function-docstring,missing-class-docstring
 # pylint: disable=redefined-outer-name
 #                 ^^^^^^^^^^^^^^^^^^^^ for fixtures
+import asyncio
+import os
 import pathlib
 import secrets
+import threading
+import time
+from typing import Any
 
 import pytest
 
@@ -40,6 +45,14 @@ def table_file(file: pathlib.Path) -> pathlib.Path:
     return file
 
 
+def _is_even(row: tuple[Any, ...]) -> bool:
+    return row[0] % 2 == 0
+
+
+def _double(row: tuple[Any, ...]) -> tuple[Any, ...]:
+    return (row[0] * 2, *row[1:])
+
+
 class TestTable:
     @staticmethod
     def test_post_init_good(table_file: pathlib.Path) -> None:
@@ -340,6 +353,41 @@ class TestTable:
         ):
             table2.verify_from(1, "user_id")
 
+    @staticmethod
+    def test_verify_from_cached(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        db = bcdb.Database(tmp_path)
+        users = db.add_table(
+            "users",
+            [
+                bcdb.Attribute("name", bcdb.AttributeType.STRING),
+                bcdb.Attribute("id", bcdb.AttributeType.INTEGER),
+            ],
+        )
+        users.add_rows([("alice", 1), ("bob", 2)])
+        # "id" is the 1st column here, but the 2nd one in users
+        posts = db.add_table(
+            "posts",
+            [
+                bcdb.Attribute(
+                    "id", bcdb.AttributeType.INTEGER, from_="users"
+                ),
+                bcdb.Attribute("text", bcdb.AttributeType.STRING),
+            ],
+        )
+        posts.add_row((1, "hello"))
+        monkeypatch.setattr(bcdb.Table, "get_column", None)
+        posts.add_row((2, "world"))
+        with pytest.raises(AssertionError, match=r"3 does not exist"):
+            posts.add_row((3, "!"))
+        monkeypatch.undo()
+        users.add_row(("carol", 3))
+        posts.add_row((3, "!"))
+        users.remove_row(lambda row: row[1] == 1)
+        with pytest.raises(AssertionError, match=r"1 does not exist"):
+            posts.verify_from(1, "id")
+
     @staticmethod
     def test_get_rows_and_add_row(tmp_path: pathlib.Path) -> None:
         db = bcdb.Database(tmp_path)
@@ -404,6 +452,57 @@ class TestTable:
         with pytest.raises(AssertionError, match=r"invalid number of columns"):
             table.add_rows([(), (1.0,)])
 
+    @staticmethod
+    def test_add_rows_batch(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        db = bcdb.Database(tmp_path)
+        users = db.add_table(
+            "users", [bcdb.Attribute("name", bcdb.AttributeType.STRING)]
+        )
+        users.add_rows([("alice",), ("bob",)])
+        table = db.add_table(
+            "table",
+            [
+                bcdb.Attribute(
+                    "id",
+                    bcdb.AttributeType.INTEGER,
+                    bcdb.AttributeRequirements.UNIQUE,
+                ),
+                bcdb.Attribute(
+                    "name", bcdb.AttributeType.STRING, from_="users"
+                ),
+            ],
+        )
+        get_column = bcdb.Table.get_column
+        calls: list[str] = []
+
+        def counting_get_column(self: bcdb.Table, name: str) -> list[Any]:
+            calls.append(self.name)
+            return get_column(self, name)
+
+        monkeypatch.setattr(bcdb.Table, "get_column", counting_get_column)
+        table.add_rows([(1, "alice"), (2, "bob"), (3, "alice")])
+        assert calls == ["users"]
+        with pytest.raises(
+            AssertionError, match=r"index 1 .*appears on row 3"
+        ):
+            table.add_rows([(4, "bob"), (2, "bob")])
+        with pytest.raises(
+            AssertionError, match=r"index 2 .*appears at index 0 of the rows"
+        ):
+            table.add_rows([(4, "bob"), (5, "bob"), (4, "alice")])
+        with pytest.raises(
+            AssertionError, match=r"index 1 .*not exist in from table users"
+        ):
+            table.add_rows([(4, "bob"), (5, "carol")])
+        with pytest.raises(AssertionError, match=r"index 0 .*invalid integer"):
+            table.add_rows([("4", "bob")])
+        # nothing was added by the invalid batches
+        assert table.get_column("id") == [1, 2, 3]
+        table.add_rows(iter([(4, "bob"), (5, "bob")]))
+        assert table.get_row_where("id", 5) == (5, "bob")
+
     @staticmethod
     def test_get_rows_notenough(tmp_path: pathlib.Path) -> None:
         db = bcdb.Database(tmp_path)
@@ -441,6 +540,553 @@ class TestTable:
         with pytest.raises(AssertionError, match=r"too many columns on row 2"):
             table.get_rows()
 
+    @staticmethod
+    def test_get_rows_cached(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        db = bcdb.Database(tmp_path)
+        table = db.add_table(
+            "table", [bcdb.Attribute("testattr1", bcdb.AttributeType.INTEGER)]
+        )
+        table.add_rows([(1,), (2,)])
+        assert table.get_rows() == [(1,), (2,)]
+        with monkeypatch.context() as mp:
+            mp.setattr(pathlib.Path, "read_text", None)
+            assert table.get_rows() == [(1,), (2,)]
+            assert bcdb.Table(table.file).get_rows() == [(1,), (2,)]
+        # written by this process
+        table.add_row((3,))
+        assert table.get_rows() == [(1,), (2,), (3,)]
+        # written by someone else
+        with table.file.open("a", encoding="utf-8") as file:
+            file.write("4\n")
+        assert table.get_rows() == [(1,), (2,), (3,), (4,)]
+        table.remove_row(lambda row: row[0] == 1)
+        assert table.get_rows() == [(2,), (3,), (4,)]
+
+    @staticmethod
+    def test_iter_rows(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        db = bcdb.Database(tmp_path)
+        table = db.add_table(
+            "table",
+            [
+                bcdb.Attribute("testattr1", bcdb.AttributeType.STRING),
+                bcdb.Attribute("testattr2", bcdb.AttributeType.INTEGER),
+            ],
+        )
+        rows = [("Hello\nworld\r", 1), ("", -2), ("x", 3)]
+        table.add_rows(rows)
+        assert list(table.iter_rows()) == rows
+        bcdb.row_cache.clear()
+        monkeypatch.setattr(bcdb.row_cache, "max_bytes", 0)
+        monkeypatch.setattr(pathlib.Path, "read_bytes", None)
+        iterator = table.iter_rows()
+        assert next(iterator) == rows[0]
+        table.add_row(("added", 4))
+        assert list(iterator) == rows[1:]
+        assert list(table.iter_rows()) == rows + [("added", 4)]
+        with table.file.open("a", encoding="utf-8") as file:
+            file.write("a;;1;;b\n")
+        with pytest.raises(AssertionError, match=r"too many columns on row 6"):
+            list(table.iter_rows())
+
+    @staticmethod
+    def test_iter_rows_batches(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        db = bcdb.Database(tmp_path)
+        table = db.add_table(
+            "table",
+            [bcdb.Attribute("testattr1", bcdb.AttributeType.INTEGER)],
+        )
+        table.add_rows([(1,), (2,), (3,), (4,)])
+        bcdb.row_cache.clear()
+        monkeypatch.setattr(bcdb.row_cache, "max_bytes", 0)
+        monkeypatch.setattr(bcdb, "_SCAN_BATCH_SIZE", 1)
+        assert table.get_rows_where("testattr1", 3) == [(3,)]
+        iterator = table.iter_rows()
+        assert next(iterator) == (1,)
+        assert next(iterator) == (2,)
+        # the table is rewritten (and shrinks) while it's iterated, but the
+        # iteration reads a snapshot
+        table.remove_row(lambda row: row[0] == 4)
+        assert list(iterator) == [(3,), (4,)]
+        assert list(table.iter_rows()) == [(1,), (2,), (3,)]
+
+    @staticmethod
+    @pytest.mark.parametrize("max_bytes", [0, 1024])
+    def test_snapshot(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, max_bytes: int
+    ) -> None:
+        monkeypatch.setattr(bcdb.row_cache, "max_bytes", max_bytes)
+        db = bcdb.Database(tmp_path, tombstones=True)
+        table = db.add_table(
+            "table",
+            [
+                bcdb.Attribute("a", bcdb.AttributeType.INTEGER),
+                bcdb.Attribute("b", bcdb.AttributeType.STRING),
+            ],
+        )
+        table.add_rows([(1, "x"), (2, "y")])
+        with table.snapshot() as snapshot:
+            table.add_row((3, "z"))
+            table.remove_row(lambda row: row[0] == 1)
+            assert table.get_rows() == [(2, "y"), (3, "z")]
+            assert snapshot.get_rows() == [(1, "x"), (2, "y")]
+            table.compact()
+            table.write_rows([(4, "w")], i_know_what_im_doing=True)
+            assert snapshot.get_rows(columns=["b"]) == [("x",), ("y",)]
+        with table.snapshot() as snapshot:
+            assert snapshot.get_rows() == [(4, "w")]
+
+    @staticmethod
+    @pytest.mark.parametrize("table_format", list(bcdb.TableFormat))
+    def test_parallel(
+        tmp_path: pathlib.Path,
+        monkeypatch: pytest.MonkeyPatch,
+        table_format: bcdb.TableFormat,
+    ) -> None:
+        db = bcdb.Database(tmp_path, tombstones=True)
+        table = db.add_table(
+            "table",
+            [
+                bcdb.Attribute("a", bcdb.AttributeType.INTEGER),
+                bcdb.Attribute("b", bcdb.AttributeType.STRING),
+            ],
+            table_format=table_format,
+        )
+        rows = [(idx, f"row{idx}") for idx in range(100)]
+        table.add_rows(rows)
+        table.remove_rows(lambda row: row[0] % 10 == 0)
+        rows = [row for row in rows if row[0] % 10]
+        # cached: parsed by this process
+        assert table.get_rows(processes=3) == rows
+        monkeypatch.setattr(bcdb.row_cache, "max_bytes", 0)
+        bcdb.row_cache.clear()
+        assert table.get_rows(processes=3) == rows
+        assert table.get_rows(columns=["b"], processes=1) == [
+            (row[1],) for row in rows
+        ]
+        assert table.filter(_is_even, processes=4) == [
+            row for row in rows if _is_even(row)
+        ]
+        assert table.map(_double, processes=2) == [
+            (row[0] * 2, row[1]) for row in rows
+        ]
+        with pytest.raises(Exception):
+            # lambdas can't be pickled
+            table.filter(lambda row: True, processes=2)
+        # the errors have the same row numbers
+        with table.file.open("ab") as file:
+            file.write(
+                b"\x07\x00\x00\x00a"
+                if table.format == bcdb.TableFormat.BINARY
+                else b"1\n"
+            )
+        with pytest.raises(AssertionError) as serial:
+            table.get_rows()
+        with pytest.raises(AssertionError) as parallel:
+            table.get_rows(processes=2)
+        assert str(parallel.value) == str(serial.value)
+
+    @staticmethod
+    @pytest.mark.parametrize("table_format", list(bcdb.TableFormat))
+    def test_query(
+        tmp_path: pathlib.Path,
+        monkeypatch: pytest.MonkeyPatch,
+        table_format: bcdb.TableFormat,
+    ) -> None:
+        db = bcdb.Database(tmp_path)
+        table = db.add_table(
+            "table",
+            [
+                bcdb.Attribute(
+                    "id",
+                    bcdb.AttributeType.INTEGER,
+                    bcdb.AttributeRequirements.UNIQUE,
+                ),
+                bcdb.Attribute("age", bcdb.AttributeType.INTEGER),
+                bcdb.Attribute("name", bcdb.AttributeType.STRING),
+            ],
+            table_format=table_format,
+        )
+        rows = [(idx, idx % 50, f"{'ab'[idx % 2]}{idx}") for idx in range(100)]
+        table.add_rows(rows)
+        Q = bcdb.Q  # noqa: N806
+        monkeypatch.setattr(bcdb.row_cache, "max_bytes", 0)
+        bcdb.row_cache.clear()
+        # scan: only "age" and "name" are converted before they're checked
+        condition = (Q("age") > 45) & Q("name").startswith("a")
+        expected = [row for row in rows if row[1] > 45 and row[2][0] == "a"]
+        assert table.filter(condition) == expected
+        assert list(table.iter_filter(condition)) == expected
+        assert table.filter(~condition | (Q("id") == 0)) == [
+            row for row in rows if row not in expected or row[0] == 0
+        ]
+        # UNIQUE attributes are indexed
+        with table._read_lock(), table._state.mutex:
+            assert table._plan(Q("id").isin([3, 1]) & (Q("age") < 2)) == (
+                bcdb._Plan("id", values=frozenset([1, 3]))
+            )
+            assert table._plan(condition) == bcdb._Plan()
+        assert table.filter(Q("id").isin([3, 1]) & (Q("age") < 2)) == [rows[1]]
+        table.create_index("age", ordered=True)
+        with table._read_lock(), table._state.mutex:
+            assert table._plan(condition & (Q("age") <= 48)) == bcdb._Plan(
+                "age", bounds=(45, 48)
+            )
+        assert table.filter(Q("age").between(3, 4) & (Q("age") != 4)) == [
+            rows[3],
+            rows[53],
+        ]
+        # "not" and "or" conditions are checked, but can't use an index
+        with table._read_lock(), table._state.mutex:
+            assert table._plan(~(Q("age") == 1)) == bcdb._Plan()
+            assert (
+                table._plan(
+                    ((Q("id") == 1) | (Q("id") == 2)) & ~(Q("age") > 3)
+                )
+                == bcdb._Plan()
+            )
+        assert table.filter(~(Q("age") > 1)) == [
+            row for row in rows if row[1] <= 1
+        ]
+        assert table.filter((Q("age") > 47) & ~(Q("name") == "a48")) == [
+            row for row in rows if row[1] > 47 and row[2] != "a48"
+        ]
+        assert table.filter(
+            ((Q("id") == 1) | (Q("id") == 2)) & (Q("id") != 2)
+        ) == [rows[1]]
+        assert table.remove_rows(~(Q("age") < 49)) == 2
+        assert table.aggregate(("count", None), where=~(Q("age") < 48)) == (2,)
+        # lambdas still work, conditions can remove rows
+        assert table.filter(lambda row: row[0] < 2) == rows[:2]
+        assert table.remove_rows(Q("age") >= 2) == 94
+        assert table.get_rows() == [rows[0], rows[1], rows[50], rows[51]]
+        with pytest.raises(TypeError):
+            (Q("age") > 1) and (Q("age") < 5)  # noqa: B015
+        with pytest.raises(AssertionError, match="doesn't exist"):
+            table.filter(Q("nope") == 1)
+
+    @staticmethod
+    def test_plain_lock(tmp_path: pathlib.Path) -> None:
+        db = bcdb.Database(tmp_path)
+        table = db.add_table(
+            "table", [bcdb.Attribute("a", bcdb.AttributeType.INTEGER)]
+        )
+        table = bcdb.Table(table.file, lock=threading.Lock(), tombstones=True)
+        table.add_rows([(idx,) for idx in range(10)])
+        Q = bcdb.Q  # noqa: N806
+        done: list[bool] = []
+
+        def _run() -> None:
+            # the lock isn't acquired again while it's held
+            assert table.filter(Q("a") > 1, write=True) == [
+                (idx,) for idx in range(2, 10)
+            ]
+            table.create_index("a")
+            assert table.filter(Q("a").isin([2, 3, 4]), write=True) == [
+                (2,),
+                (3,),
+                (4,),
+            ]
+            table.remove_row(Q("a") == 3)
+            with table.lock:
+                assert table._compact(lock=False)
+            assert table.get_rows() == [(2,), (4,)]
+            done.append(True)
+
+        thread = threading.Thread(target=_run, daemon=True)
+        thread.start()
+        thread.join(10)
+        assert done
+
+    @staticmethod
+    @pytest.mark.parametrize(
+        "operation",
+        [
+            lambda table: table.get_rows() == [(1,), (2,)],
+            lambda table: table.write_rows([(3,)], i_know_what_im_doing=True)
+            is None,
+            lambda table: table.remove_rows(lambda row: row[0] == 1) == 1,
+            lambda table: table.create_index("a") is None,
+            lambda table: table.filter(bcdb.Q("a") == 2, write=True) == [(2,)],
+            lambda table: table.map(lambda row: (row[0] * 2,), write=True)
+            == [(2,), (4,)],
+        ],
+    )
+    def test_plain_lock_new_handle(
+        tmp_path: pathlib.Path, operation: Any
+    ) -> None:
+        db = bcdb.Database(tmp_path)
+        table = db.add_table(
+            "table", [bcdb.Attribute("a", bcdb.AttributeType.INTEGER)]
+        )
+        table.add_rows([(1,), (2,)])
+        done: list[bool] = []
+        # the first thing done with the handle holds the lock, which isn't
+        # acquired again to read the attributes
+        thread = threading.Thread(
+            target=lambda: done.append(
+                operation(bcdb.Table(table.file, lock=threading.Lock()))
+            ),
+            daemon=True,
+        )
+        thread.start()
+        thread.join(10)
+        assert done == [True]
+
+    @staticmethod
+    def test_explain(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        db = bcdb.Database(tmp_path)
+        table = db.add_table(
+            "table",
+            [
+                bcdb.Attribute("a", bcdb.AttributeType.INTEGER),
+                bcdb.Attribute("b", bcdb.AttributeType.STRING),
+            ],
+        )
+        rows = [(idx, f"row{idx}") for idx in range(100)]
+        table.add_rows(rows)
+        Q = bcdb.Q  # noqa: N806
+        plan = table.explain(Q("a") < 10)
+        # the first read fills the row cache
+        assert plan.access_path == bcdb.AccessPath.SCAN
+        plan = table.explain(Q("a") < 10)
+        assert plan.access_path == bcdb.AccessPath.CACHE
+        assert (plan.estimated_rows, plan.rows_examined) == (100, 100)
+        assert (plan.rows_returned, plan.bytes_read) == (10, 0)
+        table.create_index("a", ordered=True)
+        plan = table.explain(Q("a") < 10)
+        assert (plan.access_path, plan.attribute) == (
+            bcdb.AccessPath.INDEX,
+            "a",
+        )
+        assert plan.estimated_rows == plan.rows_examined == 11
+        assert plan.rows_returned == 10
+        monkeypatch.setattr(bcdb.row_cache, "max_bytes", 0)
+        bcdb.row_cache.clear()
+        size = table.file.stat().st_size
+        plan = table.explain(lambda row: row[1].endswith("7"))
+        assert plan.access_path == bcdb.AccessPath.SCAN
+        assert plan.estimated_rows == plan.rows_examined == 100
+        assert (plan.rows_returned, plan.bytes_read) == (10, size)
+        assert all(plan.timings[phase] > 0 for phase in bcdb._PHASES)
+        plan = table.explain(Q("a") < 10)
+        assert plan.bytes_read < size
+        assert plan.timings["split"] == 0
+        plan = table.explain(_is_even, processes=2)
+        assert plan.access_path == bcdb.AccessPath.PARALLEL_SCAN
+        assert (plan.rows_examined, plan.rows_returned) == (100, 50)
+
+    @staticmethod
+    def test_aggregate(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        db = bcdb.Database(tmp_path)
+        table = db.add_table(
+            "table",
+            [
+                bcdb.Attribute("city", bcdb.AttributeType.STRING),
+                bcdb.Attribute("age", bcdb.AttributeType.INTEGER),
+                bcdb.Attribute("score", bcdb.AttributeType.FLOAT),
+            ],
+        )
+        assert table.aggregate(
+            ("count", None), ("sum", "age"), ("avg", "age"), ("min", "city")
+        ) == (0, 0, None, None)
+        rows = [
+            ("a", 30, 1.5),
+            ("b", 20, 3.0),
+            ("a", 40, 0.5),
+            ("c", 10, 2.0),
+        ]
+        table.add_rows(rows)
+        monkeypatch.setattr(bcdb.row_cache, "max_bytes", 0)
+        bcdb.row_cache.clear()
+        assert table.aggregate(
+            ("count", None),
+            ("sum", "age"),
+            ("avg", "age"),
+            ("min", "score"),
+            (bcdb.Aggregate.MAX, "city"),
+        ) == (4, 100, 25, 0.5, "c")
+        Q = bcdb.Q  # noqa: N806
+        assert table.aggregate(("max", "age"), where=Q("city") == "a") == (40,)
+        assert table.aggregate(
+            ("count", "age"), where=lambda row: row[1] > 15
+        ) == (3,)
+        assert table.group_by("city", ("count", None), ("sum", "age")) == {
+            "a": (2, 70),
+            "b": (1, 20),
+            "c": (1, 10),
+        }
+        assert table.group_by(
+            "city", ("avg", "score"), where=Q("age") >= 20
+        ) == {"a": (1.0,), "b": (3.0,)}
+        # the row count, the ordered index and the hash index are used
+        table.create_index("age", ordered=True)
+        table.create_index("city")
+        with table._read_lock():
+            table._ensure_indexes(lock=False)
+        monkeypatch.setattr(
+            bcdb.Table, "_scan", lambda *_: pytest.fail("scanned")
+        )
+        assert table.aggregate(
+            ("count", None), ("min", "age"), ("max", "age")
+        ) == (4, 10, 40)
+        assert table.group_by("city", ("count", None)) == {
+            "a": (2,),
+            "b": (1,),
+            "c": (1,),
+        }
+        with pytest.raises(AssertionError, match="doesn't exist"):
+            table.aggregate(("median", "age"))
+        with pytest.raises(AssertionError, match="INTEGER or FLOAT"):
+            table.aggregate(("sum", "city"))
+
+    @staticmethod
+    @pytest.mark.parametrize("tombstones", [False, True])
+    def test_count(
+        tmp_path: pathlib.Path,
+        monkeypatch: pytest.MonkeyPatch,
+        tombstones: bool,
+    ) -> None:
+        db = bcdb.Database(tmp_path, tombstones=tombstones)
+        table = db.add_table(
+            "table",
+            [bcdb.Attribute("a", bcdb.AttributeType.INTEGER)],
+            table_format=bcdb.TableFormat.BINARY,
+        )
+        monkeypatch.setattr(bcdb.row_cache, "max_bytes", 0)
+        assert len(table) == 0
+        # the writes keep the count up to date, the table isn't read
+        original = bcdb._map_file
+        monkeypatch.setattr(bcdb, "_map_file", None)
+        table.add_row((0,))
+        table.add_rows([(1,), (2,), (3,), (4,)])
+        assert len(table) == table.count() == 5
+        monkeypatch.setattr(bcdb, "_map_file", original)
+        assert table.remove_rows(lambda row: row[0] < 2) == 2
+        table.remove_row(bcdb.Q("a") == 2)
+        assert table.count() == 2
+        assert table.count(dead=True) == (3 if tombstones else 0)
+        table.map(lambda row: (row[0] * 2,), write=True)
+        assert (table.count(), table.count(dead=True)) == (2, 0)
+        table.remove_row(bcdb.Q("a") == 6)
+        if tombstones:
+            table.compact()
+            assert (table.count(), table.count(dead=True)) == (1, 0)
+        # another process: the rows are counted
+        table.remove_rows(lambda row: True)
+        table.add_rows([(5,), (6,)])
+        bcdb._shared.clear()
+        table = db.get_table("table")
+        assert table.count() == 2
+        assert table.count(dead=True) == (1 if tombstones else 0)
+        assert table.get_rows() == [(5,), (6,)]
+        # another process appends rows: only they are counted
+        size = table.file.stat().st_size
+        bcdb._shared.clear()
+        bcdb.Table(table.file).add_rows([(7,), (8,)])
+        bounds = table._codec.bounds
+        firsts: list[int] = []
+
+        def spy(buffer: Any, first: int, end: int) -> Any:
+            firsts.append(first)
+            return bounds(buffer, first, end)
+
+        monkeypatch.setattr(table._codec, "bounds", spy)
+        assert table.count() == 4
+        assert firsts == [size]
+
+    @staticmethod
+    def test_map_doesnt_block_writers(tmp_path: pathlib.Path) -> None:
+        db = bcdb.Database(tmp_path)
+        table = db.add_table(
+            "table", [bcdb.Attribute("a", bcdb.AttributeType.INTEGER)]
+        )
+        table.add_rows([(1,), (2,)])
+
+        def func(row: tuple[Any, ...]) -> tuple[Any, ...]:
+            # another thread writes while the rows are mapped
+            thread = threading.Thread(
+                target=table.add_row, args=((row[0] + 10,),)
+            )
+            thread.start()
+            thread.join(5)
+            assert not thread.is_alive()
+            return (row[0] * 2,)
+
+        assert table.map(func) == [(2,), (4,)]
+        assert table.filter(lambda row: row[0] > 10) == [(11,), (12,)]
+
+    @staticmethod
+    def test_columns(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        db = bcdb.Database(tmp_path)
+        table = db.add_table(
+            "table",
+            [
+                bcdb.Attribute("a1", bcdb.AttributeType.STRING),
+                bcdb.Attribute("a2", bcdb.AttributeType.INTEGER),
+                bcdb.Attribute("a3", bcdb.AttributeType.BOOLEAN),
+            ],
+        )
+        table.add_rows([("x", 1, True), ("y", 2, False), ("x", 3, False)])
+        for _ in range(2):  # not cached, then cached
+            assert table.get_rows(columns=["a3", "a1"]) == [
+                (True, "x"),
+                (False, "y"),
+                (False, "x"),
+            ]
+            assert list(table.iter_rows(columns=["a2"])) == [(1,), (2,), (3,)]
+            assert table.get_column("a2") == [1, 2, 3]
+            assert table.get_rows_where("a1", "x", columns=["a2"]) == [
+                (1,),
+                (3,),
+            ]
+            assert table.get_row_where("a1", "y", columns=["a3"]) == (False,)
+            monkeypatch.setattr(bcdb.row_cache, "max_bytes", 0)
+            bcdb.row_cache.clear()
+        with pytest.raises(AssertionError, match=r"doesn't exist"):
+            table.get_column("a4")
+        # the third column is invalid, but it's never converted, because the
+        # table isn't cached
+        with table.file.open("a", encoding="utf-8") as file:
+            file.write("z;;4;;maybe\n")
+        assert table.get_column("a2") == [1, 2, 3, 4]
+        assert table.contains("a1", "z")
+        with pytest.raises(AssertionError, match=r"isn't boolean"):
+            table.get_column("a3")
+        with pytest.raises(AssertionError, match=r"isn't boolean"):
+            table.get_rows()
+
+    @staticmethod
+    def test_iter_map_and_iter_filter(tmp_path: pathlib.Path) -> None:
+        db = bcdb.Database(tmp_path)
+        table = db.add_table(
+            "table", [bcdb.Attribute("testattr1", bcdb.AttributeType.INTEGER)]
+        )
+        table.add_rows([(1,), (2,), (3,), (4,)])
+        assert list(
+            table.iter_map(lambda row: None if row[0] == 2 else (-row[0],))
+        ) == [(-1,), (-3,), (-4,)]
+        assert list(table.iter_filter(lambda row: row[0] % 2 == 0)) == [
+            (2,),
+            (4,),
+        ]
+        with pytest.raises(
+            AssertionError,
+            match=r"unknown return value returned by map function",
+        ):
+            list(table.iter_map(lambda row: row[0]))  # type: ignore
+
     @staticmethod
     def test_remove_row_1(tmp_path: pathlib.Path) -> None:
         db = bcdb.Database(tmp_path)
@@ -770,6 +1416,750 @@ class TestTable:
         ):
             table.add_row((True, 3.14, 6, "hewwo world~"))
 
+    @staticmethod
+    def test_write_rows_unique(tmp_path: pathlib.Path) -> None:
+        db = bcdb.Database(tmp_path)
+        table = db.add_table(
+            "table",
+            [
+                bcdb.Attribute(
+                    "testattr1",
+                    bcdb.AttributeType.INTEGER,
+                    bcdb.AttributeRequirements.UNIQUE,
+                )
+            ],
+        )
+        table.add_rows([(1,), (2,), (3,)])
+        assert table.remove_row(lambda row: row[0] == 2)
+        assert table.get_rows() == [(1,), (3,)]
+        table.add_row((2,))
+        with pytest.raises(AssertionError, match=r"appears on row 3"):
+            table.add_row((3,))
+        table.map(lambda row: (row[0] * 10,), write=True)
+        assert table.get_rows() == [(10,), (30,), (20,)]
+        table.add_row((1,))
+        with pytest.raises(AssertionError, match=r"appears on row 4"):
+            bcdb.Table(table.file).add_row((20,))
+
+    @staticmethod
+    def test_write_rows_invalid(tmp_path: pathlib.Path) -> None:
+        db = bcdb.Database(tmp_path)
+        parent = db.add_table(
+            "parent", [bcdb.Attribute("pid", bcdb.AttributeType.INTEGER)]
+        )
+        child = db.add_table(
+            "child",
+            [
+                bcdb.Attribute(
+                    "pid", bcdb.AttributeType.INTEGER, from_="parent"
+                ),
+                bcdb.Attribute(
+                    "name",
+                    bcdb.AttributeType.STRING,
+                    bcdb.AttributeRequirements.UNIQUE,
+                ),
+            ],
+        )
+        parent.add_rows([(1,), (2,)])
+        rows = [(2, "keep"), (1, "orphan-to-be"), (2, "delete-me")]
+        child.add_rows(rows)
+        parent.remove_row(lambda row: row[0] == 1)
+        # the table is untouched if a row is invalid
+        with pytest.raises(AssertionError, match=r"at index 1 .* pid"):
+            child.remove_row(lambda row: row[1] == "delete-me")
+        assert child.get_rows() == rows
+        with pytest.raises(AssertionError, match=r"invalid string"):
+            child.map(lambda row: (row[0], 1), write=True)
+        with pytest.raises(AssertionError, match=r"at index 0 of the rows"):
+            child.write_rows(
+                [(2, "a"), (2, "b"), (2, "a")], i_know_what_im_doing=True
+            )
+        assert child.get_rows() == rows
+        assert bcdb.Table(child.file).get_rows() == rows
+        child.write_rows([(2, "a"), (2, "b")], i_know_what_im_doing=True)
+        assert child.get_row_where("name", "b") == (2, "b")
+        assert child.get_rows() == [(2, "a"), (2, "b")]
+
+    @staticmethod
+    def test_persist_indexes(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        db = bcdb.Database(tmp_path, persist_indexes=True)
+        table = db.add_table(
+            "table",
+            [
+                bcdb.Attribute(
+                    "testattr1",
+                    bcdb.AttributeType.STRING,
+                    bcdb.AttributeRequirements.UNIQUE,
+                )
+            ],
+        )
+        table.add_rows([("a",), ("b",)])
+        table.save_indexes()
+        assert table.index_file.exists()
+        with monkeypatch.context() as mp:
+            mp.setattr(bcdb.Table, "_load", None)
+            with pytest.raises(AssertionError, match=r"appears on row 3"):
+                db.get_table("table").add_row(("b",))
+            # rows appended by someone else, only they are indexed
+            with table.file.open("a", encoding="utf-8") as file:
+                file.write("c\nd\n")
+            with pytest.raises(AssertionError, match=r"appears on row 5"):
+                db.get_table("table").add_row(("d",))
+        # outdated index file
+        table.file.write_text(table.file.read_text()[:-2], encoding="utf-8")
+        with pytest.raises(AssertionError, match=r"appears on row 4"):
+            db.get_table("table").add_row(("c",))
+        db.remove_table("table")
+        assert not table.index_file.exists()
+
+    @staticmethod
+    def test_create_index(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        db = bcdb.Database(tmp_path)
+        table = db.add_table(
+            "table",
+            [
+                bcdb.Attribute("a1", bcdb.AttributeType.STRING),
+                bcdb.Attribute("a2", bcdb.AttributeType.INTEGER),
+            ],
+        )
+        table.add_rows([("a", 1), ("b", 2), ("a", 3)])
+        table.create_index("a1")
+        monkeypatch.setattr(bcdb.Table, "_scan", None)
+        table.add_row(("c", 4))
+        assert table.get_rows_where("a1", "a") == [("a", 1), ("a", 3)]
+        assert table.get_row_where("a1", "c") == ("c", 4)
+        assert table.contains("a1", "b")
+        assert table.not_contains("a1", "d")
+        with pytest.raises(AssertionError, match=r"multiple rows have"):
+            table.get_row_where("a1", "a")
+        with pytest.raises(AssertionError, match=r"no rows have"):
+            table.get_rows_where("a1", "d")
+        table.remove_rows(lambda row: row[1] < 3)
+        assert table.get_rows_where("a1", "a") == [("a", 3)]
+        assert table.not_contains("a1", "b")
+        # written by someone else, and not cached
+        with table.file.open("a", encoding="utf-8") as file:
+            file.write("b;;5\n")
+        bcdb.row_cache.clear()
+        assert table.get_row_where("a1", "b") == ("b", 5)
+        table.drop_index("a1")
+        with pytest.raises(AssertionError, match=r"doesn't exist"):
+            table.drop_index("a1")
+        with pytest.raises(TypeError):
+            table.get_rows_where("a1", "b")
+
+    @staticmethod
+    def test_index_reads_release_mutex(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setattr(bcdb.row_cache, "max_bytes", 0)
+        db = bcdb.Database(tmp_path)
+        table = db.add_table(
+            "table",
+            [
+                bcdb.Attribute("a1", bcdb.AttributeType.STRING),
+                bcdb.Attribute("a2", bcdb.AttributeType.INTEGER),
+            ],
+        )
+        table.add_rows([("a", 1), ("b", 2), ("c", 3)])
+        table.create_index("a1")
+        table.create_index("a2", ordered=True)
+        mutex = table._state.mutex
+        read = table._codec.read
+        free: list[bool] = []
+
+        def other_reader() -> None:
+            if mutex.acquire(timeout=5):
+                mutex.release()
+                free.append(True)
+
+        def read_and_wait(file: Any) -> Any:
+            # the other readers can use the indexes meanwhile
+            thread = threading.Thread(target=other_reader)
+            thread.start()
+            thread.join(5)
+            return read(file)
+
+        monkeypatch.setattr(table._codec, "read", read_and_wait)
+        assert table.get_row_where("a1", "b") == ("b", 2)
+        assert table.get_rows_where("a1", "c") == [("c", 3)]
+        assert table.get_rows_between("a2", 2, None) == [("b", 2), ("c", 3)]
+        assert table.get_top_rows("a2", 1) == [("c", 3)]
+        assert table.filter(bcdb.Q("a1") == "a") == [("a", 1)]
+        assert free == [True] * 6
+
+    @staticmethod
+    def test_create_index_persist(tmp_path: pathlib.Path) -> None:
+        db = bcdb.Database(tmp_path, persist_indexes=True)
+        table = db.add_table(
+            "table",
+            [
+                bcdb.Attribute(
+                    "a1",
+                    bcdb.AttributeType.STRING,
+                    bcdb.AttributeRequirements.UNIQUE,
+                ),
+                bcdb.Attribute("a2", bcdb.AttributeType.INTEGER),
+            ],
+        )
+        table.add_rows([("a", 1), ("b", 1)])
+        table.create_index("a2")
+        table2 = db.get_table("table")
+        assert table2.get_rows_where("a2", 1) == [("a", 1), ("b", 1)]
+        assert "a2" in table2._state.indexes
+        with pytest.raises(AssertionError, match=r"UNIQUE attributes"):
+            table2.drop_index("a1")
+        table2.create_index("a2", ordered=True)
+        table3 = db.get_table("table")
+        assert table3.get_max_row("a2") == ("a", 1)
+        assert isinstance(table3._state.indexes["a2"], bcdb.SortedIndex)
+
+    @staticmethod
+    def test_create_index_ordered(tmp_path: pathlib.Path) -> None:
+        db = bcdb.Database(tmp_path)
+        attrs = [
+            bcdb.Attribute("a1", bcdb.AttributeType.STRING),
+            bcdb.Attribute("a2", bcdb.AttributeType.FLOAT),
+        ]
+        indexed = db.add_table("indexed", attrs)
+        not_indexed = db.add_table("notindexed", attrs)
+        indexed.create_index("a2", ordered=True)
+        with pytest.raises(AssertionError, match=r"must be INTEGER or FLOAT"):
+            indexed.create_index("a1", ordered=True)
+        rows = [
+            ("a", 3.5),
+            ("b", -1.0),
+            ("c", 7.25),
+            ("d", 3.5),
+            ("e", 10.0),
+            ("f", 0.0),
+        ]
+        for table in (indexed, not_indexed):
+            table.add_rows(rows)
+            table.remove_row(lambda row: row[0] == "f")
+            table.add_row(("g", -1.0))
+            assert table.get_rows_between("a2", 0.0, 5.0) == [
+                ("a", 3.5),
+                ("d", 3.5),
+            ]
+            assert table.get_rows_between("a2", None, 3.5) == [
+                ("b", -1.0),
+                ("g", -1.0),
+                ("a", 3.5),
+                ("d", 3.5),
+            ]
+            assert table.get_rows_between("a2", 11.0, None) == []
+            assert table.get_top_rows("a2", 3) == [
+                ("e", 10.0),
+                ("c", 7.25),
+                ("a", 3.5),
+            ]
+            assert table.get_top_rows("a2", 2, descending=False) == [
+                ("b", -1.0),
+                ("g", -1.0),
+            ]
+            assert table.get_min_row("a2") == ("b", -1.0)
+            assert table.get_max_row("a2") == ("e", 10.0)
+            assert table.get_rows_where("a2", 3.5) == [("a", 3.5), ("d", 3.5)]
+        assert isinstance(indexed._state.indexes["a2"], bcdb.SortedIndex)
+        indexed.write_rows([], i_know_what_im_doing=True)
+        with pytest.raises(AssertionError, match=r"no rows have a value"):
+            indexed.get_max_row("a2")
+        # INTEGERs can be too big for a float
+        big = db.add_table(
+            "big", [bcdb.Attribute("a", bcdb.AttributeType.INTEGER)]
+        )
+        big.add_rows([(10**400,), (1,)])
+        big.create_index("a", ordered=True)
+        big.add_row((-(10**400),))
+        assert big.get_top_rows("a", 2) == [(10**400,), (1,)]
+        assert big.get_min_row("a") == (-(10**400),)
+
+    @staticmethod
+    def test_tombstones(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        db = bcdb.Database(tmp_path, persist_indexes=True, tombstones=True)
+        table = db.add_table(
+            "table",
+            [
+                bcdb.Attribute(
+                    "a1",
+                    bcdb.AttributeType.STRING,
+                    bcdb.AttributeRequirements.UNIQUE,
+                ),
+                bcdb.Attribute("a2", bcdb.AttributeType.INTEGER),
+            ],
+        )
+        table.add_rows([("a", 1), ("b", 2), ("c", 1), ("d", 2)])
+        size = table.file.stat().st_size
+        assert table.remove_row(lambda row: row[1] == 2)
+        assert table.remove_rows(lambda row: row[0] in "cx") == 1
+        with pytest.raises(AssertionError, match=r"exceeded the limit"):
+            table.remove_rows(lambda row: True, limit=1)
+        assert table.file.stat().st_size == size
+        assert table.tombstone_file.exists()
+        assert table.get_rows() == [("a", 1), ("d", 2)]
+        # the removed values are free again
+        table.add_row(("b", 3))
+        with pytest.raises(AssertionError, match=r"already appears on row 3"):
+            table.add_row(("d", 4))
+        for _ in range(2):
+            reopened = db.get_table("table")
+            assert reopened.get_rows() == [("a", 1), ("d", 2), ("b", 3)]
+            assert reopened.get_rows_where("a2", 1) == [("a", 1)]
+            assert reopened.not_contains("a1", "c")
+            bcdb.row_cache.clear()
+            monkeypatch.setattr(bcdb.row_cache, "max_bytes", 0)
+        assert table.compact() > 0
+        assert table.compact() == 0
+        assert not table.tombstone_file.exists()
+        assert table.file.stat().st_size < size + len("b;;3\n")
+        assert db.get_table("table").get_rows() == [
+            ("a", 1),
+            ("d", 2),
+            ("b", 3),
+        ]
+
+    @staticmethod
+    def test_tombstones_replaced_file(tmp_path: pathlib.Path) -> None:
+        db = bcdb.Database(tmp_path, tombstones=True)
+        table = db.add_table(
+            "table", [bcdb.Attribute("a1", bcdb.AttributeType.INTEGER)]
+        )
+        table.add_rows([(1,), (2,)])
+        copy = tmp_path / "copy"
+        copy.write_bytes(table.file.read_bytes())
+        table.remove_row(lambda row: row[0] == 1)
+        assert table.get_rows() == [(2,)]
+        # the log belongs to the replaced file
+        copy.replace(table.file)
+        assert db.get_table("table").get_rows() == [(1,), (2,)]
+
+    @staticmethod
+    def test_tombstones_incremental(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setattr(bcdb.row_cache, "max_bytes", 0)
+        db = bcdb.Database(tmp_path, tombstones=True)
+        table = db.add_table(
+            "table",
+            [
+                bcdb.Attribute(
+                    "a1",
+                    bcdb.AttributeType.INTEGER,
+                    bcdb.AttributeRequirements.UNIQUE,
+                ),
+                bcdb.Attribute("a2", bcdb.AttributeType.INTEGER),
+            ],
+        )
+        table.create_index("a2", ordered=True)
+        table.add_rows([(idx, idx % 3) for idx in range(30)])
+        assert table.count() == 30
+
+        def load(*args: Any) -> Any:
+            raise AssertionError("the table is loaded")
+
+        # the rows are found with the indexes or by parsing the file, and
+        # the indexes and the counts are updated without loading the table
+        monkeypatch.setattr(bcdb.Table, "_load", load)
+        assert table.remove_rows(bcdb.Q("a2").between(1, 1)) == 10
+        assert table.remove_row(bcdb.Q("a1") == 3)
+        assert table.remove_rows(lambda row: row[0] > 20) == 6
+        assert table.count() == 13
+        assert table.count(dead=True) == 17
+        assert table.not_contains("a2", 1)
+        assert table.get_rows_where("a2", 2) == [
+            (2, 2),
+            (5, 2),
+            (8, 2),
+            (11, 2),
+            (14, 2),
+            (17, 2),
+            (20, 2),
+        ]
+        assert table.get_row_where("a1", 6) == (6, 0)
+        assert table.not_contains("a1", 3)
+        table.add_row((3, 3))
+        with pytest.raises(AssertionError, match=r"already appears on row 14"):
+            table.add_row((20, 4))
+        monkeypatch.undo()
+        assert table.get_rows() == [
+            (idx, idx % 3)
+            for idx in range(21)
+            if (idx % 3 != 1) and (idx != 3)
+        ] + [(3, 3)]
+
+    @staticmethod
+    def test_binary_format(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        db = bcdb.Database(tmp_path)
+        table = db.add_table(
+            "table",
+            [
+                bcdb.Attribute(
+                    "a1",
+                    bcdb.AttributeType.STRING,
+                    bcdb.AttributeRequirements.UNIQUE,
+                ),
+                bcdb.Attribute("a2", bcdb.AttributeType.INTEGER),
+                bcdb.Attribute("a3", bcdb.AttributeType.FLOAT),
+                bcdb.Attribute("a4", bcdb.AttributeType.BOOLEAN),
+                bcdb.Attribute("a5", bcdb.AttributeType.STRING),
+            ],
+            table_format=bcdb.TableFormat.BINARY,
+        )
+        assert table.file.read_bytes().startswith(b"BCDB/2 a1 STRING")
+        rows = [
+            ("a;;b", -(2**63), 1.5, True, "multi\nline\r"),
+            ("", 2**63 - 1, float("nan"), False, "ünicode"),
+            ("c", 0, -0.25, True, ""),
+        ]
+        table.add_rows(rows)
+        with pytest.raises(AssertionError, match=r"doesn't fit in 64 bits"):
+            table.add_row(("d", 2**63, 0.0, True, ""))
+        with pytest.raises(AssertionError, match=r"already appears on row 4"):
+            table.add_row(("c", 1, 0.0, True, ""))
+        for _ in range(2):
+            reopened = db.get_table("table")
+            assert reopened.format == bcdb.TableFormat.BINARY
+            got = reopened.get_rows()
+            assert got[0] == rows[0]
+            assert got[1][:2] == rows[1][:2]
+            assert got[1][2] != got[1][2]  # NaN
+            assert got[2] == rows[2]
+            assert list(reopened.iter_rows(columns=["a5", "a1"]))[0] == (
+                "multi\nline\r",
+                "a;;b",
+            )
+            assert reopened.get_row_where("a1", "c") == rows[2]
+            assert reopened.get_rows_where("a4", True, columns=["a2"]) == [
+                (-(2**63),),
+                (0,),
+            ]
+            assert reopened.contains("a1", "a;;b")
+            bcdb.row_cache.clear()
+            monkeypatch.setattr(bcdb.row_cache, "max_bytes", 0)
+        table.write_rows([rows[2]], i_know_what_im_doing=True)
+        assert db.get_table("table").get_rows() == [rows[2]]
+        assert db.get_table("table").format == bcdb.TableFormat.BINARY
+
+    @staticmethod
+    def test_binary_format_bad(tmp_path: pathlib.Path) -> None:
+        db = bcdb.Database(tmp_path)
+        table = db.add_table(
+            "table",
+            [bcdb.Attribute("a1", bcdb.AttributeType.STRING)],
+            table_format=bcdb.TableFormat.BINARY,
+        )
+        assert (
+            db.add_table(
+                "text", [bcdb.Attribute("a1", bcdb.AttributeType.STRING)]
+            ).format
+            == bcdb.TableFormat.TEXT
+        )
+        table.add_row(("hello",))
+        with table.file.open("ab") as file:
+            file.write(b"\x10\x00\x00\x00\x01")
+        with pytest.raises(AssertionError, match=r"truncated row 3"):
+            db.get_table("table").get_rows()
+
+    @staticmethod
+    def test_wal_group_commit(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        syncs: list[int] = []
+        fsync = os.fsync
+
+        def fake_fsync(fd: int) -> None:
+            syncs.append(fd)
+            fsync(fd)
+
+        monkeypatch.setattr(bcdb.os, "fsync", fake_fsync)
+        db = bcdb.Database(tmp_path, wal=True)
+        table = db.add_table(
+            "table",
+            [
+                bcdb.Attribute(
+                    "a",
+                    bcdb.AttributeType.INTEGER,
+                    bcdb.AttributeRequirements.UNIQUE,
+                ),
+                bcdb.Attribute("b", bcdb.AttributeType.INTEGER),
+            ],
+        )
+        errors: list[AssertionError] = []
+
+        def writer(number: int) -> None:
+            for idx in range(50):
+                try:
+                    # every value of b is added by two threads
+                    table.add_row((number * 100 + idx, number // 2))
+                    table.add_rows([(-(number // 2) * 100 - idx - 1, 0)])
+                except AssertionError as exc:
+                    errors.append(exc)
+
+        threads = [
+            threading.Thread(target=writer, args=(number,))
+            for number in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        rows = table.get_rows()
+        assert len(rows) == 600
+        assert len(errors) == 200
+        assert "already appears on row" in str(errors[0])
+        assert len({row[0] for row in rows}) == 600
+        # one sync for each group commit
+        assert 0 < len(syncs) <= 800
+        assert table.wal_file.stat().st_size > 8
+
+    @staticmethod
+    def test_wal_recover(tmp_path: pathlib.Path) -> None:
+        db = bcdb.Database(tmp_path, wal=True, fsync=bcdb.FsyncPolicy.NONE)
+        table = db.add_table(
+            "table", [bcdb.Attribute("a", bcdb.AttributeType.STRING)]
+        )
+        table.add_row(("a",))
+        size = table.file.stat().st_size
+        table.add_rows([("b",), ("c",)])
+        table.add_row(("d",))
+        # a crash before the table file was synced: the last rows are lost,
+        # one of them partially, and the last entry of the log is torn
+        with table.file.open("r+b") as file:
+            file.truncate(size + 1)
+        with table.wal_file.open("ab") as file:
+            file.write(b"\x00" * 12)
+        bcdb._shared.clear()
+        bcdb.row_cache.clear()
+        reopened = bcdb.Database(tmp_path).get_table("table")
+        assert reopened.get_rows() == [("a",), ("b",), ("c",), ("d",)]
+        assert reopened.wal_file.stat().st_size == 0
+        # the log of another (replaced) table file is ignored
+        reopened.add_row(("e",))
+        table.wal_file.write_bytes(b"\x00" * 32)
+        bcdb._shared.clear()
+        assert len(bcdb.Table(table.file).get_rows()) == 5
+
+    @staticmethod
+    def test_wal_checkpoint(tmp_path: pathlib.Path) -> None:
+        table = bcdb.Database(
+            tmp_path, wal=True, fsync=bcdb.FsyncPolicy.INTERVAL
+        ).add_table("table", [bcdb.Attribute("a", bcdb.AttributeType.FLOAT)])
+        table.add_rows([(1.0,), (2.0,)])
+        assert table.wal_file.stat().st_size > 0
+        table.checkpoint()
+        assert table.wal_file.stat().st_size == 0
+        table.add_row((3.0,))
+        # the log is checkpointed before the table file is rewritten
+        table.remove_row(lambda row: row[0] == 1.0)
+        assert table.get_rows() == [(2.0,), (3.0,)]
+        bcdb._shared.clear()
+        table = bcdb.Table(table.file, wal=True)
+        assert table.get_rows() == [(2.0,), (3.0,)]
+        # a table without the log checkpoints it before appending
+        table.add_row((4.0,))
+        bcdb.Table(table.file, lock=table.lock).add_row((5.0,))
+        assert table.wal_file.stat().st_size == 0
+        assert table.get_rows() == [(2.0,), (3.0,), (4.0,), (5.0,)]
+
+    @staticmethod
+    def test_wal_interval(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        table = bcdb.Database(
+            tmp_path,
+            wal=True,
+            fsync=bcdb.FsyncPolicy.INTERVAL,
+            fsync_interval=0.2,
+        ).add_table("table", [bcdb.Attribute("a", bcdb.AttributeType.FLOAT)])
+        fsync = os.fsync
+        syncs: list[float] = []
+
+        def timed_fsync(fd: int) -> None:
+            syncs.append(time.monotonic())
+            fsync(fd)
+
+        monkeypatch.setattr(bcdb.os, "fsync", timed_fsync)
+        table.add_row((1.0,))
+        # synced by the first commit, not by the second one
+        table.add_row((2.0,))
+        assert len(syncs) == 1
+        assert table.wal_file.stat().st_size > 0
+        # nothing else is added, the log is checkpointed when the interval
+        # ends
+        for _ in range(100):
+            if table.wal_file.stat().st_size == 0:
+                break
+            time.sleep(0.05)
+        assert table.wal_file.stat().st_size == 0
+        assert syncs[1] >= syncs[0] + 0.2
+        assert table._state.flush is None
+        assert table.get_rows() == [(1.0,), (2.0,)]
+
+
+class TestRowCache:
+    @staticmethod
+    def test_get_put(tmp_path: pathlib.Path) -> None:
+        cache = bcdb.RowCache()
+        assert cache.get(tmp_path, (1, 2, 3, 4)) is None
+        cache.put(tmp_path, (1, 2, 3, 4), ((1,), (2,)), 10)
+        assert cache.get(tmp_path, (1, 2, 3, 4)) == ((1,), (2,))
+        assert cache.size == 10
+        assert cache.get(tmp_path, (1, 2, 3, 5)) is None
+        assert cache.size == 0
+        assert len(cache) == 0
+
+    @staticmethod
+    def test_invalidate(tmp_path: pathlib.Path) -> None:
+        cache = bcdb.RowCache()
+        cache.put(tmp_path, (1,), ((1,),), 10)
+        cache.invalidate(tmp_path)
+        assert cache.get(tmp_path, (1,)) is None
+        cache.put(tmp_path, (1,), ((1,),), 10)
+        cache.clear()
+        assert cache.get(tmp_path, (1,)) is None
+        assert cache.size == 0
+
+    @staticmethod
+    def test_max_tables(tmp_path: pathlib.Path) -> None:
+        cache = bcdb.RowCache(max_tables=2)
+        cache.put(tmp_path / "a", (1,), ((1,),), 1)
+        cache.put(tmp_path / "b", (1,), ((2,),), 1)
+        cache.get(tmp_path / "a", (1,))
+        cache.put(tmp_path / "c", (1,), ((3,),), 1)
+        assert len(cache) == 2
+        assert cache.get(tmp_path / "a", (1,)) == ((1,),)
+        assert cache.get(tmp_path / "b", (1,)) is None
+        assert cache.get(tmp_path / "c", (1,)) == ((3,),)
+
+    @staticmethod
+    def test_max_bytes(tmp_path: pathlib.Path) -> None:
+        cache = bcdb.RowCache(max_bytes=100)
+        cache.put(tmp_path / "a", (1,), ((1,),), 60)
+        cache.put(tmp_path / "b", (1,), ((2,),), 60)
+        assert cache.get(tmp_path / "a", (1,)) is None
+        assert cache.get(tmp_path / "b", (1,)) == ((2,),)
+        cache.put(tmp_path / "c", (1,), ((3,),), 101)
+        assert cache.get(tmp_path / "c", (1,)) is None
+        assert cache.size == 60
+
+
+class TestRWLock:
+    @staticmethod
+    def test_readers(tmp_path: pathlib.Path) -> None:
+        db = bcdb.Database(tmp_path)
+        table = db.add_table(
+            "table", [bcdb.Attribute("a", bcdb.AttributeType.INTEGER)]
+        )
+        table.add_row((1,))
+        assert isinstance(table.lock, bcdb.RWLock)
+        rows: list[list[tuple[Any, ...]]] = []
+        with table.lock.read():
+            thread = threading.Thread(
+                target=lambda: rows.append(table.get_rows())
+            )
+            thread.start()
+            thread.join(4)
+        assert rows == [[(1,)]]
+
+    @staticmethod
+    def test_writer_preference() -> None:
+        lock = bcdb.RWLock()
+        events: list[str] = []
+        lock.acquire_read()
+
+        def write() -> None:
+            with lock:
+                events.append("write")
+
+        def read() -> None:
+            with lock.read():
+                events.append("read")
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        while not lock._waiting_writers:
+            writer.join(0.001)
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(0.05)
+        # the reader waits for the waiting writer
+        assert not events
+        lock.release_read()
+        writer.join(4)
+        reader.join(4)
+        assert events == ["write", "read"]
+
+    @staticmethod
+    def test_reentrant() -> None:
+        lock = bcdb.RWLock()
+        with lock:
+            with lock.read():
+                with lock:
+                    assert lock.acquire(blocking=False)
+                    lock.release()
+        with lock.read():
+            with lock.read():
+                with pytest.raises(RuntimeError, match=r"holding it for"):
+                    lock.acquire()
+        assert lock.acquire(timeout=0.01)
+        lock.release()
+        with pytest.raises(RuntimeError, match=r"un-acquired"):
+            lock.release()
+        with pytest.raises(RuntimeError, match=r"un-acquired"):
+            lock.release_read()
+
+    @staticmethod
+    @pytest.mark.skipif(bcdb.fcntl is None, reason="requires fcntl")
+    def test_file_lock(tmp_path: pathlib.Path) -> None:
+        import fcntl
+
+        db = bcdb.Database(tmp_path, file_lock=True)
+        table = db.add_table(
+            "t", [bcdb.Attribute("a", bcdb.AttributeType.INTEGER)]
+        )
+        assert table.lock_file.exists()
+        # another open file description behaves like another process
+        other = os.open(table.lock_file, os.O_RDWR)
+        try:
+
+            def locks(operation: int) -> bool:
+                try:
+                    fcntl.flock(other, operation | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+                fcntl.flock(other, fcntl.LOCK_UN)
+                return True
+
+            with table.lock.read():
+                assert locks(fcntl.LOCK_SH)
+                assert not locks(fcntl.LOCK_EX)
+            with table.lock:
+                assert not locks(fcntl.LOCK_SH)
+                table.add_row((1,))
+                with table.lock.read():
+                    assert not locks(fcntl.LOCK_SH)
+            assert locks(fcntl.LOCK_EX)
+            # the table waits for the other processes
+            fcntl.flock(other, fcntl.LOCK_SH)
+            assert not table.lock.acquire(blocking=False)
+            assert list(table.get_rows()) == [(1,)]
+            fcntl.flock(other, fcntl.LOCK_UN)
+            assert table.lock.acquire(blocking=False)
+            table.lock.release()
+        finally:
+            os.close(other)
+        with pytest.raises(AssertionError, match=r"requires an RWLock"):
+            bcdb.Table(table.file, lock=threading.RLock(), file_lock=True)
+
 
 class TestAttribute:
     @staticmethod
@@ -1008,6 +2398,41 @@ class TestDatabase:
         )
         assert set(db.tables) == {t1, t2, t3}
         # sets are unsorted
+        (tmp_path / "t1.index").touch()
+        assert set(db.tables) == {t1, t2, t3}
+
+    @staticmethod
+    def test_shared_lock(tmp_path: pathlib.Path) -> None:
+        db = bcdb.Database(tmp_path)
+        t1 = db.add_table(
+            "t1",
+            [
+                bcdb.Attribute(
+                    "a",
+                    bcdb.AttributeType.INTEGER,
+                    bcdb.AttributeRequirements.UNIQUE,
+                )
+            ],
+        )
+        t2 = db.add_table(
+            "t2", [bcdb.Attribute("a", bcdb.AttributeType.FLOAT)]
+        )
+        assert db.get_table("t1").lock is t1.lock
+        assert bcdb.Table(tmp_path / "." / "t1").lock is t1.lock
+        assert t2.lock is not t1.lock
+        lock = threading.Lock()
+        assert bcdb.Table(t1.file, lock=lock).lock is lock
+        t1.add_row((1,))
+        db.get_table("t1").create_index("a", ordered=True)
+        assert isinstance(t1._state.indexes["a"], bcdb.SortedIndex)
+        # the new table doesn't inherit the indexes of the removed one
+        db.remove_table("t1")
+        t1 = db.add_table(
+            "t1", [bcdb.Attribute("b", bcdb.AttributeType.STRING)]
+        )
+        t1.add_row(("x",))
+        assert t1.get_row_where("b", "x") == ("x",)
+        assert not t1._state.indexes
 
     @staticmethod
     def test_add_table(tmp_path: pathlib.Path) -> None:
@@ -1065,6 +2490,59 @@ class TestDatabase:
         with pytest.raises(AssertionError):
             db.get_table("t2")
 
+    @staticmethod
+    def test_get_table_registry(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        db = bcdb.Database(tmp_path)
+        t1 = db.add_table(
+            "t1", [bcdb.Attribute("a", bcdb.AttributeType.FLOAT)]
+        )
+        t1.add_rows([(1.0,), (2.0,)])
+        assert db.get_table("t1") is t1
+        assert db.tables == [t1]
+        # another database (or process) adds a table
+        t2 = bcdb.Database(tmp_path).add_table(
+            "t2", [bcdb.Attribute("a", bcdb.AttributeType.FLOAT)]
+        )
+        # the table files aren't read
+        monkeypatch.setattr(pathlib.Path, "read_bytes", None)
+        assert db.get_table("t2") == t2
+        monkeypatch.undo()
+        assert db.get_table("t2") is db.get_table("t2")
+        assert set(db.tables) == {t1, t2}
+        assert db.get_table("t1") is t1
+        db.remove_table("t1")
+        with pytest.raises(AssertionError, match=r"no table found"):
+            db.get_table("t1")
+        assert db.tables == [t2]
+
+    @staticmethod
+    def test_get_table_replaced(tmp_path: pathlib.Path) -> None:
+        db = bcdb.Database(tmp_path)
+        other = bcdb.Database(tmp_path)
+        db.add_table(
+            "t", [bcdb.Attribute("a", bcdb.AttributeType.INTEGER)]
+        ).add_row((1,))
+        assert db.get_table("t").get_rows() == [(1,)]
+        assert [table.name for table in db.tables] == ["t"]
+        kept = db.get_table("t")
+        # written by another database: the handle is kept
+        other.get_table("t").add_row((2,))
+        assert db.get_table("t") is kept
+        assert kept.get_rows() == [(1,), (2,)]
+        # removed and added again with other attributes: a new handle
+        other.remove_table("t")
+        other.add_table(
+            "t", [bcdb.Attribute("b", bcdb.AttributeType.STRING)]
+        ).add_row(("hi",))
+        assert db.get_table("t").get_rows() == [("hi",)]
+        other.remove_table("t")
+        other.add_table(
+            "t", [bcdb.Attribute("c", bcdb.AttributeType.FLOAT)]
+        ).add_row((1.5,))
+        assert [table.get_rows() for table in db.tables] == [[(1.5,)]]
+
     @staticmethod
     def test_remove_table(tmp_path: pathlib.Path) -> None:
         db = bcdb.Database(tmp_path)
@@ -1080,3 +2558,305 @@ class TestDatabase:
             db.remove_table("totallynot;;injection")
         with pytest.raises(AssertionError):
             db.remove_table("t1")
+
+    @staticmethod
+    def test_transaction(tmp_path: pathlib.Path) -> None:
+        db = bcdb.Database(tmp_path)
+        parents = db.add_table(
+            "parents",
+            [
+                bcdb.Attribute(
+                    "name",
+                    bcdb.AttributeType.STRING,
+                    bcdb.AttributeRequirements.UNIQUE,
+                )
+            ],
+        )
+        children = db.add_table(
+            "children",
+            [
+                bcdb.Attribute("child", bcdb.AttributeType.STRING),
+                bcdb.Attribute(
+                    "name", bcdb.AttributeType.STRING, None, "parents"
+                ),
+            ],
+        )
+        parents.add_row(("alice",))
+        with db.transaction() as transaction:
+            transaction.add_row("parents", ("bob",))
+            transaction.add_rows(
+                "children", [("carol", "alice"), ("dave", "bob")]
+            )
+            # nothing is written before the commit
+            assert parents.get_rows() == [("alice",)]
+        assert parents.get_rows() == [("alice",), ("bob",)]
+        assert children.get_rows() == [("carol", "alice"), ("dave", "bob")]
+        # all or nothing
+        with pytest.raises(AssertionError, match=r"does not exist in from"):
+            with db.transaction() as transaction:
+                transaction.add_row("parents", ("erin",))
+                transaction.add_row("children", ("frank", "grace"))
+        with pytest.raises(AssertionError, match=r"on table parents at"):
+            with db.transaction() as transaction:
+                transaction.add_row("children", ("heidi", "alice"))
+                transaction.add_rows("parents", [("ivan",), ("ivan",)])
+        with pytest.raises(AssertionError, match=r"invalid string"):
+            with db.transaction() as transaction:
+                transaction.add_row("parents", (1,))
+        with pytest.raises(ValueError, match=r"body"):
+            with db.transaction() as transaction:
+                transaction.add_row("parents", ("judy",))
+                raise ValueError("body")
+        assert len(parents.get_rows()) == 2
+        assert len(children.get_rows()) == 2
+
+    @staticmethod
+    def test_transaction_rollback(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        db = bcdb.Database(tmp_path, wal=True, persist_indexes=True)
+        t1 = db.add_table(
+            "t1",
+            [
+                bcdb.Attribute(
+                    "a",
+                    bcdb.AttributeType.INTEGER,
+                    bcdb.AttributeRequirements.UNIQUE,
+                )
+            ],
+        )
+        t2 = db.add_table(
+            "t2", [bcdb.Attribute("a", bcdb.AttributeType.INTEGER)]
+        )
+        t1.add_row((1,))
+        t1.save_indexes()
+        assert len(t1) == 1
+        append = bcdb.Table._append
+
+        def fake_append(self: bcdb.Table, rows: Any) -> None:
+            if self.name == "t2":
+                raise OSError("disk full")
+            append(self, rows)
+
+        monkeypatch.setattr(bcdb.Table, "_append", fake_append)
+        with pytest.raises(OSError, match=r"disk full"):
+            with db.transaction() as transaction:
+                transaction.add_row("t1", (2,))
+                transaction.add_row("t2", (2,))
+        monkeypatch.undo()
+        # t1 was written first, and then truncated
+        assert t1.get_rows() == [(1,)]
+        assert t1.not_contains("a", 2)
+        assert t1.wal_file.stat().st_size == 0
+        assert t2.get_rows() == []
+        # the counts and the indexes (also the saved ones) agree with the
+        # truncated file
+        assert len(t1) == t1.count() == 1
+        assert t1.filter(bcdb.Q("a") == 2) == []
+        assert t1.filter(bcdb.Q("a") == 1) == [(1,)]
+        t1.add_row((2,))
+        t1.add_row((30,))
+        assert len(t1) == 3
+        assert t1.filter(bcdb.Q("a") == 30) == [(30,)]
+        bcdb._shared.clear()
+        reopened = bcdb.Table(t1.file, persist_indexes=True)
+        assert len(reopened) == 3
+        assert reopened.get_row_where("a", 30) == (30,)
+        assert reopened.filter(bcdb.Q("a").isin([2, 30])) == [(2,), (30,)]
+
+    @staticmethod
+    def test_transaction_rollback_count(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setattr(bcdb.row_cache, "max_bytes", 0)
+        db = bcdb.Database(tmp_path)
+        t1 = db.add_table(
+            "t1", [bcdb.Attribute("a", bcdb.AttributeType.INTEGER)]
+        )
+        t2 = db.add_table(
+            "t2", [bcdb.Attribute("a", bcdb.AttributeType.STRING)]
+        )
+        t1.add_rows([(1,), (2,), (3,)])
+        assert len(t1) == 3
+        with pytest.raises(UnicodeEncodeError):
+            with db.transaction() as transaction:
+                transaction.add_row("t1", (4,))
+                transaction.add_row("t2", ("\ud800",))
+        # the rolled back row isn't counted after more rows are appended
+        # (and only they would be counted)
+        assert t2.get_rows() == []
+        for idx in range(10, 16):
+            t1.add_row((idx,))
+        assert len(t1) == len(t1.get_rows()) == 9
+
+
+class TestCompactor:
+    @staticmethod
+    def test_run_once(tmp_path: pathlib.Path) -> None:
+        db = bcdb.Database(tmp_path, tombstones=True)
+        table = db.add_table(
+            "table", [bcdb.Attribute("a1", bcdb.AttributeType.INTEGER)]
+        )
+        table.add_rows([(1,), (2,), (3,)])
+        reports: list[tuple[str, int]] = []
+        compactor = bcdb.Compactor(
+            db,
+            threshold=2,
+            callback=lambda table, reclaimed: reports.append(
+                (table.name, reclaimed)
+            ),
+        )
+        table.remove_row(lambda row: row[0] == 1)
+        assert compactor.run_once() == 0
+        table.remove_row(lambda row: row[0] == 2)
+        reclaimed = compactor.run_once()
+        assert reclaimed > 0
+        assert reports == [("table", reclaimed)]
+        assert compactor.reclaimed == reclaimed
+        assert not table.tombstone_file.exists()
+        assert table.get_rows() == [(3,)]
+
+    @staticmethod
+    def test_rows_added_while_compacting(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        db = bcdb.Database(tmp_path, tombstones=True)
+        table = db.add_table(
+            "table", [bcdb.Attribute("a1", bcdb.AttributeType.INTEGER)]
+        )
+        table.add_rows([(1,), (2,)])
+        table.remove_row(lambda row: row[0] == 1)
+        mkstemp = bcdb.tempfile.mkstemp
+
+        def add_row_and_mkstemp(*args: Any, **kwargs: Any) -> Any:
+            if table.get_rows() == [(2,)]:
+                table.add_row((3,))
+            return mkstemp(*args, **kwargs)
+
+        monkeypatch.setattr(bcdb.tempfile, "mkstemp", add_row_and_mkstemp)
+        assert table.compact() > 0
+        assert table.get_rows() == [(2,), (3,)]
+        assert list(tmp_path.iterdir()) == [table.file]
+
+    @staticmethod
+    @pytest.mark.parametrize("table_format", list(bcdb.TableFormat))
+    def test_copies_records(
+        tmp_path: pathlib.Path,
+        monkeypatch: pytest.MonkeyPatch,
+        table_format: bcdb.TableFormat,
+    ) -> None:
+        db = bcdb.Database(tmp_path, tombstones=True)
+        table = db.add_table(
+            "table",
+            [bcdb.Attribute("a1", bcdb.AttributeType.STRING)],
+            table_format=table_format,
+        )
+        rows = [(f"row{idx}",) for idx in range(10)]
+        table.add_rows(rows)
+        table.remove_rows(lambda row: row[0] in ("row0", "row4", "row5"))
+        table.remove_row(lambda row: row[0] == "row9")
+        # the reader gets the cached rows
+        assert len(table.get_rows()) == 6
+        header_end = bcdb._header_end
+        readers: list[bool] = []
+
+        def _header_end(buffer: Any) -> int:
+            # the records are copied without converting them, and the table
+            # can be read meanwhile
+            monkeypatch.setattr(table._codec, "decode", None)
+            reader = threading.Thread(
+                target=lambda: readers.append(bool(table.get_rows()))
+            )
+            reader.start()
+            reader.join(5)
+            return header_end(buffer)
+
+        monkeypatch.setattr(bcdb, "_header_end", _header_end)
+        assert table.compact() > 0
+        monkeypatch.undo()
+        assert readers == [True]
+        assert table.get_rows() == [
+            row
+            for row in rows
+            if row[0] not in ("row0", "row4", "row5", "row9")
+        ]
+        assert table.count(dead=True) == 0
+
+    @staticmethod
+    def test_background(tmp_path: pathlib.Path) -> None:
+        db = bcdb.Database(tmp_path, tombstones=True)
+        table = db.add_table(
+            "table", [bcdb.Attribute("a1", bcdb.AttributeType.INTEGER)]
+        )
+        table.add_rows([(1,), (2,)])
+        compacted = threading.Event()
+        compactor = bcdb.Compactor(
+            [table], interval=0.01, callback=lambda *_: compacted.set()
+        )
+        compactor.start()
+        with pytest.raises(AssertionError, match=r"already running"):
+            compactor.start()
+        table.remove_row(lambda row: row[0] == 2)
+        assert compacted.wait(4)
+        compactor.stop()
+        assert compactor.error is None
+        assert table.get_rows() == [(1,)]
+
+
+class TestAsyncDatabase:
+    @staticmethod
+    def test_table(
+        tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setattr(bcdb, "_SCAN_BATCH_SIZE", 3)
+
+        async def main() -> None:
+            async with bcdb.AsyncDatabase(tmp_path, max_workers=2) as db:
+                table = await db.add_table(
+                    "table",
+                    [
+                        bcdb.Attribute(
+                            "a",
+                            bcdb.AttributeType.INTEGER,
+                            bcdb.AttributeRequirements.UNIQUE,
+                        )
+                    ],
+                )
+                await asyncio.gather(
+                    *(table.add_row((idx,)) for idx in range(10))
+                )
+                await table.add_rows([(10,), (11,)])
+                with pytest.raises(AssertionError, match=r"unique"):
+                    await table.add_row((1,))
+                assert sorted(await table.get_rows()) == [
+                    (idx,) for idx in range(12)
+                ]
+                table = await db.get_table("table")
+                assert sorted([row async for row in table.iter_rows()]) == [
+                    (idx,) for idx in range(12)
+                ]
+                assert await table.get_rows_where("a", 3) == [(3,)]
+                assert sorted(await table.filter(lambda row: row[0] < 2)) == [
+                    (0,),
+                    (1,),
+                ]
+                assert sorted(
+                    [
+                        row
+                        async for row in table.iter_filter(
+                            lambda row: row[0] < 2
+                        )
+                    ]
+                ) == [(0,), (1,)]
+                assert len(await table.map(lambda row: (row[0] + 1,))) == 12
+                assert await table.remove_rows(lambda row: row[0] >= 2) == 10
+                assert sorted(
+                    [row async for row in table.iter_map(lambda row: row)]
+                ) == [(0,), (1,)]
+                # the iteration can be stopped early
+                async for _ in table.iter_rows():
+                    break
+                await db.remove_table("table")
+                assert not db.database.tables
+
+        asyncio.run(main())